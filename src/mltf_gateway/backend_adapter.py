@@ -1,13 +1,17 @@
+import copy
 import json
 import logging
 import os
+import threading
 import time
+from collections import OrderedDict
 from urllib.parse import urljoin
 
 import requests as requests_base
+from dotenv import load_dotenv
 from requests import HTTPError
 
-from mltf_gateway.flaskapp.app import create_app
+from mltf_gateway import tracing
 
 INPROCESS_GATEWAY_APP = None
 
@@ -16,6 +20,14 @@ class Response:
     def __init__(self, wrapped):
         self.wrapped = wrapped
         self.status_code = self.wrapped.status_code
+        self.headers = self.wrapped.headers
+
+    @property
+    def text(self):
+        return self.wrapped.get_data(as_text=True)
+
+    def iter_content(self, chunk_size=None):
+        return self.wrapped.iter_encoded()
 
     def raise_for_status(self):
         status = self.wrapped.status_code
@@ -42,12 +54,26 @@ class RequestAdaptor:
     def make_inprocess_gateway(self):
         global INPROCESS_GATEWAY_APP
         if not INPROCESS_GATEWAY_APP:
+            # Only LOCAL gateways need the whole server side
+            from mltf_gateway.flaskapp.app import create_app
+
             INPROCESS_GATEWAY_APP = create_app()
         self.app = INPROCESS_GATEWAY_APP
         self.app_client = self.app.test_client()
 
     def make_request(self, verb, path, *args, **kwargs):
         if self.is_local():
+            # Translate the requests-style arguments the flask test client
+            # doesn't understand
+            kwargs.pop("timeout", None)
+            kwargs.pop("stream", None)
+            if "params" in kwargs:
+                kwargs["query_string"] = kwargs.pop("params")
+            if "files" in kwargs:
+                data = dict(kwargs.get("data") or {})
+                for name, f in kwargs.pop("files").items():
+                    data[name] = (f, os.path.basename(getattr(f, "name", name)))
+                kwargs["data"] = data
             try:
                 return Response(getattr(self.app_client, verb)(path, *args, **kwargs))
             except Exception as e:
@@ -69,12 +95,6 @@ class RequestAdaptor:
 
 _logger = logging.getLogger(__name__)
 
-import mltf_gateway.submitted_runs.client_run
-
-ClientSideSubmittedRun = (
-    mltf_gateway.submitted_runs.client_run.ClientSideSubmittedRun
-)
-
 # Import OAuth2 client for authentication
 from mltf_gateway.oauth_client import (
     add_auth_header_to_request,
@@ -82,6 +102,30 @@ from mltf_gateway.oauth_client import (
 )
 
 
+class CachedResponse:
+    """
+    A response the gateway said is unchanged (304) since we cached it
+    """
+
+    status_code = 200
+
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        return
+
+    def json(self):
+        return copy.deepcopy(self.body)
+
+
+# GET responses kept for revalidating with If-None-Match. Shared by every
+# RESTAdapter in the process, since adapter_factory() makes one per call
+RESPONSE_CACHE_SIZE = 64
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
 class RESTAdapter:
     """
     Enables a client process to call backend functions via REST
@@ -90,11 +134,42 @@ class RESTAdapter:
     def __init__(self, *, gateway_uri=None):
         super().__init__()
         self.gateway_uri = gateway_uri
-        self.token = os.environ.get("MLTF_GATEWAY_TOKEN")
+        self.static_token = os.environ.get("MLTF_GATEWAY_TOKEN")
+        self.token = self.static_token
         if not self.token:
             self.token = get_access_token()["access_token"]
         self.client = RequestAdaptor(self.gateway_uri)
 
+    def conditional_get(self, url, headers, params=None):
+        """
+        GET url, revalidating the response cached from the last GET of the
+        same url with If-None-Match. A 304 is turned into the cached response
+        """
+        key = (
+            self.gateway_uri,
+            url,
+            tuple(sorted((params or {}).items())),
+            headers.get("Authorization"),
+        )
+        with _response_cache_lock:
+            cached = _response_cache.get(key)
+        if cached is not None:
+            headers = dict(headers, **{"If-None-Match": cached[0]})
+        response = self.client.get(url, headers=headers, params=params)
+        if response.status_code == 304 and cached is not None:
+            with _response_cache_lock:
+                if key in _response_cache:
+                    _response_cache.move_to_end(key)
+            return CachedResponse(cached[1])
+        etag = response.headers.get("ETag")
+        if response.status_code == 200 and etag:
+            with _response_cache_lock:
+                _response_cache[key] = (etag, response.json())
+                _response_cache.move_to_end(key)
+                while len(_response_cache) > RESPONSE_CACHE_SIZE:
+                    _response_cache.popitem(last=False)
+        return response
+
     def get_api_config(self):
         response = self.client.get("api/config")
         response.raise_for_status()
@@ -112,7 +187,6 @@ class RESTAdapter:
         experiment_id,
     ):
         job_url = "api/job"
-        files = {"tarball": open(project_tarball, "rb")}
 
         data = {
             "run_id": run_id,
@@ -123,17 +197,34 @@ class RESTAdapter:
             "experiment_id": experiment_id,
         }
         headers = {}
-        if self.token:
-            headers["Authorization"] = f"Bearer {self.token}"
-
-        response = self.client.post(
-            job_url, files=files, data=data, headers=headers, timeout=30
-        )
+        if self.static_token:
+            headers["Authorization"] = f"Bearer {self.static_token}"
+        else:
+            # Not self.token, which may have expired since this adapter was
+            # made (e.g. during a long sweep)
+            headers = add_auth_header_to_request(headers)
+
+        size = os.path.getsize(project_tarball)
+        with tracing.span("upload", kind=tracing.KIND_CLIENT, bytes=size) as span:
+            # Lets the gateway's spans for this submission join our trace
+            tracing.inject(headers)
+            with open(project_tarball, "rb") as tarball:
+                response = self.client.post(
+                    job_url,
+                    files={"tarball": tarball},
+                    data=data,
+                    headers=headers,
+                    timeout=30,
+                )
+            span.set_attribute("status", response.status_code)
         response.raise_for_status()
         run_reference = response.json()
         import pprint
 
         pprint.pprint(run_reference)
+        # Subclasses mlflow's SubmittedRun, so importing it imports mlflow
+        from mltf_gateway.submitted_runs.client_run import ClientSideSubmittedRun
+
         ret = ClientSideSubmittedRun(
             self, run_id, run_reference["gateway_id"], time.time()
         )
@@ -148,7 +239,7 @@ class RESTAdapter:
         headers = add_auth_header_to_request(headers)
 
         # Make the GET request to check status
-        response = self.client.get(url, headers=headers)
+        response = self.conditional_get(url, headers)
 
         if response.status_code != 200:
             raise RuntimeError(f"Failed to get run status: {response.text}")
@@ -187,23 +278,49 @@ class RESTAdapter:
 
         return response.json()
 
-    def show_details(self, run_id, show_logs):
+    def show_details(self, run_id, show_logs, log_offset=None):
         # Prepare the request URL
         url = f"api/jobs/{run_id}"
         params = {"show_logs": show_logs}
+        if log_offset is not None:
+            params["offset"] = log_offset
 
         # Prepare headers with authentication
         headers = {}
         headers = add_auth_header_to_request(headers)
 
         # Make the GET request to check status
-        response = self.client.get(url, headers=headers, params=params)
+        response = self.conditional_get(url, headers, params=params)
 
         if response.status_code != 200:
             raise RuntimeError(f"Failed to get run status: {response.text}")
 
         return response.json()
 
+    def stream_logs(self, run_id, follow=False, offset=0):
+        """
+        Yield the run's output as bytes, as the gateway sends it
+        :param follow: Keep going until the run terminates
+        :param offset: Byte offset to start at
+        """
+        url = f"api/jobs/{run_id}/logs"
+        params = {"offset": offset}
+        if follow:
+            params["follow"] = "true"
+
+        headers = {}
+        headers = add_auth_header_to_request(headers)
+        # A followed job may be quiet for a long time, only time out connecting
+        timeout = (30, None) if follow else 30
+        response = self.client.get(
+            url, headers=headers, params=params, stream=True, timeout=timeout
+        )
+
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to get run logs: {response.text}")
+
+        yield from response.iter_content(chunk_size=None)
+
     def delete(self, run_id):
         url = f"api/jobs/{run_id}"
 
@@ -234,3 +351,14 @@ class RESTAdapter:
 
     def get_tracking_server(self):
         return self.gateway_uri
+
+
+def adapter_factory() -> RESTAdapter:
+    """
+    Different "adapters" let the client connect to either a local or remote gateway.
+    Abstract it out so there's one place for the configuration stuff to hook
+    :return: Instance of AbstractBackend the client should use
+    """
+    load_dotenv()
+    gateway_uri = os.environ.get("MLTF_GATEWAY_URI", "https://gw.mltf.vu")
+    return RESTAdapter(gateway_uri=gateway_uri)
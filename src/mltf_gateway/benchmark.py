@@ -0,0 +1,396 @@
+"""
+Load-test/benchmark harness for the gateway REST API.
+
+By default the Flask app is driven in-process through RequestAdaptor's "LOCAL"
+mode, with the SSAM executor pointed at a local fake SSAM (see fake_ssam.py).
+Each run-count level starts from a fresh gateway which is pre-populated with
+that many stored runs, then submit, list, show, show with logs, and delete are
+each measured at every concurrency level.
+
+  python -m mltf_gateway.benchmark --stored-runs 1000 10000 100000 \\
+      --concurrency 1 8 32 --output bench.json
+
+Passing --gateway-uri https://... drives a running gateway over HTTP instead
+(with --token or MLTF_GATEWAY_TOKEN); stored runs are then whatever the gateway
+already has. Results are written as JSON so they can be compared across commits.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import jwt
+
+import mltf_gateway.backend_adapter as backend_adapter
+import mltf_gateway.gateway_server as gateway_server
+from mltf_gateway.__about__ import __version__
+from mltf_gateway.data_classes import GatewayRunDescription
+from mltf_gateway.executors.base import get_script
+from mltf_gateway.fake_ssam import FakeSSAMConfig, FakeSSAMServer, make_fake_token
+from mltf_gateway.submitted_runs.server_run import ServerSideSubmittedRunDescription
+from mltf_gateway.submitted_runs.ssam_run import SSAMSubmittedRun
+
+BENCH_USER = "mltf-bench-user"
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return None
+    rank = max(
+        0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1)
+    )
+    return sorted_values[rank]
+
+
+def summarize(op, stored_runs, concurrency, latencies, errors, wall_time):
+    latencies = sorted(latencies)
+    to_ms = lambda x: None if x is None else round(x * 1000, 3)
+    return {
+        "op": op,
+        "stored_runs": stored_runs,
+        "concurrency": concurrency,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall_time, 2) if wall_time else None,
+        "latency_ms": {
+            "p50": to_ms(percentile(latencies, 50)),
+            "p95": to_ms(percentile(latencies, 95)),
+            "p99": to_ms(percentile(latencies, 99)),
+            "mean": to_ms(statistics.fmean(latencies)) if latencies else None,
+            "max": to_ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+class GatewayBenchmark:
+    """
+    Issues REST calls against one gateway and times them
+    """
+
+    def __init__(self, gateway_uri, token, tarball):
+        self.gateway_uri = gateway_uri
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.tarball = tarball
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        # The flask test client isn't safe to share between threads
+        if not hasattr(self._local, "client"):
+            self._local.client = backend_adapter.RequestAdaptor(self.gateway_uri)
+        return self._local.client
+
+    def submit(self, _):
+        with open(self.tarball, "rb") as f:
+            data = {
+                "run_id": "",
+                "entry_point": "main",
+                "params": "{}",
+                "backend_config": "{}",
+                "tracking_uri": "https://mlflow.invalid",
+                "experiment_id": "0",
+                "tarball": (f, "project.tar"),
+            }
+            if self.client.is_local():
+                response = self.client.post("api/job", data=data, headers=self.headers)
+            else:
+                files = {"tarball": data.pop("tarball")}
+                response = self.client.post(
+                    "api/job", data=data, files=files, headers=self.headers, timeout=60
+                )
+        response.raise_for_status()
+        return response.json()["gateway_id"]
+
+    def list(self, _):
+        self.client.get("api/jobs", headers=self.headers, timeout=60).raise_for_status()
+
+    def show(self, gateway_id):
+        self.client.get(
+            f"api/jobs/{gateway_id}", headers=self.headers, timeout=60
+        ).raise_for_status()
+
+    def show_logs(self, gateway_id):
+        self.client.get(
+            f"api/jobs/{gateway_id}",
+            params={"show_logs": "true"},
+            headers=self.headers,
+            timeout=60,
+        ).raise_for_status()
+
+    def delete(self, gateway_id):
+        self.client.delete(
+            f"api/jobs/{gateway_id}", headers=self.headers, timeout=60
+        ).raise_for_status()
+
+    def measure(self, op, args, concurrency):
+        """
+        Call operation `op` once per entry of args from `concurrency` threads
+        :return: (list of latencies of successful calls, error count, wall time, results)
+        """
+        func = getattr(self, op)
+        latencies = []
+        results = []
+        errors = 0
+        lock = threading.Lock()
+
+        def one(arg):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                ret = func(arg)
+            except Exception:
+                with lock:
+                    errors += 1
+                return
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                results.append(ret)
+
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, args))
+        return latencies, errors, time.perf_counter() - wall_start, results
+
+
+def seed_runs(gateway, fake_ssam, count, users, auth_token):
+    """
+    Pre-populate the gateway with `count` stored runs spread over `users` users,
+    backed by jobs in the fake SSAM. One of the users is the benchmark user
+    :return: gateway IDs belonging to the benchmark user
+    """
+    owned = []
+    seeded = []
+    for idx in range(count):
+        user = BENCH_USER if idx % users == 0 else f"seed-user-{idx % users}"
+        job_id = fake_ssam.state.add_job()
+        desc = GatewayRunDescription(f"seed-{idx}", "", "main", {}, {}, "", "0", user)
+        submitted = SSAMSubmittedRun(
+            desc.run_id, [job_id], fake_ssam.url, auth_token, user
+        )
+        gateway_id = f"seed-{idx:08d}"
+        seeded.append(ServerSideSubmittedRunDescription(desc, submitted, gateway_id))
+        if user == BENCH_USER:
+            owned.append(gateway_id)
+    gateway.update_runs(lambda runs: runs + seeded)
+    return owned
+
+
+@contextlib.contextmanager
+def _unverified_tokens():
+    """
+    The in-process gateway has no keycloak to verify tokens against, so skip
+    signature verification for the duration of the benchmark
+    """
+    import mltf_gateway.flaskapp.utils as flask_utils
+
+    original = flask_utils.decode
+    flask_utils.decode = lambda token: jwt.decode(
+        token, options={"verify_signature": False}
+    )
+    try:
+        yield
+    finally:
+        flask_utils.decode = original
+
+
+def run_level(bench, stored_runs, concurrency_levels, requests_per_op, targets, rng):
+    results = []
+    for concurrency in concurrency_levels:
+        latencies, errors, wall, submitted = bench.measure(
+            "submit", range(requests_per_op), concurrency
+        )
+        results.append(
+            summarize("submit", stored_runs, concurrency, latencies, errors, wall)
+        )
+        show_targets = targets or submitted
+        for op in ("list", "show", "show_logs"):
+            args = (
+                [rng.choice(show_targets) for _ in range(requests_per_op)]
+                if show_targets
+                else []
+            )
+            latencies, errors, wall, _ = bench.measure(op, args, concurrency)
+            results.append(
+                summarize(op, stored_runs, concurrency, latencies, errors, wall)
+            )
+        # Only delete what was just submitted, so the stored run count holds steady
+        latencies, errors, wall, _ = bench.measure("delete", submitted, concurrency)
+        results.append(
+            summarize("delete", stored_runs, concurrency, latencies, errors, wall)
+        )
+    return results
+
+
+def run_local(args, tarball):
+    ssam_config = FakeSSAMConfig(
+        latency=args.ssam_latency,
+        pending_time=0,
+        job_duration=args.job_duration,
+        seed=args.seed,
+    )
+    token = jwt.encode(
+        {
+            "name": BENCH_USER,
+            "email": f"{BENCH_USER}@example.com",
+            "exp": int(time.time()) + 86400,
+        },
+        "mltf-bench-signing-key-not-for-real-use",
+        algorithm="HS256",
+    )
+    with FakeSSAMServer(
+        ssam_config
+    ) as fake_ssam, _unverified_tokens(), tempfile.TemporaryDirectory() as tmp:
+        ssam_token = make_fake_token(lifetime=86400)
+        environ = {
+            "MLTF_EXECUTOR": "ssam",
+            "SSAM_URL": fake_ssam.url,
+            "AUTH_TOKEN": ssam_token,
+            "SLURM_TOKEN": ssam_token,
+            "DATABASE_URL": "sqlite:///:memory:",
+        }
+        # Leave the process as we found it, so this can be called from tests
+        with mock.patch.dict(os.environ, environ), mock.patch.object(
+            gateway_server, "RUN_DATABASE", None
+        ), mock.patch.object(backend_adapter, "INPROCESS_GATEWAY_APP", None):
+            results = run_levels_local(args, fake_ssam, token, ssam_token, tmp, tarball)
+    return results
+
+
+def run_levels_local(args, fake_ssam, token, ssam_token, tmp, tarball):
+    rng = random.Random(args.seed)
+    results = []
+    for stored_runs in args.stored_runs:
+        gateway_server.RUN_DATABASE = os.path.join(tmp, f"runs-{stored_runs}.pkl")
+        backend_adapter.INPROCESS_GATEWAY_APP = None
+        bench = GatewayBenchmark("LOCAL", token, tarball)
+        # Seed after startup has loaded the (empty) run database
+        bench.client.app.extensions["mltf_startup"].wait()
+        gateway = bench.client.app.extensions["mltf_gateway"]
+        targets = seed_runs(gateway, fake_ssam, stored_runs, args.users, ssam_token)
+        print(
+            f"Seeded {stored_runs} runs ({len(targets)} owned by benchmark user)",
+            file=sys.stderr,
+        )
+        results.extend(
+            run_level(bench, stored_runs, args.concurrency, args.requests, targets, rng)
+        )
+    return results
+
+
+def run_remote(args, tarball):
+    token = args.token or os.environ.get("MLTF_GATEWAY_TOKEN")
+    if not token:
+        raise SystemExit(
+            "Benchmarking a remote gateway needs --token or MLTF_GATEWAY_TOKEN"
+        )
+    bench = GatewayBenchmark(args.gateway_uri, token, tarball)
+    return run_level(
+        bench, None, args.concurrency, args.requests, [], random.Random(args.seed)
+    )
+
+
+def format_table(results):
+    lines = [
+        f"{'op':<10} {'stored':>8} {'conc':>5} {'reqs':>6} {'errs':>5} "
+        f"{'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    ]
+    for r in results:
+        lat = r["latency_ms"]
+        lines.append(
+            f"{r['op']:<10} {str(r['stored_runs']):>8} {r['concurrency']:>5} {r['requests']:>6} "
+            f"{r['errors']:>5} {str(r['throughput_rps']):>9} {str(lat['p50']):>9} "
+            f"{str(lat['p95']):>9} {str(lat['p99']):>9}"
+        )
+    return "\n".join(lines)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the MLTF gateway REST API")
+    parser.add_argument(
+        "--gateway-uri", default="LOCAL", help="LOCAL (in-process) or a gateway URL"
+    )
+    parser.add_argument(
+        "--token", help="Bearer token when benchmarking a remote gateway"
+    )
+    parser.add_argument(
+        "--stored-runs", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--requests", type=int, default=200, help="Requests per operation and level"
+    )
+    parser.add_argument(
+        "--users", type=int, default=100, help="Users the seeded runs are spread over"
+    )
+    parser.add_argument(
+        "--ssam-latency",
+        type=float,
+        default=0.0,
+        help="Seconds added to fake SSAM calls",
+    )
+    parser.add_argument(
+        "--job-duration", type=float, default=0.0, help="Fake SSAM job run time"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument(
+        "--verbose", action="store_true", help="Don't silence gateway output"
+    )
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    tarball = get_script("mltf-hello-world.tar.gz")
+    run = run_local if args.gateway_uri == "LOCAL" else run_remote
+    started = time.time()
+    # The gateway prints liberally on the submit path, keep it out of the report
+    quiet = (
+        contextlib.nullcontext()
+        if args.verbose
+        else contextlib.redirect_stdout(io.StringIO())
+    )
+    if not args.verbose:
+        # Per-request access logs from the fake SSAM
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    with quiet:
+        results = run(args, tarball)
+
+    report = {
+        "meta": {
+            "mltf_gateway_version": __version__,
+            "gateway_uri": args.gateway_uri,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started": started,
+            "duration_s": round(time.time() - started, 3),
+            "requests_per_op": args.requests,
+            "ssam_latency_s": args.ssam_latency,
+        },
+        "results": results,
+    }
+    print(format_table(results))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Credential agent for the mltf CLI, along the lines of ssh-agent.
+
+`mltf agent` unlocks the keyring once, keeps the credentials in memory and
+refreshes the access token ahead of its expiry. It serves them over a unix
+socket that only the owning user can connect to, so CLI invocations skip
+the keyring decrypt and, usually, the token refresh.
+
+Protocol: the client sends one JSON object per line, e.g. {"op": "get"}, and
+gets one JSON object back.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+
+AGENT_SOCK_ENV = "MLTF_AGENT_SOCK"
+# Set to 0 to never talk to an agent
+AGENT_ENABLE_ENV = "MLTF_AGENT"
+
+log = logging.getLogger(__name__)
+
+# Set on the agent's own threads, where asking "the agent" for credentials
+# would mean talking to ourselves
+_agent_thread = threading.local()
+
+
+@contextlib.contextmanager
+def _acting_as_agent():
+    _agent_thread.active = True
+    try:
+        yield
+    finally:
+        _agent_thread.active = False
+
+
+def _in_agent():
+    return getattr(_agent_thread, "active", False)
+
+
+def get_agent_socket_path():
+    if os.environ.get(AGENT_SOCK_ENV):
+        return os.environ[AGENT_SOCK_ENV]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "mltf", "agent.sock")
+    return os.path.join("/tmp", f"mltf-{os.getuid()}", "agent.sock")
+
+
+def _peer_uid(conn):
+    """
+    :return: The uid of the process on the other end of a unix socket, or
+             None if the platform can't tell us
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = conn.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid
+
+
+def _ensure_private_dir(path):
+    """
+    Create the socket's directory readable by its owner only, and refuse to
+    use one that somebody else could have planted
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+        raise RuntimeError(f"{path} is not a directory owned by the current user")
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+
+def query_agent(request, socket_path=None, timeout=2.0):
+    """
+    Send one request to the agent
+    :return: The agent's response, or None if no agent is reachable
+    """
+    if os.environ.get(AGENT_ENABLE_ENV, "1") == "0":
+        return None
+    socket_path = socket_path or get_agent_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+        return json.loads(line) if line else None
+    except (OSError, ValueError) as e:
+        log.debug(f"Couldn't reach credential agent at {socket_path}: {e}")
+        return None
+
+
+def get_agent_credentials(socket_path=None):
+    """
+    :return: Credentials held by a running agent, or None
+    """
+    if _in_agent():
+        return None
+    response = query_agent({"op": "get"}, socket_path)
+    if response and response.get("ok"):
+        return response.get("credentials")
+    return None
+
+
+def notify_agent(op, socket_path=None):
+    """
+    Tell a running agent the stored credentials changed (op "reload") or were
+    removed (op "clear")
+    """
+    if _in_agent():
+        return None
+    return query_agent({"op": op}, socket_path)
+
+
+class _AgentRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        peer = _peer_uid(self.connection)
+        if peer is not None and peer != os.getuid():
+            log.warning(f"Rejected credential agent connection from uid {peer}")
+            return
+        try:
+            request = json.loads(self.rfile.readline())
+            response = self.server.agent.handle_request(request)
+        except ValueError as e:
+            response = {"ok": False, "error": f"Malformed request: {e}"}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class _AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class CredentialAgent:
+    """
+    Holds decrypted credentials in memory and serves them on a unix socket
+    """
+
+    def __init__(self, socket_path=None, refresh_ahead=300, check_interval=30):
+        """
+        :param socket_path: Where to listen, see get_agent_socket_path()
+        :param refresh_ahead: Refresh the access token once it has less than
+                              this many seconds left
+        :param check_interval: How often to check for an upcoming expiry
+        """
+        self.socket_path = socket_path or get_agent_socket_path()
+        self.refresh_ahead = refresh_ahead
+        self.check_interval = check_interval
+        self.credentials = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server = None
+        self._refresh_thread = None
+
+    def load(self):
+        """
+        Read the credentials from the keyring
+        :return: True if there were credentials to load
+        """
+        from mltf_gateway.oauth_client import (
+            get_stored_credentials,
+            invalidate_credential_cache,
+        )
+
+        invalidate_credential_cache()
+        with _acting_as_agent():
+            creds = get_stored_credentials()
+        with self._lock:
+            self.credentials = creds
+        return creds is not None
+
+    def refresh_if_needed(self):
+        """
+        Refresh the access token if it expires within refresh_ahead seconds
+        """
+        from mltf_gateway.oauth_client import (
+            refresh_access_token,
+            store_credentials,
+        )
+
+        with self._lock:
+            creds = self.credentials
+        if not creds or not creds.get("refresh_token"):
+            return False
+        expires_at = int(creds.get("expires_at") or 0)
+        if expires_at - time.time() > self.refresh_ahead:
+            return False
+        response = refresh_access_token(creds["refresh_token"])
+        if not response or not response.get("access_token"):
+            return False
+        refreshed = {
+            "access_token": response["access_token"],
+            "refresh_token": response.get("refresh_token", creds["refresh_token"]),
+            "expires_at": int(time.time()) + response.get("expires_in", 3600),
+        }
+        with _acting_as_agent():
+            store_credentials(
+                refreshed["access_token"],
+                refreshed["refresh_token"],
+                refreshed["expires_at"],
+            )
+        with self._lock:
+            self.credentials = refreshed
+        return True
+
+    def handle_request(self, request):
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        if op == "get":
+            with self._lock:
+                creds = self.credentials
+            if not creds:
+                return {"ok": False, "error": "No credentials loaded"}
+            if int(creds.get("expires_at") or 0) <= time.time():
+                self.refresh_if_needed()
+                with self._lock:
+                    creds = self.credentials
+                if not creds or int(creds.get("expires_at") or 0) <= time.time():
+                    return {"ok": False, "error": "Credentials expired"}
+            return {"ok": True, "credentials": creds}
+        if op == "reload":
+            self.load()
+            return {"ok": True}
+        if op == "clear":
+            with self._lock:
+                self.credentials = None
+            return {"ok": True}
+        if op == "stop":
+            threading.Thread(target=self.stop, daemon=True).start()
+            return {"ok": True}
+        return {"ok": False, "error": f"Unknown op {op}"}
+
+    def bind(self):
+        """
+        Create the listening socket, readable only by the current user
+        """
+        _ensure_private_dir(os.path.dirname(self.socket_path))
+        if os.path.exists(self.socket_path):
+            if query_agent({"op": "ping"}, self.socket_path):
+                raise RuntimeError(f"An agent is already running on {self.socket_path}")
+            os.unlink(self.socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            self._server = _AgentServer(self.socket_path, _AgentRequestHandler)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.socket_path, 0o600)
+        self._server.agent = self
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.refresh_if_needed()
+            except Exception as e:
+                log.warning(f"Credential agent failed to refresh the token: {e}")
+
+    def serve_forever(self):
+        if self._server is None:
+            self.bind()
+        self._refresh_thread = threading.Thread(
+            target=self._refresh_loop, name="mltf-agent-refresh", daemon=True
+        )
+        self._refresh_thread.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._stop.set()
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def run_agent(socket_path=None, foreground=False, refresh_ahead=300):
+    """
+    Entry point for `mltf agent`. Unlocks the keyring in the foreground, so
+    the user can be prompted for the password, then detaches unless asked not to
+    """
+    agent = CredentialAgent(socket_path, refresh_ahead=refresh_ahead)
+    if not agent.load():
+        print("No stored credentials found. Please run 'mltf login' first.")
+        sys.exit(1)
+    agent.bind()
+    print(f"{AGENT_SOCK_ENV}={agent.socket_path}; export {AGENT_SOCK_ENV};")
+    if not foreground:
+        sys.stdout.flush()
+        if os.fork() > 0:
+            # The child owns the socket now
+            os._exit(0)
+        os.setsid()
+        if os.fork() > 0:
+            os._exit(0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+    agent.serve_forever()
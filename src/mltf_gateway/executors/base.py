@@ -30,6 +30,12 @@ def jinja_loader(script_name):
 jinja_env = Environment(loader=FunctionLoader(jinja_loader))
 
 
+class InvalidBackendConfig(ValueError):
+    """
+    A run's backend_config asks for something the executor can't accept
+    """
+
+
 class ExecutorBase:
     """
     Base class for executors
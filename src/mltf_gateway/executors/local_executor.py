@@ -1,23 +1,58 @@
+import os
+import shutil
 import subprocess
+import tempfile
 
 from mltf_gateway.submitted_runs.local_run import LocalSubmittedRun
-from .base import ExecutorBase
-import os
-import copy
+from .base import ExecutorBase, InvalidBackendConfig
+from .local_scheduler import LocalScheduler
+
 
 class LocalExecutor(ExecutorBase):
     """
     Executor that runs jobs locally
     """
 
+    def __init__(self, scheduler=None, runs_dir=None):
+        """
+        :param scheduler: LocalScheduler deciding when runs start, by default
+                          configured from the environment
+        :param runs_dir: Where each run gets a directory for its state and
+                         output, by default MLTF_LOCAL_RUNS_DIR or local-runs
+                         in the staging directory
+        """
+        self.scheduler = scheduler or LocalScheduler.from_environ()
+        self.runs_dir = (
+            runs_dir
+            or os.environ.get("MLTF_LOCAL_RUNS_DIR")
+            or os.path.join(
+                os.environ.get("MLTF_STAGING_DIR") or tempfile.gettempdir(),
+                "local-runs",
+            )
+        )
+
     def run_context_async(self, ctx, run_desc, gateway_id):
         cmdline_resolved = [str(x) for x in ctx["commands"]]
-
-        child = subprocess.Popen(
-            args=cmdline_resolved,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            start_new_session=True,
+        run_dir = os.path.join(self.runs_dir, gateway_id)
+        os.makedirs(run_dir, exist_ok=True)
+        run = LocalSubmittedRun(
+            run_desc.run_id, scheduler=self.scheduler, run_dir=run_dir
         )
 
-        return LocalSubmittedRun(run_desc.run_id, child)
\ No newline at end of file
+        def launch():
+            # The wrapper records the exit code and captures the output itself,
+            # so nothing about the run depends on this process staying up
+            return subprocess.Popen(
+                args=run.state.wrap(cmdline_resolved),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+
+        try:
+            self.scheduler.submit(run, launch, run_desc.backend_config)
+        except InvalidBackendConfig:
+            shutil.rmtree(run_dir, ignore_errors=True)
+            raise
+        return run
@@ -0,0 +1,272 @@
+"""
+Admission control for runs started by LocalExecutor.
+
+Each run asks for CPUs and memory through its backend_config, using the same
+keys as a Slurm submission ("cpus-per-task" and "mem"). Runs start only while
+the machine has room for them, and the rest wait in a queue ordered by
+"priority" (higher first) and then by submission order. The head of the queue
+is never overtaken, so a big run can't be starved by a stream of small ones.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+
+from .base import InvalidBackendConfig
+
+logger = logging.getLogger(__name__)
+
+FIFO = "fifo"
+PRIORITY = "priority"
+
+# Multipliers to MiB for Slurm-style memory sizes
+MEMORY_UNITS = {"K": 1 / 1024, "M": 1, "G": 1024, "T": 1024 * 1024}
+
+
+def parse_memory(value):
+    """
+    :param value: Memory in Slurm's format, e.g. 8192 or "8G". Plain numbers are MiB
+    :return: MiB
+    """
+    value = str(value).strip().upper()
+    if value and value[-1] in MEMORY_UNITS:
+        return int(float(value[:-1]) * MEMORY_UNITS[value[-1]])
+    return int(value)
+
+
+def _int_option(backend_config, key, default, minimum=None):
+    """
+    :return: backend_config[key] as an int
+    :raises InvalidBackendConfig: if it isn't one, or is below minimum
+    """
+    value = backend_config.get(key, default)
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise InvalidBackendConfig(f"{key} must be an integer, got {value!r}") from None
+    if minimum is not None and number < minimum:
+        raise InvalidBackendConfig(f"{key} must be at least {minimum}, got {number}")
+    return number
+
+
+def total_memory():
+    """
+    :return: Physical memory of this machine in MiB, or None if unknown
+    """
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 1024**2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class _Request:
+    """
+    A run waiting for, or holding, its share of the machine
+    """
+
+    def __init__(self, run, launch, cpus, memory, priority, seq):
+        self.run = run
+        self.launch = launch
+        self.cpus = cpus
+        self.memory = memory
+        self.priority = priority
+        self.seq = seq
+        # Set if the run is cancelled while its process is being started
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (-self.priority, self.seq) < (-other.priority, other.seq)
+
+
+class LocalScheduler:
+    def __init__(self, cpus=None, memory=None, policy=PRIORITY):
+        """
+        :param cpus: CPUs runs can use at once, defaults to all of them
+        :param memory: MiB runs can use at once, defaults to all of it. None
+                       (when it can't be determined) means no limit
+        :param policy: PRIORITY to honor each run's "priority", FIFO to ignore it
+        """
+        if policy not in (FIFO, PRIORITY):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.cpus = cpus or os.cpu_count() or 1
+        self.memory = memory or total_memory()
+        self.policy = policy
+        self.free_cpus = self.cpus
+        self.free_memory = self.memory
+        self._queue = []
+        # Taken off the queue, their processes being started by _launch()
+        self._launching = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environ(cls):
+        """
+        Build a scheduler from MLTF_LOCAL_CPUS, MLTF_LOCAL_MEMORY (MiB or
+        Slurm-style, e.g. "16G") and MLTF_LOCAL_QUEUE_POLICY
+        """
+        cpus = os.environ.get("MLTF_LOCAL_CPUS")
+        memory = os.environ.get("MLTF_LOCAL_MEMORY")
+        return cls(
+            cpus=int(cpus) if cpus else None,
+            memory=parse_memory(memory) if memory else None,
+            policy=os.environ.get("MLTF_LOCAL_QUEUE_POLICY", PRIORITY),
+        )
+
+    def _request_for(self, run, launch, backend_config):
+        backend_config = backend_config or {}
+        cpus = _int_option(backend_config, "cpus-per-task", 1, minimum=1)
+        mem = backend_config.get("mem", 0)
+        try:
+            memory = parse_memory(mem)
+        except (TypeError, ValueError):
+            memory = None
+        if memory is None or memory < 0:
+            raise InvalidBackendConfig(
+                f"mem must be a size like 8192 or 8G, got {mem!r}"
+            )
+        priority = 0
+        if self.policy == PRIORITY:
+            priority = _int_option(backend_config, "priority", 0)
+        # Something bigger than the whole machine can still run, on its own
+        if cpus > self.cpus:
+            logger.warning(f"Run {run.run_id} wants {cpus} CPUs, only {self.cpus}")
+            cpus = self.cpus
+        if self.memory is not None and memory > self.memory:
+            logger.warning(
+                f"Run {run.run_id} wants {memory} MiB, only {self.memory} MiB"
+            )
+            memory = self.memory
+        return _Request(run, launch, cpus, memory, priority, next(self._seq))
+
+    def submit(self, run, launch, backend_config=None):
+        """
+        Start the run now if there's room, otherwise queue it
+        :param run: LocalSubmittedRun, told when its process starts
+        :param launch: Called with no arguments to start the run's process,
+                       returning the Popen
+        :param backend_config: The run's backend_config, for its resource
+                               requests and priority
+        :raises InvalidBackendConfig: if those aren't valid
+        """
+        request = self._request_for(run, launch, backend_config)
+        with self._lock:
+            heapq.heappush(self._queue, request)
+            ready = self._dispatch()
+        self._launch(ready)
+
+    def cancel(self, run):
+        """
+        Take a run out of the queue
+        :return: True if it hadn't started yet, False if it already had
+        """
+        with self._lock:
+            for request in self._launching:
+                if request.run is run:
+                    # _launch() cancels it once its process exists
+                    request.cancelled = True
+                    return True
+            for i, request in enumerate(self._queue):
+                if request.run is run:
+                    self._queue.pop(i)
+                    heapq.heapify(self._queue)
+                    break
+            else:
+                return False
+            # Whatever was stuck behind it might fit now
+            ready = self._dispatch()
+        run._not_started(cancelled=True)
+        self._launch(ready)
+        return True
+
+    def queued(self):
+        """
+        :return: Runs waiting to start, in the order they will start
+        """
+        with self._lock:
+            return [r.run for r in sorted(self._queue)]
+
+    def queue_depth(self):
+        """
+        :return: Number of runs waiting to start
+        """
+        with self._lock:
+            return len(self._queue)
+
+    def _fits(self, request):
+        if request.cpus > self.free_cpus:
+            return False
+        return self.free_memory is None or request.memory <= self.free_memory
+
+    def _dispatch(self):
+        """
+        Take queued runs off the queue, in order, while the next one fits, and
+        set their share of the machine aside. Callers hold _lock, and pass what
+        this returns to _launch() once they have released it
+        """
+        ready = []
+        while self._queue and self._fits(self._queue[0]):
+            request = heapq.heappop(self._queue)
+            self.free_cpus -= request.cpus
+            if self.free_memory is not None:
+                self.free_memory -= request.memory
+            self._launching.append(request)
+            ready.append(request)
+        return ready
+
+    def _release(self, request):
+        """
+        Give a run's share of the machine back. Callers hold _lock
+        :return: Runs that can start now, for _launch()
+        """
+        self.free_cpus += request.cpus
+        if self.free_memory is not None:
+            self.free_memory += request.memory
+        return self._dispatch()
+
+    def _launch(self, requests):
+        """
+        Start the processes of runs _dispatch() took off the queue. Spawning a
+        process can take a while, so this runs without holding _lock
+        """
+        requests = list(requests)
+        while requests:
+            request = requests.pop(0)
+            proc = error = None
+            if not request.cancelled:
+                try:
+                    proc = request.launch()
+                except Exception as e:
+                    logger.error(f"Failed to start run {request.run.run_id}: {e}")
+                    error = f"{type(e).__name__}: {e}"
+            if proc is not None:
+                # Before it leaves _launching, so a cancel() from then on finds
+                # a process to kill
+                request.run._started_process(proc)
+            with self._lock:
+                self._launching.remove(request)
+                cancelled = request.cancelled
+                if proc is None:
+                    requests.extend(self._release(request))
+            if proc is None:
+                request.run._not_started(cancelled=cancelled, error=error)
+                continue
+            threading.Thread(
+                target=self._watch,
+                args=(request, proc),
+                name=f"local-run-{proc.pid}",
+                daemon=True,
+            ).start()
+            if cancelled:
+                request.run.cancel()
+
+    def _watch(self, request, proc):
+        """
+        Give a run's share of the machine back once its process exits
+        """
+        proc.wait()
+        with self._lock:
+            ready = self._release(request)
+        self._launch(ready)
@@ -0,0 +1,219 @@
+"""
+Non-blocking SSAM client, used by the ASGI front end (see flaskapp/asgi.py).
+
+Talks to SSAM on behalf of SSAMSubmittedRun objects, so the status mapping
+and log cache are shared with the blocking code paths. All requests go
+through one pooled httpx.AsyncClient, and any number of waiters on the same
+job share a single poll loop. The log cache is guarded by a threading lock
+the blocking code paths can hold through a slow SSAM request, so anything
+touching it runs in a worker thread rather than on the event loop.
+"""
+
+import asyncio
+import collections
+import logging
+
+import anyio.to_thread
+import httpx
+from mlflow.entities import RunStatus
+
+from ..metrics import track_ssam_call
+from ..submitted_runs.ssam_run import SSAMSubmittedRun
+
+logger = logging.getLogger(__name__)
+
+
+def _is_terminated_or_gone(status):
+    return not status or RunStatus.is_terminated(status)
+
+
+def _cached_log(run: SSAMSubmittedRun):
+    """
+    :return: (whether the output is complete, the cached output)
+    """
+    with run._log_lock:
+        run._load_archived_log()
+        return run._log_complete, run._log_cache or ""
+
+
+def _update_cached_log(
+    run: SSAMSubmittedRun, response_json, cached, terminated, offset, size=None
+):
+    """
+    Merge an output response (if any) into the run's log cache
+    :return: (at most size characters of output from offset, or None if there
+             is none, length of the output)
+    """
+    with run._log_lock:
+        if response_json is not None:
+            run._apply_output_response(response_json, cached, terminated)
+        return run._read_cached(offset, size), run.get_log_length()
+
+
+class AsyncSSAMClient:
+    def __init__(self, http_client=None, timeout=30, max_connections=100):
+        """
+        :param http_client: httpx.AsyncClient to use, one is created if not given
+        :param timeout: Timeout for each request to SSAM
+        :param max_connections: Size of the connection pool to SSAM
+        """
+        self._client = http_client or httpx.AsyncClient(
+            timeout=timeout, limits=httpx.Limits(max_connections=max_connections)
+        )
+        self._polls = {}
+        self._waiters = collections.Counter()
+
+    async def aclose(self):
+        for poll in list(self._polls.values()):
+            poll.cancel()
+        await self._client.aclose()
+
+    @staticmethod
+    def _headers(run: SSAMSubmittedRun):
+        return {"Authorization": f"Bearer {run._auth_token}"}
+
+    async def _fetch_status(self, run: SSAMSubmittedRun) -> RunStatus:
+        """
+        Ask SSAM for the job's status
+        :return: The status, or None if SSAM doesn't know the job
+        :raises httpx.HTTPError, ValueError: if SSAM couldn't be asked
+        """
+        with track_ssam_call("status"):
+            response = await self._client.get(
+                f"{run._ssam_url}/api/slurm/{run.job_id}",
+                headers=self._headers(run),
+            )
+            # SSAM says "unknown job" with a 404, which isn't a failed request
+            if response.status_code != 404:
+                response.raise_for_status()
+        return run._apply_status_response(response.json())
+
+    async def get_status(self, run: SSAMSubmittedRun) -> RunStatus:
+        """
+        :return: The job's status, or None if it is gone or SSAM couldn't be
+                 asked. The run keeps its last known status in the latter case
+        """
+        try:
+            return await self._fetch_status(run)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Error fetching status for job {run.job_id}: {e}")
+            return None
+
+    async def get_logs(self, run: SSAMSubmittedRun, offset=0):
+        """
+        Async version of SSAMSubmittedRun.get_logs
+        """
+        logs, _ = await self._read_logs(run, offset)
+        return logs
+
+    async def read_logs(self, run: SSAMSubmittedRun, offset, size):
+        """
+        Async version of SSAMSubmittedRun.read_logs
+        """
+        logs, _ = await self._read_logs(run, offset, size)
+        return logs
+
+    async def _read_logs(self, run: SSAMSubmittedRun, offset, size=None):
+        """
+        Only asks SSAM for new output if size is None or offset is past what
+        is cached
+        :return: (at most size characters of output from offset, or None if
+                 there is none, length of the output)
+        """
+        complete, cached = await anyio.to_thread.run_sync(_cached_log, run)
+        response_json = None
+        terminated = False
+        if not complete and (size is None or offset >= len(cached)):
+            terminated = run._status is not None and RunStatus.is_terminated(
+                run._status
+            )
+            try:
+                with track_ssam_call("output"):
+                    response = await self._client.get(
+                        f"{run._ssam_url}/api/slurm/{run.job_id}/output",
+                        headers=self._headers(run),
+                        params={"offset": len(cached)},
+                    )
+                    response.raise_for_status()
+                response_json = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                logger.error(f"Error fetching logs for job {run.job_id}: {e}")
+        return await anyio.to_thread.run_sync(
+            _update_cached_log, run, response_json, cached, terminated, offset, size
+        )
+
+    async def get_run_details(
+        self, run: SSAMSubmittedRun, show_logs=False, log_offset=0, status=None
+    ):
+        """
+        Async version of SSAMSubmittedRun.get_run_details
+        :param status: Status the caller just fetched, to save asking SSAM again
+        """
+        if status is None:
+            status = await self.get_status(run)
+        details = run._details_for_status(status)
+        if status is not None and show_logs:
+            details["logs"], details["log_offset"] = await self._read_logs(
+                run, log_offset
+            )
+        return details
+
+    async def wait(self, run: SSAMSubmittedRun, timeout=None) -> RunStatus:
+        """
+        Wait until the run's job is terminated or gone, or timeout seconds pass
+        :return: The last status seen
+        """
+        key = (run._ssam_url, run.job_id)
+        poll = self._polls.get(key)
+        if poll is None:
+            poll = asyncio.ensure_future(self._poll_until_terminated(run))
+            self._polls[key] = poll
+            poll.add_done_callback(lambda _: self._forget_poll(key, poll))
+        self._waiters[key] += 1
+        try:
+            # Shielded, so a waiter timing out doesn't stop the poll for the rest
+            status, failure_reason = await asyncio.wait_for(
+                asyncio.shield(poll), timeout
+            )
+        except asyncio.TimeoutError:
+            return run._status
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                if not poll.done():
+                    # Nobody is waiting anymore, stop asking SSAM
+                    self._forget_poll(key, poll)
+                    poll.cancel()
+        # Followers polled nothing themselves, bring their run object up to date
+        with run._status_lock:
+            run._status = status
+            run._failure_reason = failure_reason
+        return status
+
+    def _forget_poll(self, key, poll):
+        # A newer poll may have taken the key since
+        if self._polls.get(key) is poll:
+            del self._polls[key]
+
+    async def _poll_until_terminated(self, run: SSAMSubmittedRun):
+        interval = run.POLL_STATUS_INTERVAL
+        last_status = run._status
+        while True:
+            try:
+                status = await self._fetch_status(run)
+            except (httpx.HTTPError, ValueError) as e:
+                # Likely transient (SSAM restarting, a network blip), so keep
+                # polling and keep backing off
+                logger.error(f"Error fetching status for job {run.job_id}: {e}")
+            else:
+                if _is_terminated_or_gone(status):
+                    return status, run._failure_reason
+                if status != last_status:
+                    # Something is happening, go back to polling quickly
+                    last_status = status
+                    interval = run.POLL_STATUS_INTERVAL
+            await asyncio.sleep(interval)
+            interval = min(
+                interval * run.POLL_BACKOFF_FACTOR, run.POLL_STATUS_MAX_INTERVAL
+            )
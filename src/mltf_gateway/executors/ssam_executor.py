@@ -13,6 +13,9 @@ from mlflow.utils.logging_utils import _configure_mlflow_loggers
 
 from .base import ExecutorBase, jinja_env
 from ..data_classes import MovableFileReference
+from ..log_archive import LogArchive
+from .. import tracing
+from ..metrics import track_ssam_call
 from ..submitted_runs.ssam_run import SSAMSubmittedRun
 from ..utils import get_ssam_job_description
 
@@ -198,8 +201,10 @@ class SSAMExecutor(ExecutorBase):
         self.project_root = project_root or os.environ.get(
             "PROJECT_ROOT_DIR", "/tmp/mltf-experiments"
         )
+        self.log_archive = LogArchive.from_environ()
 
     @staticmethod
+    @tracing.traced()
     def _setup_slurm_token(ssam_url: str, auth_token: str, slurm_token: str):
         """
         Setup SLURM_TOKEN for SSAM server.
@@ -209,14 +214,15 @@ class SSAMExecutor(ExecutorBase):
         """
         headers = {"Authorization": f"Bearer {auth_token}"}
         payload = {"slurm_token": slurm_token, "token_name": "asd"}
-        response = requests.post(
-            f"{ssam_url}/api/cluster_slurm_token",
-            json=payload,
-            headers=headers,
-            timeout=30,
-        )
         try:
-            response.raise_for_status()
+            with track_ssam_call("cluster_slurm_token"):
+                response = requests.post(
+                    f"{ssam_url}/api/cluster_slurm_token",
+                    json=payload,
+                    headers=headers,
+                    timeout=30,
+                )
+                response.raise_for_status()
         except requests.exceptions.HTTPError as e:
             logging.error(f"Failed to setup slurm token: {e}")
             print(response.text)
@@ -232,13 +238,14 @@ class SSAMExecutor(ExecutorBase):
         """
         headers = {"Authorization": f"Bearer {auth_token}"}
         payload = {"base_experiment_path": project_root_dir}
-        response = requests.post(
-            f"{ssam_url}/api/experiment_folder",
-            json=payload,
-            headers=headers,
-            timeout=30,
-        )
-        response.raise_for_status()
+        with track_ssam_call("experiment_folder"):
+            response = requests.post(
+                f"{ssam_url}/api/experiment_folder",
+                json=payload,
+                headers=headers,
+                timeout=30,
+            )
+            response.raise_for_status()
 
     @staticmethod
     def _jwt_required(function):
@@ -259,6 +266,44 @@ class SSAMExecutor(ExecutorBase):
 
         return wrapper
 
+    # Tokens expiring sooner than this make the executor unhealthy
+    TOKEN_EXPIRY_WARNING = 300
+
+    def get_health(self):
+        """
+        Probe SSAM and check our tokens. Blocks for up to a few seconds, so
+        the server calls this from its background HealthProber, never inline
+        :return: dict with "ok" plus the details of each check
+        """
+        ssam = {"reachable": False}
+        start = time.perf_counter()
+        try:
+            with track_ssam_call("health"):
+                response = requests.get(self.ssam_url, timeout=5)
+            # Any answer short of a server error means SSAM is up
+            ssam["reachable"] = response.status_code < 500
+            ssam["status_code"] = response.status_code
+        except requests.exceptions.RequestException as e:
+            ssam["error"] = str(e)
+        ssam["latency_seconds"] = round(time.perf_counter() - start, 4)
+
+        tokens = {}
+        for name, holder in (("auth", self._auth_token), ("slurm", self._slurm_token)):
+            try:
+                expires_in = get_jwt_expiration(holder.get_token()) - int(time.time())
+                tokens[name] = {
+                    "valid": expires_in > 0,
+                    "expires_in": expires_in,
+                }
+            except Exception as e:
+                tokens[name] = {"valid": False, "error": str(e)}
+
+        ok = ssam["reachable"] and all(
+            t["valid"] and t["expires_in"] > self.TOKEN_EXPIRY_WARNING
+            for t in tokens.values()
+        )
+        return {"ok": ok, "ssam": ssam, "tokens": tokens}
+
     # Add some syntax sugar around tokens
     @property
     def auth_token(self):
@@ -268,6 +313,7 @@ class SSAMExecutor(ExecutorBase):
     def slurm_token(self):
         return self._slurm_token.get_token()
 
+    @tracing.traced()
     def generate_ssam_template(self, ctx, run_desc):
         cmdline = []
         for x in ctx["commands"]:
@@ -317,6 +363,8 @@ class SSAMExecutor(ExecutorBase):
             self.ssam_url,
             self.auth_token,
             run_desc.user_subject,
+            gateway_id=gateway_id,
+            log_archive=self.log_archive,
         )
 
     def _ssam_request(
@@ -345,17 +393,21 @@ class SSAMExecutor(ExecutorBase):
                 ("slurm_request", (None, json.dumps(slurm_request)))
             )
             print(f"POSTING TO SLURM: data: {multipart_form_data}\nheaders: {headers}")
-            response = requests.post(
-                f"{self.ssam_url}/api/slurm",
-                files=multipart_form_data,
-                headers=headers,
-                timeout=30,
-            )
+            with track_ssam_call("submit"), tracing.span(
+                "ssam_submit", kind=tracing.KIND_CLIENT
+            ):
+                tracing.inject(headers)
+                response = requests.post(
+                    f"{self.ssam_url}/api/slurm",
+                    files=multipart_form_data,
+                    headers=headers,
+                    timeout=30,
+                )
+                response.raise_for_status()
         finally:
             for handle in file_handles:
                 handle.close()
 
-        response.raise_for_status()
         response_json = response.json()
         if response_json.get("success"):
             job_uuid = response_json.get("data", {}).get("job_uuid")
@@ -0,0 +1,353 @@
+"""
+Local stand-in for SSAM, the REST service the gateway submits SLURM jobs through.
+
+Jobs are not executed, they move through a simulated lifecycle
+(PENDING -> RUNNING -> COMPLETED/FAILED) driven by the wall clock, and produce
+synthetic output while "running". Latency, error rates and job durations are
+configurable so SSAMExecutor/SSAMSubmittedRun can be exercised and the gateway
+load-tested without a live SSAM or SLURM.
+
+Run standalone with
+
+  python -m mltf_gateway.fake_ssam --port 5002 --job-duration 30
+
+then point the gateway at it with SSAM_URL=http://localhost:5002
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import jwt
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+
+@dataclass
+class FakeSSAMConfig:
+    """
+    Knobs for the simulated SSAM. Times are in seconds, rates are probabilities
+    """
+
+    # Added to every request, plus up to latency_jitter of random extra delay
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    # Chance any request fails with an HTTP 500
+    error_rate: float = 0.0
+    # How long jobs sit in PENDING, then RUNNING
+    pending_time: float = 1.0
+    job_duration: float = 5.0
+    # Chance a job ends FAILED instead of COMPLETED
+    failure_rate: float = 0.0
+    # Simulated output: one line every output_interval seconds of run time
+    output_interval: float = 1.0
+    # If false, ignore ?offset= on output requests and always return everything
+    honor_offset: bool = True
+    seed: int = None
+
+    def __post_init__(self):
+        if self.output_interval <= 0:
+            raise ValueError(
+                f"output_interval must be positive, got {self.output_interval}"
+            )
+
+
+@dataclass
+class FakeSSAMJob:
+    job_uuid: str
+    submit_time: float
+    will_fail: bool
+    slurm_request: dict = field(default_factory=dict)
+    files: list = field(default_factory=list)
+    cancel_time: float = None
+
+    def state(self, config: FakeSSAMConfig, now: float):
+        """
+        :return: Tuple of (SLURM job state, seconds spent running so far)
+        """
+        finish_time = self.submit_time + config.pending_time + config.job_duration
+        cancelled = self.cancel_time is not None and self.cancel_time < finish_time
+        end = min(now, self.cancel_time) if cancelled else now
+        elapsed = end - self.submit_time
+        running = max(0.0, min(elapsed - config.pending_time, config.job_duration))
+        if cancelled:
+            return "CANCELLED", running
+        if elapsed < config.pending_time:
+            return "PENDING", running
+        if elapsed < config.pending_time + config.job_duration:
+            return "RUNNING", running
+        return ("FAILED" if self.will_fail else "COMPLETED"), running
+
+    def output(self, config: FakeSSAMConfig, now: float):
+        state, running = self.state(config, now)
+        if state == "PENDING" or (state == "CANCELLED" and running == 0):
+            return ""
+        lines = 1 + int(running / config.output_interval)
+        text = "".join(
+            f"[{self.job_uuid}] step {i} loss={1.0 / (i + 1):.4f}\n"
+            for i in range(lines)
+        )
+        if state in ("COMPLETED", "FAILED", "CANCELLED"):
+            text += f"[{self.job_uuid}] job {state.lower()}\n"
+        return text
+
+
+class FakeSSAMState:
+    """
+    The fake's job table. Shared by the request threads, so guarded by a lock
+    """
+
+    def __init__(self, config: FakeSSAMConfig):
+        self.config = config
+        self.jobs = {}
+        self.slurm_tokens = []
+        self.experiment_folders = []
+        self.request_count = 0
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+
+    def add_job(self, slurm_request=None, files=None, submit_time=None):
+        """
+        Register a job, as if it had been POSTed to /api/slurm. Also useful to
+        pre-populate the fake with many jobs
+        :return: The new job's UUID
+        """
+        with self._lock:
+            job = FakeSSAMJob(
+                job_uuid=str(uuid.uuid4()),
+                submit_time=time.time() if submit_time is None else submit_time,
+                will_fail=self._rng.random() < self.config.failure_rate,
+                slurm_request=slurm_request or {},
+                files=files or [],
+            )
+            self.jobs[job.job_uuid] = job
+        return job.job_uuid
+
+    def get_job(self, job_uuid):
+        with self._lock:
+            return self.jobs.get(job_uuid)
+
+    def cancel_job(self, job_uuid):
+        """
+        :return: False if there is no such job
+        """
+        with self._lock:
+            job = self.jobs.get(job_uuid)
+            if job is None:
+                return False
+            if job.cancel_time is None:
+                job.cancel_time = time.time()
+            return True
+
+    def simulate_request(self):
+        """
+        Apply the configured latency and decide if this request should fail
+        :return: True if the request should return an error
+        """
+        with self._lock:
+            self.request_count += 1
+            delay = (
+                self.config.latency + self._rng.random() * self.config.latency_jitter
+            )
+            should_fail = self._rng.random() < self.config.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        return should_fail
+
+
+def create_fake_ssam_app(config: FakeSSAMConfig = None) -> Flask:
+    """
+    Build the fake SSAM Flask app. Its job table is available as
+    app.extensions["fake_ssam"]
+    """
+    config = config or FakeSSAMConfig()
+    state = FakeSSAMState(config)
+    app = Flask(__name__)
+    app.extensions["fake_ssam"] = state
+
+    @app.before_request
+    def simulate():
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return jsonify({"success": False, "message": "Missing bearer token"}), 401
+        if state.simulate_request():
+            return jsonify({"success": False, "message": "Simulated SSAM error"}), 500
+        return None
+
+    def unknown_job(job_uuid):
+        return jsonify({"success": False, "message": f"Unknown job {job_uuid}"}), 404
+
+    @app.route("/api/slurm", methods=["POST"])
+    def submit():
+        files = [f.filename for f in request.files.getlist("files")]
+        if "entry_script" not in request.form:
+            return jsonify({"success": False, "message": "Missing entry_script"}), 400
+        slurm_request = json.loads(request.form.get("slurm_request", "{}"))
+        job_uuid = state.add_job(slurm_request=slurm_request, files=files)
+        return jsonify({"success": True, "data": {"job_uuid": job_uuid}})
+
+    @app.route("/api/slurm/<job_uuid>", methods=["GET"])
+    def status(job_uuid):
+        job = state.get_job(job_uuid)
+        if job is None:
+            return unknown_job(job_uuid)
+        job_state, _ = job.state(config, time.time())
+        data = {"job_uuid": job_uuid, "job_state": job_state}
+        if job_state == "FAILED":
+            data["failure_reason"] = "Simulated failure"
+        return jsonify({"success": True, "data": data})
+
+    @app.route("/api/slurm/<job_uuid>/output", methods=["GET"])
+    def output(job_uuid):
+        job = state.get_job(job_uuid)
+        if job is None:
+            return unknown_job(job_uuid)
+        text = job.output(config, time.time())
+        ret = {"success": True}
+        if config.honor_offset and "offset" in request.args:
+            try:
+                offset = int(request.args["offset"])
+            except ValueError:
+                offset = -1
+            if offset < 0:
+                return (
+                    jsonify(
+                        {
+                            "success": False,
+                            "message": "offset must be a non-negative integer",
+                        }
+                    ),
+                    400,
+                )
+            offset = min(offset, len(text))
+            text = text[offset:]
+            ret["offset"] = offset
+        ret["data"] = {f"slurm-{job_uuid}.out": text}
+        return jsonify(ret)
+
+    @app.route("/api/slurm/<job_uuid>/cancel", methods=["POST"])
+    def cancel(job_uuid):
+        if not state.cancel_job(job_uuid):
+            return unknown_job(job_uuid)
+        return jsonify({"success": True, "data": {"job_uuid": job_uuid}})
+
+    @app.route("/api/cluster_slurm_token", methods=["POST"])
+    def cluster_slurm_token():
+        payload = request.get_json(silent=True) or {}
+        if not payload.get("slurm_token"):
+            return jsonify({"success": False, "message": "Missing slurm_token"}), 400
+        state.slurm_tokens.append(payload.get("token_name"))
+        return jsonify({"success": True})
+
+    @app.route("/api/experiment_folder", methods=["POST"])
+    def experiment_folder():
+        payload = request.get_json(silent=True) or {}
+        if not payload.get("base_experiment_path"):
+            return (
+                jsonify({"success": False, "message": "Missing base_experiment_path"}),
+                400,
+            )
+        state.experiment_folders.append(payload["base_experiment_path"])
+        return jsonify({"success": True})
+
+    return app
+
+
+class FakeSSAMServer:
+    """
+    Serves a fake SSAM app from a background thread. Usable as a context manager:
+
+        with FakeSSAMServer(FakeSSAMConfig(job_duration=0)) as ssam:
+            executor = SSAMExecutor(ssam_url=ssam.url, ...)
+    """
+
+    def __init__(self, config: FakeSSAMConfig = None, host="127.0.0.1", port=0):
+        self.app = create_fake_ssam_app(config)
+        self.state = self.app.extensions["fake_ssam"]
+        self._server = make_server(host, port, self.app, threaded=True)
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self._server.host}:{self._server.port}"
+
+    def serve_forever(self):
+        """Serve from the calling thread until interrupted"""
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-ssam", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        if self._thread:
+            self._thread.join()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def make_fake_token(subject="fake-user", lifetime=3600):
+    """
+    Mint an (insecurely signed) JWT that SSAMExecutor's token handling accepts.
+    The executor only checks expiration, never the signature
+    """
+    now = int(time.time())
+    claims = {"sub": subject, "iat": now, "exp": now + lifetime}
+    return jwt.encode(
+        claims, "fake-ssam-signing-key-not-for-real-use", algorithm="HS256"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake SSAM server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5002)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--pending-time", type=float, default=1.0)
+    parser.add_argument("--job-duration", type=float, default=5.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--output-interval", type=float, default=1.0)
+    parser.add_argument(
+        "--ignore-offset",
+        action="store_true",
+        help="Always return full job output, like an SSAM without offset support",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = FakeSSAMConfig(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        pending_time=args.pending_time,
+        job_duration=args.job_duration,
+        failure_rate=args.failure_rate,
+        output_interval=args.output_interval,
+        honor_offset=not args.ignore_offset,
+        seed=args.seed,
+    )
+    server = FakeSSAMServer(config, host=args.host, port=args.port)
+    print(f"Fake SSAM listening on {server.url}")
+    print(f"Use a bearer token such as: {make_fake_token()}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
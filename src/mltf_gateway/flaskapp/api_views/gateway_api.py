@@ -1,9 +1,14 @@
 import json
+import os
 import tempfile
+import time
+import zlib
 
 from flask import Blueprint, jsonify, g, request, current_app
 
 from ..utils import require_oauth_token
+from ... import metrics, tracing
+from ...executors.base import InvalidBackendConfig
 
 gateway_api_bp = Blueprint("gateway_api", __name__)
 
@@ -36,8 +41,11 @@ def submit():
     Returns:
         JSON response with job reference details
     """
-    run_id = request.form["run_id"]
-    tarball = request.files["tarball"]
+    # Reading the form receives the whole upload
+    upload_start = time.perf_counter()
+    with tracing.span("receive_upload"):
+        run_id = request.form["run_id"]
+        tarball = request.files["tarball"]
     entry_point = request.form["entry_point"]
     params = json.loads(request.form["params"])
     backend_config = json.loads(request.form["backend_config"])
@@ -46,12 +54,22 @@ def submit():
     user_subj = g.user["username"]
     runtime_token = g.user["runtime_token"]
 
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tarball.save(tmp.name)
-        gateway_server = current_app.extensions["mltf_gateway"]
+    gateway_server = current_app.extensions["mltf_gateway"]
+    # Upload under a temporary name, so a partial upload is never mistaken
+    # for a complete one by anything sharing the staging area
+    with tracing.span("save_upload") as span, tempfile.NamedTemporaryFile(
+        dir=gateway_server.staging_dir, prefix="upload-", suffix=".part", delete=False
+    ) as tmp:
+        tarball.save(tmp)
+        upload_size = tmp.tell()
+        span.set_attribute("bytes", upload_size)
+    metrics.record_upload(upload_size, time.perf_counter() - upload_start)
+    tarball_path = tmp.name[: -len(".part")] + ".tar"
+    os.replace(tmp.name, tarball_path)
+    try:
         run_reference = gateway_server.enqueue_run_client(
             run_id=run_id,
-            tarball_path=tmp.name,
+            tarball_path=tarball_path,
             entry_point=entry_point,
             params=params,
             backend_config=backend_config,
@@ -60,28 +78,160 @@ def submit():
             user_subj=user_subj,
             runtime_token=runtime_token,
         )
-        return jsonify(run_reference.__dict__)
+    except InvalidBackendConfig as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(run_reference.__dict__)
 
 
 @gateway_api_bp.route("/jobs", methods=["GET"])
 @require_oauth_token
 def list_jobs():
+    """
+    List the user's jobs. Answers If-None-Match with 304 while the user's
+    set of jobs is unchanged
+    """
     gateway_server = current_app.extensions["mltf_gateway"]
+    etag = gateway_server.list_etag(g.user["username"])
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
     jobs = gateway_server.list(list_all=True, user_subject=g.user["username"])
-    return jsonify(jobs), 200
+    response = jsonify(jobs)
+    response.set_etag(etag, weak=True)
+    return response, 200
+
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def parse_log_args(args):
+    """
+    :return: (show_logs, log_offset, error message or None)
+    """
+    show_logs = args.get("show_logs", "false").lower() == "true"
+    log_offset = args.get("offset", args.get("since"))
+    if log_offset is None:
+        return show_logs, 0, None
+    try:
+        log_offset = int(log_offset)
+    except ValueError:
+        return show_logs, 0, "offset must be an integer"
+    if log_offset < 0:
+        return show_logs, 0, "offset must be non-negative"
+    return True, log_offset, None
 
 
 @gateway_api_bp.route("/jobs/<job_id>", methods=["GET"])
 @require_oauth_token
 def show_job(job_id):
+    """
+    Show the status of a job. Logs are included with ?show_logs=true. Clients
+    tailing the log can pass ?offset=N (or ?since=N) with the "log_offset"
+    returned by the previous call to only receive output appended since then.
+
+    Responses carry an ETag. If-None-Match with the ETag of a finished job is
+    answered with 304 without asking the executor
+    """
     gateway_server = current_app.extensions["mltf_gateway"]
-    show_logs = request.args.get("show_logs", "false").lower() == "true"
-    details = gateway_server.show_details(job_id, show_logs)
+    show_logs, log_offset, error = parse_log_args(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    if request.if_none_match:
+        etag = gateway_server.final_details_etag(job_id, show_logs, log_offset)
+        if etag and request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+    details = gateway_server.show_details(job_id, show_logs, log_offset)
     if isinstance(details, tuple) and len(details) == 2:
         response, status_code = details
         return jsonify(response), status_code
 
-    return jsonify(details), 200
+    etag = gateway_server.details_etag(job_id, details, show_logs, log_offset)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    response = jsonify(details)
+    response.set_etag(etag, weak=True)
+    return response, 200
+
+
+def parse_logs_request(run_log, args, requested_range):
+    """
+    Work out what a request for a job's output asks for. Shared with the ASGI
+    front end. May read the output, to answer a Range
+    :param args: The request's query parameters
+    :param requested_range: werkzeug Range of the request, or None
+    :return: (start, end, follow, status, headers, error message or None).
+             With an error, status is the error status to answer with
+    """
+    follow = args.get("follow", "false").lower() == "true"
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": "no-cache"}
+    try:
+        start = int(args.get("offset", 0))
+    except ValueError:
+        return 0, None, follow, 400, headers, "offset must be an integer"
+    if start < 0:
+        return 0, None, follow, 400, headers, "offset must be non-negative"
+
+    if requested_range is None or requested_range.units != "bytes":
+        return start, None, follow, 200, headers, None
+    if follow:
+        return 0, None, follow, 400, headers, "Use offset rather than Range to follow"
+    # A snapshot of the output so far
+    size = run_log.size()
+    byte_range = requested_range.range_for_length(size)
+    if byte_range is not None:
+        # Output that was rotated away can't be sent
+        byte_range = (max(byte_range[0], run_log.start()), byte_range[1])
+    if byte_range is None or byte_range[0] >= byte_range[1]:
+        headers["Content-Range"] = f"bytes */{size}"
+        return 0, None, follow, 416, headers, "Range not satisfiable"
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    return start, end, follow, 206, headers, None
+
+
+@gateway_api_bp.route("/jobs/<job_id>/logs", methods=["GET"])
+@require_oauth_token
+def job_logs(job_id):
+    """
+    Stream a job's output as text/plain, without holding it all in memory
+    Supports:
+        - A single byte Range, answered with 206 (or 416)
+        - ?offset=N to start at byte N
+        - ?follow=true to keep the response open and send output as the job
+          produces it, until the job terminates
+        - gzip, if the client accepts it and didn't send a Range
+    """
+    gateway_server = current_app.extensions["mltf_gateway"]
+    run_log = gateway_server.get_run_log(job_id)
+    if run_log is None:
+        return jsonify({"error": f"No logs for run with ID '{job_id}'."}), 404
+    start, end, follow, status, headers, error = parse_logs_request(
+        run_log, request.args, request.range
+    )
+    if error:
+        return jsonify({"error": error}), status, headers
+
+    chunks = run_log.iter_bytes(start, end, follow=follow)
+    headers["Vary"] = "Accept-Encoding"
+    if status == 200 and request.accept_encodings["gzip"]:
+        headers["Content-Encoding"] = "gzip"
+        chunks = gzip_chunks(chunks)
+    return current_app.response_class(
+        chunks, status=status, headers=headers, mimetype="text/plain"
+    )
+
+
+def gzip_chunks(chunks):
+    """
+    gzip a stream of chunks, flushing after each one so a following client
+    sees output as soon as the job produces it
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
 
 
 @gateway_api_bp.route("/jobs/<job_id>", methods=["DELETE"])
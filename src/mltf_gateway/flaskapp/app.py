@@ -3,18 +3,22 @@ import logging
 import os
 
 from dotenv import load_dotenv
-from flask import Flask, render_template, g, session, jsonify
+from flask import Flask, Response, render_template, g, request, session, jsonify
 from flask_login import login_required
 
 import mltf_gateway.flaskapp.constants as constants
+from .. import metrics, tracing
 from .api_views.gateway_api import gateway_api_bp
 from .api_views.token_api import token_api_bp
 from .extensions import db, login_manager
+from .jwt_decoder import jwks_client
 from .models.user import User
-from .utils import init_db
+from .utils import get_cache_stats, init_db
 from .views.auth import auth_bp
 from .views.token import token_bp
 from ..gateway_server import GatewayServer
+from ..health import HealthProber
+from ..startup import Startup
 
 logger = logging.getLogger(__name__)
 
@@ -38,8 +42,55 @@ def init_routes(app):
 
     @app.route("/healthz")
     def health():
-        executor_status = app.extensions["mltf_gateway"].get_health()
-        return jsonify({"status": "ok", "executor_status": executor_status}), 200
+        """
+        Liveness: answers as long as the process serves requests. Reports the
+        last background health snapshot, but never probes anything itself
+        """
+        snapshot = app.extensions["mltf_health"].snapshot()
+        executor_status = snapshot["checks"]["executor"] if snapshot else None
+        return (
+            jsonify(
+                {
+                    "status": "ok",
+                    "executor_status": executor_status,
+                    "health": snapshot,
+                    "startup": app.extensions["mltf_startup"].status(),
+                    "caches": get_cache_stats(),
+                }
+            ),
+            200,
+        )
+
+    @app.route("/readyz")
+    def ready():
+        """
+        Readiness: 503 until startup finishes and the background checks pass,
+        or once they fail or go stale
+        """
+        startup = app.extensions["mltf_startup"]
+        prober = app.extensions["mltf_health"]
+        is_ready, reason = startup.is_ready()
+        if is_ready:
+            is_ready, reason = prober.is_ready()
+        snapshot = prober.snapshot()
+        return (
+            jsonify(
+                {
+                    "ready": is_ready,
+                    "reason": reason,
+                    "components": startup.status(),
+                    "checks": snapshot["checks"] if snapshot else None,
+                }
+            ),
+            200 if is_ready else 503,
+        )
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        metrics.collect_server_metrics(
+            app.extensions["mltf_gateway"], get_cache_stats()
+        )
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
     @app.route("/")
     @login_required
@@ -62,6 +113,90 @@ def init_routes(app):
         return jsonify(conf), 200
 
 
+def init_startup_gate(app, timeout):
+    """
+    Hold requests that need the gateway until startup finishes, for at most
+    timeout seconds. Health and metrics endpoints are always served
+    """
+
+    @app.before_request
+    def wait_for_startup():
+        if request.endpoint in ("health", "ready", "metrics_endpoint", "static"):
+            return None
+        startup = app.extensions["mltf_startup"]
+        is_ready, reason = startup.is_ready()
+        # Don't hold requests while a component is failing, it's retried
+        # with backoff and may take a while
+        if not is_ready and not reason.startswith("failed"):
+            if startup.wait(timeout):
+                return None
+            is_ready, reason = startup.is_ready()
+        if is_ready:
+            return None
+        response = jsonify({"error": "Gateway is starting up", "reason": reason})
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+
+
+def init_request_metrics(app):
+    """
+    Record latency, in-flight count and status of every request, by route
+    """
+
+    @app.before_request
+    def start_request_metrics():
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        tracker = metrics.track_request(route, request.method)
+        request.environ["mltf.metrics"] = (tracker, tracker.__enter__())
+
+    @app.after_request
+    def record_status(response):
+        if "mltf.metrics" in request.environ:
+            request.environ["mltf.metrics"][1]["status"] = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        tracked = request.environ.pop("mltf.metrics", None)
+        if tracked:
+            tracked[0].__exit__(None, None, None)
+
+
+def init_request_tracing(app):
+    """
+    Run every request in a server span. A traceparent header from the client
+    makes it part of the client's trace
+    """
+
+    @app.before_request
+    def start_request_span():
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        parent = tracing.parse_traceparent(
+            request.headers.get(tracing.TRACEPARENT_HEADER)
+        )
+        span, token = tracing.start_span(
+            f"{request.method} {route}",
+            parent=parent,
+            kind=tracing.KIND_SERVER,
+            attributes={"http.method": request.method, "http.route": route},
+        )
+        request.environ["mltf.span"] = (span, token)
+
+    @app.after_request
+    def record_span_status(response):
+        if "mltf.span" in request.environ:
+            span = request.environ["mltf.span"][0]
+            span.set_attribute("http.status_code", response.status_code)
+        return response
+
+    @app.teardown_request
+    def finish_request_span(exc):
+        started = request.environ.pop("mltf.span", None)
+        if started:
+            tracing.end_span(*started, error=exc)
+
+
 def create_app():
     """
         Create and configure the Flask application
@@ -90,10 +225,31 @@ def create_app():
         app.extensions = {}
 
     executor_name = os.environ.get("MLTF_EXECUTOR", "ssam")
-    app.extensions["mltf_gateway"] = GatewayServer(executor_name=executor_name)
+    # The slow parts are started below, from background threads
+    gateway = GatewayServer(executor_name=executor_name, lazy=True)
+    app.extensions["mltf_gateway"] = gateway
+    app.extensions["mltf_health"] = HealthProber(
+        gateway,
+        interval=int(os.environ.get("MLTF_HEALTH_INTERVAL", 30)),
+        min_free_bytes=int(os.environ.get("MLTF_HEALTH_MIN_FREE_BYTES", 1024**3)),
+    )
+    tracing.set_service_name("mltf-gateway")
+    init_request_metrics(app)
+    init_request_tracing(app)
+    init_startup_gate(app, timeout=int(os.environ.get("MLTF_STARTUP_TIMEOUT", 30)))
     init_routes(app)
 
-    with app.app_context():
-        init_db()
+    def create_tables():
+        with app.app_context():
+            init_db()
+
+    startup = Startup()
+    startup.add("executor", gateway.init_executor)
+    startup.add("run_store", gateway.load_runs)
+    startup.add("database", create_tables)
+    # Requests can still fetch the signing keys themselves if this is slow
+    startup.add("jwks", jwks_client.warm, required=False)
+    startup.on_ready(app.extensions["mltf_health"].start)
+    app.extensions["mltf_startup"] = startup.start()
 
     return app
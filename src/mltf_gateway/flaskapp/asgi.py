@@ -0,0 +1,398 @@
+"""
+ASGI front end for the gateway.
+
+The job endpoints that spend their time waiting on SSAM (status, logs and
+waiting for a job to finish) are served natively with AsyncSSAMClient, so a
+waiting request costs a coroutine instead of a WSGI thread. Everything else,
+i.e. job submission, the HTML and token pages and /healthz, is the regular
+Flask app mounted underneath, sharing its GatewayServer.
+
+Needs the optional dependencies starlette, uvicorn and httpx
+(pip install mltf-gateway[async]).
+"""
+
+import asyncio
+import contextlib
+import functools
+import os
+import zlib
+
+from mlflow.entities import RunStatus
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import (
+    parse_accept_header,
+    parse_etags,
+    parse_range_header,
+    quote_etag,
+)
+
+from .. import metrics
+from .. import run_log as run_logs
+from .api_views.gateway_api import parse_log_args, parse_logs_request
+from .utils import authenticate_token, get_bearer_token, get_cached_claims
+from ..data_classes import RunReference
+from ..executors.ssam_async_client import AsyncSSAMClient
+from ..submitted_runs.ssam_run import SSAMSubmittedRun
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from uvicorn.middleware.wsgi import WSGIMiddleware
+
+# Longest a client may ask /wait to hold its request open
+MAX_WAIT_TIMEOUT = 600
+DEFAULT_WAIT_TIMEOUT = 60
+
+
+def instrumented(route):
+    """
+    Record request metrics for a native route, like the Flask app does for its own
+    """
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            with metrics.track_request(route, request.method) as result:
+                response = await handler(request)
+                result["status"] = response.status_code
+                return response
+
+        return wrapper
+
+    return decorator
+
+
+def after_startup(handler):
+    """
+    Hold the request until the gateway has started, like the Flask app's
+    startup gate does for its routes
+    """
+
+    @functools.wraps(handler)
+    async def wrapper(request):
+        startup = request.app.state.startup
+        is_ready, reason = startup.is_ready()
+        if not is_ready and not reason.startswith("failed"):
+            await run_in_threadpool(startup.wait, request.app.state.startup_timeout)
+            is_ready, reason = startup.is_ready()
+        if not is_ready:
+            return JSONResponse(
+                {"error": "Gateway is starting up", "reason": reason},
+                503,
+                headers={"Retry-After": "5"},
+            )
+        return await handler(request)
+
+    return wrapper
+
+
+async def authenticate(request):
+    """
+    :return: (user, None) on success, otherwise (None, error response)
+    """
+    token = get_bearer_token(request.headers, request.query_params)
+    decoded = get_cached_claims(token) if token else None
+    if token and decoded is None:
+        # Verifying may need to fetch signing keys, keep it off the event loop
+        user, error = await run_in_threadpool(authenticate_token, token)
+    else:
+        user, error = authenticate_token(token, decoded)
+    if error:
+        return None, JSONResponse({"error": error}, status_code=401)
+    return user, None
+
+
+async def find_run(request, job_id):
+    gateway_server = request.app.state.gateway_server
+    try:
+        return await run_in_threadpool(
+            gateway_server.reference_to_run, RunReference(job_id)
+        )
+    except IndexError:
+        return None
+
+
+def etag_matches(request, etag):
+    return parse_etags(request.headers.get("if-none-match")).contains_weak(etag)
+
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": quote_etag(etag, weak=True)})
+
+
+def not_found(job_id):
+    return JSONResponse({"error": f"Run with ID '{job_id}' not found."}, 404)
+
+
+async def run_details(request, run, show_logs, log_offset):
+    submitted_run = run.submitted_run
+    if isinstance(submitted_run, SSAMSubmittedRun):
+        # Takes the run's log lock and may read the log archive
+        details = await run_in_threadpool(
+            submitted_run.final_run_details, show_logs, log_offset
+        )
+        if details is not None:
+            return details
+        return await request.app.state.ssam_client.get_run_details(
+            submitted_run, show_logs, log_offset
+        )
+    # Other executors don't have an async client, use the blocking path
+    gateway_server = request.app.state.gateway_server
+    return await run_in_threadpool(
+        gateway_server.show_details, run.gateway_id, show_logs, log_offset
+    )
+
+
+@instrumented("/api/jobs")
+@after_startup
+async def list_jobs(request):
+    user, error = await authenticate(request)
+    if error:
+        return error
+    gateway_server = request.app.state.gateway_server
+    etag = await run_in_threadpool(gateway_server.list_etag, user["username"])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    jobs = await run_in_threadpool(gateway_server.list, True, user["username"])
+    return JSONResponse(jobs, headers={"ETag": quote_etag(etag, weak=True)})
+
+
+@instrumented("/api/jobs/<job_id>")
+@after_startup
+async def show_job(request):
+    """
+    Same as the Flask gateway_api.show_job
+    """
+    _, error = await authenticate(request)
+    if error:
+        return error
+    job_id = request.path_params["job_id"]
+    show_logs, log_offset, arg_error = parse_log_args(request.query_params)
+    if arg_error:
+        return JSONResponse({"error": arg_error}, 400)
+    run = await find_run(request, job_id)
+    if run is None:
+        return not_found(job_id)
+    gateway_server = request.app.state.gateway_server
+    etag = await run_in_threadpool(
+        gateway_server.final_details_etag, job_id, show_logs, log_offset
+    )
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
+    details = await run_details(request, run, show_logs, log_offset)
+    etag = await run_in_threadpool(
+        gateway_server.details_etag, job_id, details, show_logs, log_offset
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return JSONResponse(details, headers={"ETag": quote_etag(etag, weak=True)})
+
+
+@instrumented("/api/jobs/<job_id>/wait")
+@after_startup
+async def wait_job(request):
+    """
+    Hold the request until the job terminates or ?timeout=N seconds pass, then
+    return the same details as show_job. Clients check "status" to tell which
+    """
+    _, error = await authenticate(request)
+    if error:
+        return error
+    job_id = request.path_params["job_id"]
+    show_logs, log_offset, arg_error = parse_log_args(request.query_params)
+    if arg_error:
+        return JSONResponse({"error": arg_error}, 400)
+    try:
+        timeout = float(request.query_params.get("timeout", DEFAULT_WAIT_TIMEOUT))
+    except ValueError:
+        return JSONResponse({"error": "timeout must be a number"}, 400)
+    timeout = min(max(timeout, 0), MAX_WAIT_TIMEOUT)
+
+    run = await find_run(request, job_id)
+    if run is None:
+        return not_found(job_id)
+    submitted_run = run.submitted_run
+    if isinstance(submitted_run, SSAMSubmittedRun):
+        ssam_client = request.app.state.ssam_client
+        status = await ssam_client.wait(submitted_run, timeout)
+        details = await ssam_client.get_run_details(
+            submitted_run, show_logs, log_offset, status=status
+        )
+        return JSONResponse(details)
+    await _wait_blocking_run(submitted_run, timeout)
+    return JSONResponse(await run_details(request, run, show_logs, log_offset))
+
+
+async def _wait_blocking_run(submitted_run, timeout, interval=5):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        status = await run_in_threadpool(submitted_run.get_status)
+        if not status or RunStatus.is_terminated(status):
+            return
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(interval, remaining))
+
+
+@instrumented("/api/jobs/<job_id>/logs")
+@after_startup
+async def job_logs(request):
+    """
+    Same as the Flask gateway_api.job_logs. SSAM runs' output is read through
+    AsyncSSAMClient, so a client following a job costs a coroutine rather than
+    a thread for as long as the job runs
+    """
+    _, error = await authenticate(request)
+    if error:
+        return error
+    job_id = request.path_params["job_id"]
+    gateway_server = request.app.state.gateway_server
+    run_log = await run_in_threadpool(gateway_server.get_run_log, job_id)
+    if run_log is None:
+        return JSONResponse({"error": f"No logs for run with ID '{job_id}'."}, 404)
+    # Answering a Range reads the output so far
+    start, end, follow, status, headers, error = await run_in_threadpool(
+        parse_logs_request,
+        run_log,
+        request.query_params,
+        parse_range_header(request.headers.get("range")),
+    )
+    if error:
+        return JSONResponse({"error": error}, status, headers=headers)
+
+    if isinstance(run_log.submitted_run, SSAMSubmittedRun):
+        chunks = _iter_ssam_log_bytes(
+            request.app.state.ssam_client, run_log, start, end, follow
+        )
+    else:
+        # Other executors don't have an async client, use the blocking path
+        chunks = iterate_in_threadpool(run_log.iter_bytes(start, end, follow=follow))
+    headers["Vary"] = "Accept-Encoding"
+    accepted = parse_accept_header(request.headers.get("accept-encoding"))
+    if status == 200 and accepted["gzip"]:
+        headers["Content-Encoding"] = "gzip"
+        chunks = _gzip_chunks(chunks)
+    return StreamingResponse(
+        chunks, status_code=status, headers=headers, media_type="text/plain"
+    )
+
+
+async def _iter_ssam_log_bytes(ssam_client, run_log, start, end, follow):
+    """
+    RunLog.iter_bytes for an SSAM run, reading its output with ssam_client.
+    SSAM runs don't rotate their output, so it always starts at 0
+    """
+    submitted_run = run_log.submitted_run
+    char_pos, byte_pos = await run_in_threadpool(run_log._seek, start)
+    terminated = False
+    while True:
+        text = await ssam_client.read_logs(submitted_run, char_pos, run_log.chunk_size)
+        if text:
+            chunk_start = byte_pos
+            # RunLog's lock can be held through a blocking read by size()
+            chunk, char_pos, byte_pos = await run_in_threadpool(
+                run_log._advance, text, char_pos, byte_pos
+            )
+            chunk = run_log._clip(chunk, chunk_start, start, end)
+            if chunk:
+                yield chunk
+            if end is not None and byte_pos >= end:
+                return
+            continue
+        if not follow or terminated:
+            return
+        # A status SSAM couldn't be asked for leaves the last known one, so
+        # only a job SSAM says is over or gone ends the stream
+        await ssam_client.get_status(submitted_run)
+        if run_logs._is_terminated_or_gone(submitted_run.last_known_status):
+            # One more read picks up the last of the output
+            terminated = True
+            continue
+        await asyncio.sleep(run_logs.LOG_FOLLOW_INTERVAL)
+
+
+async def _gzip_chunks(chunks):
+    """
+    Async version of gateway_api.gzip_chunks
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+@instrumented("/api/jobs/<job_id>")
+@after_startup
+async def delete_job(request):
+    _, error = await authenticate(request)
+    if error:
+        return error
+    gateway_server = request.app.state.gateway_server
+    result = await run_in_threadpool(
+        gateway_server.delete, request.path_params["job_id"]
+    )
+    if isinstance(result, tuple) and len(result) == 2:
+        response, status_code = result
+        return JSONResponse(response, status_code)
+    return JSONResponse(result)
+
+
+def create_asgi_app(flask_app=None):
+    """
+    :param flask_app: Flask app to serve the remaining routes, created with
+                      create_app() if not given
+    """
+    if flask_app is None:
+        from .app import create_app
+
+        flask_app = create_app()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        app.state.ssam_client = AsyncSSAMClient()
+        try:
+            yield
+        finally:
+            await app.state.ssam_client.aclose()
+
+    app = Starlette(
+        routes=[
+            Route("/api/jobs", list_jobs, methods=["GET"]),
+            Route("/api/jobs/{job_id}", show_job, methods=["GET"]),
+            Route("/api/jobs/{job_id}", delete_job, methods=["DELETE"]),
+            Route("/api/jobs/{job_id}/wait", wait_job, methods=["GET"]),
+            Route("/api/jobs/{job_id}/logs", job_logs, methods=["GET"]),
+            Mount("/", app=WSGIMiddleware(flask_app)),
+        ],
+        lifespan=lifespan,
+    )
+    app.state.flask_app = flask_app
+    app.state.gateway_server = flask_app.extensions["mltf_gateway"]
+    app.state.startup = flask_app.extensions["mltf_startup"]
+    app.state.startup_timeout = int(os.environ.get("MLTF_STARTUP_TIMEOUT", 30))
+    return app
+
+
+def run_asgi_server(host, port, workers=1, graceful_timeout=60):
+    """
+    :param workers: Number of worker processes
+    :param graceful_timeout: Seconds in-flight requests get to finish on shutdown
+    """
+    import uvicorn
+
+    from .production import check_worker_count
+
+    check_worker_count(workers)
+    uvicorn.run(
+        "mltf_gateway.flaskapp.asgi:create_asgi_app",
+        factory=True,
+        host=host,
+        port=port,
+        workers=workers,
+        timeout_graceful_shutdown=graceful_timeout,
+    )
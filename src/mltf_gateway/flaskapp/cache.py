@@ -0,0 +1,121 @@
+"""
+Small in-memory caches shared by the request handlers
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLLRUCache:
+    """
+    Thread-safe LRU cache where every entry also carries its own expiration
+    time. Once maxsize is reached, the least recently used entry is evicted.
+
+    Expired entries are dropped when they are looked up, and writes also sweep
+    the whole cache for expired entries every sweep_interval seconds, so
+    entries that are never read again don't linger until they are evicted
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, sweep_interval=60):
+        """
+        :param maxsize: Maximum number of entries kept
+        :param ttl: Default lifetime of an entry in seconds
+        :param sweep_interval: Minimum seconds between full expiry sweeps
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_sweep = time.time() + sweep_interval
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def set(self, key, value, expires_at=None):
+        """
+        Store a value until expires_at (a unix timestamp), or for the default
+        TTL if not given
+        """
+        now = time.time()
+        if expires_at is None:
+            expires_at = now + self.ttl
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def sweep(self):
+        """
+        Drop every expired entry
+        :return: The number of entries dropped
+        """
+        with self._lock:
+            return self._sweep(time.time())
+
+    def _sweep(self, now):
+        expired = [k for k, (_, expires_at) in self._data.items() if expires_at <= now]
+        for k in expired:
+            del self._data[k]
+        self.expirations += len(expired)
+        self._next_sweep = now + self.sweep_interval
+        return len(expired)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        """
+        Drop every entry. The counts are running totals for the life of the
+        process, exported as counters, so they are kept
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+def token_cache_key(token):
+    """
+    Key for caching something per access token, without keeping the usable
+    token itself in memory
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
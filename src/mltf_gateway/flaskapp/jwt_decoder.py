@@ -1,14 +1,141 @@
+import logging
+import os
+import threading
+import time
+
 import jwt
+import requests
 from flask import abort
-from jwt import PyJWKClient
+from jwt import PyJWKSet
 
 from .constants import OAUTH2_CONFIG
 
+logger = logging.getLogger(__name__)
+
 jwks_url = OAUTH2_CONFIG["jwks_url"]
 issuer = OAUTH2_CONFIG["issuer"]
 audience = OAUTH2_CONFIG["client_id"]
 
-jwks_client = PyJWKClient(jwks_url)
+
+class JWKSKeyCache:
+    """
+    Signing keys from the identity provider's JWKS endpoint, indexed by kid.
+
+    start() fetches the key set from a background thread and then refreshes it
+    every refresh_interval seconds, so requests normally never wait on keycloak.
+    A token with an unknown kid (e.g. right after a key rotation) triggers a
+    refetch, but concurrent misses share that one fetch and refetches are
+    limited to one per min_refetch_interval seconds.
+    """
+
+    def __init__(self, url, refresh_interval=3600, min_refetch_interval=30, timeout=10):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._last_fetch = None
+        self._fetch_lock = threading.Lock()
+        self._inflight = None
+        self._stop = threading.Event()
+        self._thread = None
+        # Set once a key set has been fetched
+        self.loaded = threading.Event()
+
+    def refresh(self):
+        """
+        Fetch the key set and atomically replace the cached keys
+        """
+        self._last_fetch = time.monotonic()
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        key_set = PyJWKSet.from_dict(response.json())
+        self._keys = {k.key_id: k for k in key_set.keys if k.key_id}
+        self.loaded.set()
+        logger.debug(f"Loaded {len(self._keys)} signing keys from {self.url}")
+
+    def _refetch(self):
+        """
+        Refresh on behalf of a request, sharing one fetch between concurrent
+        callers
+        """
+        with self._fetch_lock:
+            inflight = self._inflight
+            if inflight is None:
+                if (
+                    self._last_fetch is not None
+                    and time.monotonic() - self._last_fetch < self.min_refetch_interval
+                ):
+                    return
+                inflight = self._inflight = threading.Event()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            inflight.wait(self.timeout)
+            return
+        try:
+            self.refresh()
+        finally:
+            with self._fetch_lock:
+                self._inflight = None
+            inflight.set()
+
+    def get_signing_key(self, kid):
+        key = self._keys.get(kid)
+        if key is None:
+            self._refetch()
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unable to find a signing key for kid {kid}")
+        return key
+
+    def get_signing_key_from_jwt(self, token):
+        header = jwt.get_unverified_header(token)
+        return self.get_signing_key(header.get("kid"))
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+                wait = self.refresh_interval
+            except Exception as e:
+                logger.warning(f"Failed to fetch signing keys from {self.url}: {e}")
+                wait = self.min_refetch_interval
+            self._stop.wait(wait)
+
+    def start(self):
+        """
+        Warm the cache and keep it fresh from a background thread. Idempotent
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._refresh_loop, name="jwks-refresh", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def warm(self):
+        """
+        start(), then wait for the first key set
+        :raises TimeoutError: if it isn't fetched within timeout seconds
+        """
+        self.start()
+        if not self.loaded.wait(self.timeout):
+            raise TimeoutError(f"No signing keys from {self.url} yet")
+
+
+jwks_client = JWKSKeyCache(
+    jwks_url, refresh_interval=int(os.environ.get("MLTF_JWKS_REFRESH_INTERVAL", 3600))
+)
 
 
 def decode(token):
@@ -0,0 +1,63 @@
+"""
+Serve the gateway with gunicorn instead of Flask's development server.
+
+Each worker process builds its own app and GatewayServer. They stay consistent
+through the shared run database (see gateway_server.locked_run_database) and
+the shared staging directory (MLTF_STAGING_DIR). On SIGTERM gunicorn stops
+accepting connections and gives in-flight requests, e.g. tarball uploads,
+graceful_timeout seconds to finish.
+"""
+
+import os
+
+from gunicorn.app.base import BaseApplication
+
+
+class GatewayApplication(BaseApplication):
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        # Imported here so every worker builds its own app after forking,
+        # rather than sharing threads and connections made in the master
+        from mltf_gateway.flaskapp.app import create_app
+
+        return create_app()
+
+
+def check_worker_count(workers):
+    executor_name = os.environ.get("MLTF_EXECUTOR", "ssam")
+    if workers > 1 and executor_name == "local":
+        raise ValueError(
+            "The local executor runs jobs as children of the worker that "
+            "accepted them, so it can't be used with more than one worker"
+        )
+
+
+def run_production_server(
+    host, port, workers=1, threads=1, graceful_timeout=60, timeout=300
+):
+    """
+    :param workers: Number of worker processes
+    :param threads: Number of request threads per worker
+    :param graceful_timeout: Seconds in-flight requests get to finish on shutdown
+    :param timeout: Seconds a request may take before its worker is restarted.
+                    Generous, since uploads can be large
+    """
+    check_worker_count(workers)
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread" if threads > 1 else "sync",
+        "graceful_timeout": graceful_timeout,
+        "timeout": timeout,
+        "accesslog": "-",
+    }
+    GatewayApplication(options).run()
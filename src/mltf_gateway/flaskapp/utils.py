@@ -1,3 +1,4 @@
+import os
 import secrets
 import time
 from functools import wraps
@@ -7,6 +8,7 @@ import requests
 from flask import current_app, session, abort, request, g, jsonify
 from flask_login import login_user
 
+from .cache import TTLLRUCache, token_cache_key
 from .constants import OAUTH2_CONFIG
 from .extensions import db
 from .jwt_decoder import decode
@@ -126,13 +128,17 @@ def get_auth_token(client_id, code, token_url, redirect_uri) -> dict:
 
 
 # Cache userinfo responses per token
-_userinfo_cache = {}
+USERINFO_TTL = 300
+_userinfo_cache = TTLLRUCache(
+    maxsize=int(os.environ.get("MLTF_USERINFO_CACHE_SIZE", 1024)), ttl=USERINFO_TTL
+)
 
 
 def get_userinfo(token):
-    cached = _userinfo_cache.get(token)
-    if cached and cached["expires_at"] > time.time():
-        return cached["data"]
+    key = token_cache_key(token)
+    cached = _userinfo_cache.get(key)
+    if cached is not None:
+        return cached
 
     resp = requests.get(
         OAUTH2_CONFIG["userinfo"]["url"],
@@ -144,10 +150,89 @@ def get_userinfo(token):
 
     data = resp.json()
     # Assume provider includes exp in token response or use a TTL (e.g. 5 min)
-    _userinfo_cache[token] = {"data": data, "expires_at": time.time() + 300}
+    _userinfo_cache.set(key, data)
     return data
 
 
+# Verified token claims, keyed by a digest of the token so the cache never holds
+# usable credentials. Entries expire a little before the token itself does
+_verified_token_cache = TTLLRUCache(
+    maxsize=int(os.environ.get("MLTF_TOKEN_CACHE_SIZE", 4096))
+)
+TOKEN_CACHE_EXPIRY_MARGIN = 30
+
+
+def decode_cached(token):
+    """
+    Like jwt_decoder.decode, but skips the signature check for tokens that
+    were already verified and haven't (nearly) expired
+    """
+    key = token_cache_key(token)
+    decoded = _verified_token_cache.get(key)
+    if decoded is not None:
+        return decoded
+
+    decoded = decode(token)
+    if decoded and "exp" in decoded:
+        expires_at = decoded["exp"] - TOKEN_CACHE_EXPIRY_MARGIN
+        if expires_at > time.time():
+            _verified_token_cache.set(key, decoded, expires_at=expires_at)
+    return decoded
+
+
+def get_cache_stats():
+    return {
+        "verified_tokens": _verified_token_cache.stats(),
+        "userinfo": _userinfo_cache.stats(),
+    }
+
+
+def get_bearer_token(headers, args):
+    """
+    Pull the access token from an 'Authorization: Bearer <token>' header, or
+    the ?access_token=... query parameter
+    """
+    auth_header = headers.get("Authorization", "")
+    if auth_header.startswith("Bearer "):
+        return auth_header.split(" ", 1)[1].strip()
+    # optional: allow ?access_token=... as a fallback
+    return args.get("access_token")
+
+
+def get_cached_claims(token):
+    """
+    :return: The claims of an already verified token, or None. Never blocks
+    """
+    return _verified_token_cache.get(token_cache_key(token))
+
+
+def authenticate_token(token, decoded=None):
+    """
+    Verify a token independent of the web framework serving the request
+    :param decoded: Claims already verified by the caller, if any
+    :return: (user, None) on success, otherwise (None, error message)
+    """
+    if not token:
+        return None, "Missing access token"
+
+    if decoded is None:
+        try:
+            decoded = decode_cached(token)
+        except Exception as e:
+            return None, str(e)
+    if not decoded:
+        return None, "Invalid or expired token"
+
+    # optionally, you could also create a User object in the DB here
+    # and associate the token with that user
+    user = {
+        "email": decoded.get("email", "NA"),
+        "username": decoded.get("name", "NA"),
+        "runtime_token": token,
+    }
+    return user, None
+
+
 def require_oauth_token(f):
     """
     Decorator to protect API endpoints with a valid OAuth2 access token.
@@ -156,32 +241,13 @@ def require_oauth_token(f):
 
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        auth_header = request.headers.get("Authorization", "")
-        token = None
-        if auth_header.startswith("Bearer "):
-            token = auth_header.split(" ", 1)[1].strip()
-        elif "access_token" in request.args:
-            # optional: allow ?access_token=... as a fallback
-            token = request.args.get("access_token")
-
-        if not token:
-            return jsonify({"error": "Missing access token"}), 401
-
-        try:
-            decoded = decode(token)
-            if not decoded:
-                return jsonify({"error": "Invalid or expired token"}), 401
-        except Exception as e:
-            return jsonify({"error": str(e)}), 401
+        token = get_bearer_token(request.headers, request.args)
+        user, error = authenticate_token(token)
+        if error:
+            return jsonify({"error": error}), 401
 
         # make g.user available in the endpoint
-        # optionally, you could also create a User object in the DB here
-        # and associate the token with that user
-        g.user = {
-            "email": decoded.get("email", "NA"),
-            "username": decoded.get("name", "NA"),
-            "runtime_token": token,
-        }
+        g.user = user
 
         return f(*args, **kwargs)
 
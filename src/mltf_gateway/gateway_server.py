@@ -1,11 +1,20 @@
+import contextlib
 import functools
+import hashlib
 import logging
 import os
 import pickle
 import shlex
 import tempfile
+import threading
 import uuid
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from mltf_gateway import metrics, tracing
 from mltf_gateway.data_classes import (
     MovableFileReference,
     RunReference,
@@ -15,6 +24,8 @@ from mltf_gateway.executors.base import get_script, ExecutorBase
 from mltf_gateway.executors.local_executor import LocalExecutor
 from mltf_gateway.executors.slurm_executor import SLURMExecutor
 from mltf_gateway.executors.ssam_executor import SSAMExecutor
+from mltf_gateway.run_log import RunLog
+from mltf_gateway.run_registry import RunRegistry
 from mltf_gateway.submitted_runs.server_run import (
     ServerSideSubmittedRunDescription,
 )
@@ -28,8 +39,42 @@ RUN_DATABASE = "gateway_run_db.pkl"
 
 
 def persist_runs(runs):
-    with open(RUN_DATABASE, "wb") as f:
+    # Write then rename, so other processes never read a half-written file
+    db_dir = os.path.dirname(os.path.abspath(RUN_DATABASE))
+    with tempfile.NamedTemporaryFile(
+        "wb", dir=db_dir, prefix=".run_db-", delete=False
+    ) as f:
         pickle.dump(runs, f)
+    os.replace(f.name, RUN_DATABASE)
+
+
+def run_database_signature():
+    """
+    :return: Something that changes whenever the run database is rewritten, or
+             None if there isn't one yet
+    """
+    try:
+        st = os.stat(RUN_DATABASE)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+@contextlib.contextmanager
+def locked_run_database():
+    """
+    Serialize read-modify-write cycles of the run database between processes,
+    e.g. the workers of a multi-worker server
+    """
+    if fcntl is None:  # pragma: no cover
+        yield
+        return
+    with open(f"{RUN_DATABASE}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 def unpersist_runs():
@@ -61,7 +106,7 @@ class GatewayServer:
     them via plugabble executors
     """
 
-    runs: list[ServerSideSubmittedRunDescription]
+    registry: RunRegistry
 
     def __init__(
         self,
@@ -71,25 +116,97 @@ class GatewayServer:
         inside_script="",
         outside_script="",
         tracking_server="",
+        lazy=False,
     ):
-        if executor:
-            self.executor = executor
-        else:
-            if executor_name == "local":
-                self.executor = LocalExecutor()
-            elif executor_name == "slurm":
-                self.executor = SLURMExecutor()
-            elif executor_name == "ssam":
-                self.executor = SSAMExecutor()
-            else:
-                raise ValueError(f"Unknown executor: {executor_name}")
+        """
+        :param lazy: Don't build the executor or load the run database yet.
+                     The caller must call init_executor() and load_runs()
+                     (e.g. from background threads) before using the server
+        """
+        if executor_name not in ("local", "slurm", "ssam"):
+            raise ValueError(f"Unknown executor: {executor_name}")
+        self.executor_name = executor_name
+        self.executor = executor
         self.inside_script = inside_script or "inside.sh"
         self.outside_script = outside_script or "outside.sh"
         self.tracking_server = tracking_server or get_tracking_uri()
+        # Where uploads and per-run scripts are written. Multi-worker servers
+        # need it shared between workers
+        self.staging_dir = os.environ.get("MLTF_STAGING_DIR") or tempfile.gettempdir()
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+        # Runs we know about, persisted to RUN_DATABASE
+        self._runs_signature = None
+        self.registry = RunRegistry()
+        # RunLogs by run ID, kept so their byte offset mappings carry over
+        # from one log request to the next
+        self._run_logs = {}
+        self._run_logs_lock = threading.Lock()
+        if not lazy:
+            self.init_executor()
+            self.load_runs()
+
+    def init_executor(self):
+        """
+        Build the executor named by executor_name, unless one was passed in
+        """
+        if self.executor is not None:
+            return
+        if self.executor_name == "local":
+            self.executor = LocalExecutor()
+        elif self.executor_name == "slurm":
+            self.executor = SLURMExecutor()
+        else:
+            self.executor = SSAMExecutor()
+
+    def load_runs(self):
+        """
+        Load the runs persisted to RUN_DATABASE
+        """
+        with self.registry.write_lock():
+            self._runs_signature = run_database_signature()
+            self.registry.replace(unpersist_runs())
 
-        # List of runs we know about
-        # Should be persisted to a database
-        self.runs = unpersist_runs()
+    @property
+    def runs(self) -> list[ServerSideSubmittedRunDescription]:
+        """Snapshot of the runs we know about"""
+        return list(self.registry.snapshot())
+
+    @runs.setter
+    def runs(self, runs):
+        self.registry.replace(runs)
+
+    def sync_runs(self):
+        """
+        Pick up runs added or deleted by other processes sharing the run
+        database. Runs this process already knows keep their in-memory state
+        """
+        if run_database_signature() == self._runs_signature:
+            return
+        with self.registry.write_lock():
+            self._sync_runs_locked()
+
+    def _sync_runs_locked(self):
+        signature = run_database_signature()
+        if signature == self._runs_signature:
+            return
+        self.registry.update(
+            lambda runs: [
+                self.registry.get(r.gateway_id) or r for r in unpersist_runs()
+            ]
+        )
+        self._runs_signature = signature
+
+    def update_runs(self, update):
+        """
+        Apply update (list of runs -> new list of runs) to the latest
+        persisted runs and persist the result, atomically with respect to
+        other threads and processes
+        """
+        with self.registry.write_lock(), locked_run_database():
+            self._sync_runs_locked()
+            persist_runs(list(self.registry.update(update)))
+            self._runs_signature = run_database_signature()
 
     def get_health(self):
         if hasattr(self.executor, "get_health"):
@@ -97,6 +214,42 @@ class GatewayServer:
         else:
             return {}
 
+    def count_runs_by_state(self):
+        """
+        Count runs by their last known status, without asking the executor
+        :return: dict of status string to number of runs
+        """
+        from mlflow.entities import RunStatus
+
+        counts = {}
+        for r in self.registry.snapshot():
+            status = getattr(r.submitted_run, "last_known_status", None)
+            if status is None:
+                state = "UNKNOWN"
+            elif isinstance(status, str):
+                state = status
+            else:
+                state = RunStatus.to_string(status)
+            counts[state] = counts.get(state, 0) + 1
+        return counts
+
+    def get_staging_usage(self):
+        """
+        :return: (number of files, total bytes) in the staging directory
+        """
+        files = 0
+        size = 0
+        with os.scandir(self.staging_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        files += 1
+                        size += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    # Removed while we were looking
+                    continue
+        return files, size
+
     def list(self, list_all, user_subject):
         """
         Returns runs this server is aware of belonging to a given user_subject
@@ -105,9 +258,9 @@ class GatewayServer:
         :return: list of GatewaySubmittedRun
         """
         # FIXME support filtering jobs based on list_all param
+        self.sync_runs()
         ret = []
-        for idx in range(len(self.runs)):
-            r = self.runs[idx]
+        for r in self.registry.snapshot():
             if r.run_desc.user_subject != user_subject:
                 continue
             ret.append(r.to_client_json())
@@ -121,16 +274,14 @@ class GatewayServer:
         :param ref: Integer reference to the run
         :return: GatewaySubmittedRun referred to by reference
         """
-        for r in self.runs:
-            if ref.gateway_id == r.gateway_id:
-                return r
-        raise IndexError()
+        self.sync_runs()
+        run = self.registry.get(ref.gateway_id)
+        if run is None:
+            raise IndexError()
+        return run
 
     def runid_to_reference(self, run_id: int):
-        for run in self.runs:
-            if run.gateway_id == run_id:
-                return run
-        raise IndexError()
+        return self.reference_to_run(RunReference(run_id))
 
     def run_to_reference(self, run: ServerSideSubmittedRunDescription) -> RunReference:
         """
@@ -161,16 +312,26 @@ class GatewayServer:
         run_ref = RunReference(run_id)
         return self.get_status(run_ref)
 
-    def show_details(self, run_id: str, show_logs: bool):
-        """Get details of a run."""
+    def show_details(self, run_id: str, show_logs: bool, log_offset: int = 0):
+        """
+        Get details of a run.
+        :param run_id: Gateway ID of the run
+        :param show_logs: If true, include the run's logs
+        :param log_offset: Only return logs past this offset, so clients can tail
+        """
         run_ref = RunReference(run_id)
         try:
             submitted_run = self.reference_to_run(run_ref).submitted_run
         except IndexError:
             return {"error": f"Run with ID '{run_id}' not found."}, 404
 
+        # Finished runs don't change, no need to ask the executor again
+        if hasattr(submitted_run, "final_run_details"):
+            details = submitted_run.final_run_details(show_logs, log_offset)
+            if details is not None:
+                return details
         if hasattr(submitted_run, "get_run_details"):
-            return submitted_run.get_run_details(show_logs)
+            return submitted_run.get_run_details(show_logs, log_offset=log_offset)
         else:
             # Fallback for other run types
             status = submitted_run.get_status()
@@ -179,17 +340,96 @@ class GatewayServer:
             # return {"status": RunStatus.to_string(status)}
             return {"status": status}
 
+    def get_run_log(self, run_id: str):
+        """
+        :return: RunLog to stream the run's output from, or None if the run
+                 doesn't exist or its executor can't stream output
+        """
+        try:
+            run = self.reference_to_run(RunReference(run_id))
+        except IndexError:
+            # Possibly deleted by another worker
+            with self._run_logs_lock:
+                self._run_logs.pop(run_id, None)
+            return None
+        submitted_run = run.submitted_run
+        if not hasattr(submitted_run, "read_logs"):
+            return None
+        with self._run_logs_lock:
+            run_log = self._run_logs.get(run_id)
+            if run_log is None or run_log.submitted_run is not submitted_run:
+                run_log = self._run_logs[run_id] = RunLog(submitted_run)
+            return run_log
+
+    def list_etag(self, user_subject):
+        """
+        ETag for list(user_subject). Take it before listing, so the response
+        is never older than its tag
+        """
+        self.sync_runs()
+        user = hashlib.sha256(user_subject.encode("utf-8")).hexdigest()[:12]
+        return f"{user}-{self.registry.user_digest(user_subject)}"
+
+    def details_etag(self, run_id, details, show_logs, log_offset=0):
+        """
+        ETag for details just returned by show_details(). Derived from the
+        details alone, so it's the same whichever worker answers
+        """
+        fingerprint = repr((str(details.get("status")), details.get("failure_reason")))
+        digest = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:12]
+        etag = f"{run_id}-{digest}"
+        if show_logs:
+            etag += f"-{log_offset}-{details.get('log_offset')}"
+        return etag
+
+    def final_details_etag(self, run_id, show_logs, log_offset=0):
+        """
+        ETag for show_details() of a run whose details can't change anymore,
+        worked out without asking the executor
+        :return: The ETag, or None if the run could still change
+        """
+        try:
+            run = self.reference_to_run(RunReference(run_id))
+        except IndexError:
+            return None
+        final_run_details = getattr(run.submitted_run, "final_run_details", None)
+        if final_run_details is None:
+            return None
+        details = final_run_details(show_logs, log_offset)
+        if details is None:
+            return None
+        return self.details_etag(run_id, details, show_logs, log_offset)
+
     def delete(self, run_id: str):
         """Delete a run."""
         run_ref = RunReference(run_id)
+        # Concurrent deletes of the same run cancel it once, while other runs
+        # can be deleted in parallel
         try:
-            run_to_delete = self.reference_to_run(run_ref)
-        except IndexError:
-            return {"error": f"Run with ID '{run_id}' not found."}, 404
-
-        run_to_delete.submitted_run.cancel()
-        self.runs = [run for run in self.runs if run.gateway_id != run_id]
-        persist_runs(self.runs)
+            with self.registry.run_lock(run_id):
+                try:
+                    run_to_delete = self.reference_to_run(run_ref)
+                except IndexError:
+                    return {"error": f"Run with ID '{run_id}' not found."}, 404
+
+                submitted_run = run_to_delete.submitted_run
+                submitted_run.cancel()
+                log_archive = getattr(submitted_run, "log_archive", None)
+                if log_archive is not None:
+                    log_archive.remove(run_id)
+                # Files the executor keeps for the run, e.g. a local run's
+                # state directory
+                cleanup = getattr(submitted_run, "cleanup", None)
+                if cleanup is not None:
+                    cleanup()
+                self.update_runs(
+                    lambda runs: [run for run in runs if run.gateway_id != run_id]
+                )
+                with self._run_logs_lock:
+                    self._run_logs.pop(run_id, None)
+        finally:
+            # Also for unknown IDs, or clients could grow the lock table forever
+            self.registry.forget_run_lock(run_id)
 
         return {"run_id": run_id, "message": "Job deleted successfully"}
 
@@ -233,24 +473,35 @@ class GatewayServer:
             user_subj,
         )
 
-        # FIXME generate command line and environment source script and pass here
-        exec_context = self.get_execution_snippet(
-            run_desc,
-            self.inside_script,
-            self.outside_script,
-            runtime_token,
-        )
-
-        gateway_id = str(uuid.uuid1())
-        async_req = self.executor.run_context_async(exec_context, run_desc, gateway_id)
-        run = ServerSideSubmittedRunDescription(run_desc, async_req, gateway_id)
-        self.runs.append(run)
-        persist_runs(self.runs)
+        metrics.submissions_in_progress.inc()
+        try:
+            # FIXME generate command line and environment source script and pass here
+            with metrics.submit_duration.time(stage="prepare"):
+                exec_context = self.get_execution_snippet(
+                    run_desc,
+                    self.inside_script,
+                    self.outside_script,
+                    runtime_token,
+                )
+
+            gateway_id = str(uuid.uuid1())
+            with metrics.submit_duration.time(stage="executor"), tracing.span(
+                "run_context_async", gateway_id=gateway_id
+            ):
+                async_req = self.executor.run_context_async(
+                    exec_context, run_desc, gateway_id
+                )
+            run = ServerSideSubmittedRunDescription(run_desc, async_req, gateway_id)
+            with metrics.submit_duration.time(stage="persist"):
+                self.update_runs(lambda runs: runs + [run])
+        finally:
+            metrics.submissions_in_progress.dec()
         return run
 
     # See docs for RunReference for an explanation
     enqueue_run_client = return_id_decorator(enqueue_run)
 
+    @tracing.traced()
     def get_execution_snippet(
         self,
         run_desc,
@@ -290,7 +541,7 @@ class GatewayServer:
             )
 
         env_vars.append(f"export MLFLOW_TRACKING_URI={shlex.quote(tracking_uri)}")
-        with tempfile.NamedTemporaryFile(delete=False) as f:
+        with tempfile.NamedTemporaryFile(delete=False, dir=self.staging_dir) as f:
             input_files["mltf_env.sh"] = MovableFileReference(f.name)
             for x in env_vars:
                 f.write(x.encode("utf-8"))
@@ -298,7 +549,7 @@ class GatewayServer:
             f.flush()
             f.close()
 
-        with tempfile.NamedTemporaryFile(delete=False) as f:
+        with tempfile.NamedTemporaryFile(delete=False, dir=self.staging_dir) as f:
             input_files["mltf_cmd.sh"] = MovableFileReference(f.name)
             cmdline = ""
             if run_desc.run_id not in ("", "UNKNOWN"):
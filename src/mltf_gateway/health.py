@@ -0,0 +1,145 @@
+"""
+Background health checks for the gateway server.
+
+Load balancers poll /healthz and /readyz often, so those never probe
+anything themselves. HealthProber runs the checks from a background thread
+every interval seconds and the routes serve the last snapshot.
+
+Liveness (/healthz) only says the process is serving requests. Readiness
+(/readyz) says whether it should get traffic: every check passed, and the
+snapshot is recent enough to trust.
+"""
+
+import logging
+import shutil
+import threading
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class HealthProber:
+    def __init__(
+        self,
+        gateway_server,
+        interval=30,
+        min_free_bytes=1024**3,
+        max_submissions_in_progress=64,
+    ):
+        """
+        :param gateway_server: GatewayServer to check
+        :param interval: Seconds between probes
+        :param min_free_bytes: Not ready if the staging filesystem has less free space
+        :param max_submissions_in_progress: Not ready if more submissions than
+                                            this are waiting on the executor
+        """
+        self.gateway_server = gateway_server
+        self.interval = interval
+        self.min_free_bytes = min_free_bytes
+        self.max_submissions_in_progress = max_submissions_in_progress
+        self._snapshot = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check_executor(self):
+        health = self.gateway_server.get_health()
+        # Executors without health checks are assumed fine
+        return {"ok": health.get("ok", True), **health}
+
+    def check_staging(self):
+        staging_dir = self.gateway_server.staging_dir
+        free = shutil.disk_usage(staging_dir).free
+        files, size = self.gateway_server.get_staging_usage()
+        return {
+            "ok": free >= self.min_free_bytes,
+            "free_bytes": free,
+            "files": files,
+            "bytes": size,
+        }
+
+    def check_queue(self):
+        in_progress = metrics.submissions_in_progress.get()
+        runs = self.gateway_server.count_runs_by_state()
+        return {
+            "ok": in_progress <= self.max_submissions_in_progress,
+            "submissions_in_progress": in_progress,
+            "scheduled_runs": runs.get("SCHEDULED", 0),
+            "runs": runs,
+        }
+
+    def probe(self):
+        """
+        Run every check now and publish the result
+        :return: The new snapshot
+        """
+        checks = {}
+        for name, check in (
+            ("executor", self.check_executor),
+            ("staging", self.check_staging),
+            ("queue", self.check_queue),
+        ):
+            start = time.perf_counter()
+            try:
+                result = check()
+            except Exception as e:
+                logger.warning(f"Health check {name} failed: {e}")
+                result = {"ok": False, "error": str(e)}
+            result["duration_seconds"] = round(time.perf_counter() - start, 4)
+            checks[name] = result
+
+        snapshot = {
+            "ok": all(c["ok"] for c in checks.values()),
+            "checked_at": time.time(),
+            "checks": checks,
+        }
+        # Published with one assignment, so readers never need a lock
+        self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self):
+        """
+        :return: The last published snapshot, or None before the first probe
+        """
+        return self._snapshot
+
+    def is_ready(self):
+        """
+        :return: (ready, reason)
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return False, "starting"
+        if time.time() - snapshot["checked_at"] > 3 * self.interval:
+            return False, "health snapshot is stale"
+        if not snapshot["ok"]:
+            failed = [k for k, v in snapshot["checks"].items() if not v["ok"]]
+            return False, f"failing checks: {', '.join(failed)}"
+        return True, "ok"
+
+    def _probe_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.probe()
+            except Exception as e:
+                logger.warning(f"Health probe failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """
+        Probe from a background thread until stop(). Idempotent
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._probe_loop, name="health-prober", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
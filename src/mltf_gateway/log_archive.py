@@ -0,0 +1,258 @@
+"""
+On-disk archive of the final output of terminated runs.
+
+Once a job is terminated its output can't change, so it is written here once,
+gzipped and keyed by gateway ID. Later log reads, including after the gateway
+restarts and its in-memory log caches are gone, are served from the archive
+without asking the executor again. Old entries are pruned by age and by the
+total size of the archive.
+
+The output is compressed in blocks of LOG_ARCHIVE_BLOCK_SIZE characters, each
+its own gzip member, and a small index next to it records where each member
+starts. Reading from any offset only decompresses the block it falls in
+onwards, so nothing ever needs the whole output in memory.
+"""
+
+import codecs
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the retention limits
+LOG_ARCHIVE_MAX_AGE = 30 * 24 * 3600
+LOG_ARCHIVE_MAX_BYTES = 1024**3
+# Characters per gzip member, i.e. most that is decompressed to reach an offset
+LOG_ARCHIVE_BLOCK_SIZE = 1024**2
+# Bytes decompressed at a time while reading
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class LogArchive:
+    """
+    Gzipped run output in a directory, one file per gateway ID. Writes are
+    atomic and nothing is held open, so it can be shared between the workers
+    of a multi-worker server and pickled along with the runs that use it
+    """
+
+    SUFFIX = ".log.gz"
+    INDEX_SUFFIX = ".log.idx"
+
+    def __init__(
+        self,
+        directory,
+        max_age=LOG_ARCHIVE_MAX_AGE,
+        max_bytes=LOG_ARCHIVE_MAX_BYTES,
+        block_size=LOG_ARCHIVE_BLOCK_SIZE,
+    ):
+        """
+        :param max_age: Seconds an entry is kept for, or 0 to keep it forever
+        :param max_bytes: Total (compressed) size of the archive to stay under,
+                          oldest entries are removed first. 0 means no limit
+        :param block_size: Characters compressed into each gzip member
+        """
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+
+    @classmethod
+    def from_environ(cls):
+        """
+        Build the archive from MLTF_LOG_ARCHIVE_DIR (by default log-archive in
+        the staging directory), MLTF_LOG_ARCHIVE_MAX_AGE and
+        MLTF_LOG_ARCHIVE_MAX_BYTES
+        """
+        directory = os.environ.get("MLTF_LOG_ARCHIVE_DIR") or os.path.join(
+            os.environ.get("MLTF_STAGING_DIR") or tempfile.gettempdir(),
+            "log-archive",
+        )
+        return cls(
+            directory,
+            max_age=int(
+                os.environ.get("MLTF_LOG_ARCHIVE_MAX_AGE", LOG_ARCHIVE_MAX_AGE)
+            ),
+            max_bytes=int(
+                os.environ.get("MLTF_LOG_ARCHIVE_MAX_BYTES", LOG_ARCHIVE_MAX_BYTES)
+            ),
+        )
+
+    def _path(self, gateway_id):
+        # Gateway IDs are UUIDs, but don't let anything else escape the directory
+        return os.path.join(self.directory, os.path.basename(gateway_id) + self.SUFFIX)
+
+    def _index_path(self, path):
+        return path[: -len(self.SUFFIX)] + self.INDEX_SUFFIX
+
+    def _write_atomically(self, path, write):
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=self.directory, prefix=".archive-", delete=False
+        ) as f:
+            write(f)
+        os.replace(f.name, path)
+
+    def store(self, gateway_id, text):
+        """
+        Archive the final output of a run, then prune old entries
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        offsets = []
+
+        def write_blocks(f):
+            # Always at least one member, so empty output is still an entry
+            for start in range(0, max(len(text), 1), self.block_size):
+                offsets.append(f.tell())
+                with gzip.GzipFile(
+                    fileobj=f, mode="wb", compresslevel=6, mtime=0
+                ) as gz:
+                    gz.write(text[start : start + self.block_size].encode("utf-8"))
+
+        path = self._path(gateway_id)
+        self._write_atomically(path, write_blocks)
+        index = {"length": len(text), "block_size": self.block_size, "offsets": offsets}
+        self._write_atomically(
+            self._index_path(path), lambda f: f.write(json.dumps(index).encode())
+        )
+        self.prune()
+
+    def _load_index(self, gateway_id):
+        """
+        :return: The entry's index, or None if it has none (e.g. it was archived
+                 before there were indexes)
+        """
+        try:
+            with open(self._index_path(self._path(gateway_id)), "rb") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable log index for {gateway_id}: {e}")
+            return None
+
+    @staticmethod
+    def _decode(f):
+        """
+        Decompress and decode the gzip members from f's position on
+        :return: Iterator over pieces of the text
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        with gzip.GzipFile(fileobj=f, mode="rb") as gz:
+            while True:
+                data = gz.read(READ_CHUNK_SIZE)
+                yield decoder.decode(data, final=not data)
+                if not data:
+                    return
+
+    def read(self, gateway_id, offset=0, size=None):
+        """
+        :param offset: Character offset to start reading at
+        :param size: Most characters to return, or None for the rest of the output
+        :return: The archived output of the run from offset, or None if there is none
+        """
+        index = self._load_index(gateway_id)
+        try:
+            with open(self._path(gateway_id), "rb") as f:
+                skip = offset
+                if index is not None and index["offsets"]:
+                    block = min(
+                        offset // index["block_size"], len(index["offsets"]) - 1
+                    )
+                    f.seek(index["offsets"][block])
+                    skip -= block * index["block_size"]
+                parts = []
+                for text in self._decode(f):
+                    if skip:
+                        skipped = min(skip, len(text))
+                        text = text[skipped:]
+                        skip -= skipped
+                    if size is not None:
+                        text = text[:size]
+                        size -= len(text)
+                    parts.append(text)
+                    if size == 0:
+                        break
+                return "".join(parts)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            logger.warning(f"Ignoring unreadable log archive for {gateway_id}: {e}")
+            return None
+
+    def load(self, gateway_id):
+        """
+        :return: The whole archived output of the run, or None if there is none
+        """
+        return self.read(gateway_id)
+
+    def length(self, gateway_id):
+        """
+        :return: Length in characters of the archived output of the run, or None
+                 if there is none
+        """
+        index = self._load_index(gateway_id)
+        if index is not None:
+            # The index is written after the output, but the output may
+            # have been pruned since
+            return index["length"] if os.path.exists(self._path(gateway_id)) else None
+        try:
+            with open(self._path(gateway_id), "rb") as f:
+                return sum(len(text) for text in self._decode(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            logger.warning(f"Ignoring unreadable log archive for {gateway_id}: {e}")
+            return None
+
+    def _remove_entry(self, path):
+        for p in (path, self._index_path(path)):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def remove(self, gateway_id):
+        self._remove_entry(self._path(gateway_id))
+
+    def _entries(self):
+        """
+        :return: List of (mtime, size, path) of the archived logs, oldest first
+        """
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(self.SUFFIX):
+                        continue
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        # Removed while we were looking
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        except FileNotFoundError:
+            return []
+        return sorted(entries)
+
+    def prune(self, now=None):
+        """
+        Remove entries older than max_age, then the oldest ones until the
+        archive is under max_bytes
+        :return: Number of entries removed
+        """
+        now = time.time() if now is None else now
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            expired = self.max_age and now - mtime > self.max_age
+            oversize = self.max_bytes and total > self.max_bytes
+            if not (expired or oversize):
+                break
+            self._remove_entry(path)
+            total -= size
+            removed += 1
+        return removed
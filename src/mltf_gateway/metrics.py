@@ -0,0 +1,363 @@
+"""
+Minimal Prometheus-style metrics for the gateway server.
+
+Counters, gauges and histograms are kept in-process and rendered in the
+Prometheus text exposition format by the /metrics route. Values are per
+process: with several gunicorn/uvicorn workers, a scrape reaches one of them
+and gets that worker's numbers, with a "pid" label on every sample. So each
+worker's counters are series of their own rather than jumping between
+workers' values, and e.g. sum without (pid) (rate(...)) gives gateway-wide
+rates.
+
+Values that are cheap to read but expensive to keep updated (cache hit
+rates, runs by state, staging disk usage, the local run queue) are filled in
+when /metrics is scraped. Running totals kept elsewhere, like the caches'
+hit and miss counts, are still exported as counters.
+"""
+
+import bisect
+import contextlib
+import os
+import shutil
+import threading
+import time
+
+# Request and upstream call latencies, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Upload sizes, in bytes (1 KiB .. 4 GiB)
+SIZE_BUCKETS = tuple(1024 * 4**i for i in range(12))
+# Upload throughput, in bytes per second (64 KiB/s .. 1 GiB/s)
+THROUGHPUT_BUCKETS = tuple(65536 * 2**i for i in range(15))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self, extra_labels=()):
+        """
+        :param extra_labels: (name, value) pairs added to every sample
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value, list(extra_labels)))
+        return lines
+
+    def _render_sample(self, key, value, extra_labels):
+        labels = _format_labels(self.labelnames, key, extra_labels)
+        return [f"{self.name}{labels} {_format_value(value)}"]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def set_total(self, value, **labels):
+        """
+        Set the count from a running total kept elsewhere, e.g. read at scrape
+        time. The total must never go down, or rate() sees a counter reset
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket (not cumulative), then the +Inf bucket,
+                # then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels):
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return sum(counts[:-1]) if counts else 0
+
+    def _render_sample(self, key, counts, extra_labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+            cumulative += count
+            labels = _format_labels(
+                self.labelnames,
+                key,
+                extra_labels + [("le", _format_value(float(bound)))],
+            )
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key, extra_labels)
+        lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self, extra_labels=()):
+        """
+        :param extra_labels: (name, value) pairs added to every sample
+        :return: All metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(extra_labels))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+process_info = REGISTRY.gauge("mltf_process_info", "Always 1, one series per worker")
+
+http_requests = REGISTRY.counter(
+    "mltf_http_requests_total", "HTTP requests handled", ["route", "method", "status"]
+)
+http_request_duration = REGISTRY.histogram(
+    "mltf_http_request_duration_seconds",
+    "Time spent handling HTTP requests",
+    ["route", "method"],
+)
+http_in_flight = REGISTRY.gauge(
+    "mltf_http_requests_in_flight", "HTTP requests being handled", ["route"]
+)
+
+upload_bytes = REGISTRY.counter(
+    "mltf_upload_bytes_total", "Bytes of project tarballs uploaded"
+)
+upload_size = REGISTRY.histogram(
+    "mltf_upload_size_bytes", "Size of uploaded project tarballs", buckets=SIZE_BUCKETS
+)
+upload_duration = REGISTRY.histogram(
+    "mltf_upload_duration_seconds", "Time spent receiving project tarballs"
+)
+upload_throughput = REGISTRY.histogram(
+    "mltf_upload_throughput_bytes_per_second",
+    "Rate at which project tarballs were received",
+    buckets=THROUGHPUT_BUCKETS,
+)
+
+ssam_request_duration = REGISTRY.histogram(
+    "mltf_ssam_request_duration_seconds", "Latency of calls to SSAM", ["endpoint"]
+)
+ssam_request_errors = REGISTRY.counter(
+    "mltf_ssam_request_errors_total", "Calls to SSAM that failed", ["endpoint"]
+)
+
+submissions_in_progress = REGISTRY.gauge(
+    "mltf_submissions_in_progress",
+    "Submissions accepted but not yet handed to the executor",
+)
+submit_duration = REGISTRY.histogram(
+    "mltf_submit_stage_duration_seconds",
+    "Time spent in each stage of a submission",
+    ["stage"],
+)
+
+cache_hits = REGISTRY.counter(
+    "mltf_cache_hits_total", "Cache lookups that hit", ["cache"]
+)
+cache_misses = REGISTRY.counter(
+    "mltf_cache_misses_total", "Cache lookups that missed", ["cache"]
+)
+cache_hit_ratio = REGISTRY.gauge(
+    "mltf_cache_hit_ratio", "Fraction of cache lookups that hit", ["cache"]
+)
+cache_entries = REGISTRY.gauge("mltf_cache_entries", "Entries in the cache", ["cache"])
+
+runs_by_state = REGISTRY.gauge(
+    "mltf_runs", "Runs known to the gateway, by last known state", ["state"]
+)
+staging_files = REGISTRY.gauge("mltf_staging_files", "Files in the staging directory")
+staging_bytes = REGISTRY.gauge(
+    "mltf_staging_bytes", "Bytes used by files in the staging directory"
+)
+staging_free_bytes = REGISTRY.gauge(
+    "mltf_staging_free_bytes", "Free space on the staging directory's filesystem"
+)
+local_queue_depth = REGISTRY.gauge(
+    "mltf_local_queue_depth", "Local runs waiting for room on the machine to start"
+)
+
+
+def collect_server_metrics(gateway_server, cache_stats):
+    """
+    Fill in the gauges that are only computed at scrape time
+    :param cache_stats: dict of cache name to TTLLRUCache.stats()
+    """
+    process_info.set(1)
+    for name, stats in cache_stats.items():
+        cache_hits.set_total(stats["hits"], cache=name)
+        cache_misses.set_total(stats["misses"], cache=name)
+        cache_hit_ratio.set(stats["hit_rate"] or 0, cache=name)
+        cache_entries.set(stats["size"], cache=name)
+
+    runs_by_state.clear()
+    for state, count in gateway_server.count_runs_by_state().items():
+        runs_by_state.set(count, state=state)
+
+    files, size = gateway_server.get_staging_usage()
+    staging_files.set(files)
+    staging_bytes.set(size)
+    staging_free_bytes.set(shutil.disk_usage(gateway_server.staging_dir).free)
+
+    scheduler = getattr(gateway_server.executor, "scheduler", None)
+    if scheduler is not None:
+        local_queue_depth.set(scheduler.queue_depth())
+
+
+def render():
+    """
+    :return: This worker's metrics, each sample labelled with its pid
+    """
+    return REGISTRY.render([("pid", os.getpid())])
+
+
+@contextlib.contextmanager
+def track_request(route, method):
+    """
+    Record one HTTP request. The caller sets ``status`` on the yielded dict
+    """
+    http_in_flight.inc(route=route)
+    result = {"status": 500}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        http_in_flight.dec(route=route)
+        http_request_duration.observe(
+            time.perf_counter() - start, route=route, method=method
+        )
+        http_requests.inc(route=route, method=method, status=result["status"])
+
+
+@contextlib.contextmanager
+def track_ssam_call(endpoint):
+    """
+    Time a call to SSAM. Exceptions raised inside count as errors
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        ssam_request_errors.inc(endpoint=endpoint)
+        raise
+    finally:
+        ssam_request_duration.observe(time.perf_counter() - start, endpoint=endpoint)
+
+
+def record_upload(nbytes, seconds):
+    upload_bytes.inc(nbytes)
+    upload_size.observe(nbytes)
+    upload_duration.observe(seconds)
+    if seconds > 0:
+        upload_throughput.observe(nbytes / seconds)
@@ -4,7 +4,6 @@ import os
 
 import jwt
 import mlflow
-from dotenv import load_dotenv
 from mlflow import tracking
 from mlflow.projects.backend.abstract_backend import AbstractBackend
 from mlflow.projects.utils import (
@@ -13,7 +12,8 @@ from mlflow.projects.utils import (
 )
 from mlflow.utils.mlflow_tags import MLFLOW_USER
 
-from mltf_gateway.backend_adapter import RESTAdapter
+from mltf_gateway import tracing
+from mltf_gateway.backend_adapter import adapter_factory
 from mltf_gateway.oauth_client import get_access_token
 from mltf_gateway.project_packer import prepare_tarball, produce_tarball
 from mltf_gateway.submitted_runs.client_run import ClientSideSubmittedRun
@@ -22,17 +22,6 @@ from mltf_gateway.utils import get_tracking_uri
 _logger = logging.getLogger(__name__)
 
 
-def adapter_factory() -> RESTAdapter:
-    """
-    Different "adapters" let the client connect to either a local or remote gateway.
-    Abstract it out so there's one place for the configuration stuff to hook
-    :return: Instance of AbstractBackend the client should use
-    """
-    load_dotenv()
-    gateway_uri = os.environ.get("MLTF_GATEWAY_URI", "https://gw.mltf.vu")
-    return RESTAdapter(gateway_uri=gateway_uri)
-
-
 class GatewayProjectBackend(AbstractBackend):
     """
     API Enforced from MLFlow - see
@@ -45,10 +34,10 @@ class GatewayProjectBackend(AbstractBackend):
         impl = adapter_factory()
         return impl.list(list_all)
 
-    def show_details(self, run_id: str, show_logs: bool):
+    def show_details(self, run_id: str, show_logs: bool, log_offset: int = None):
         """Get the details of a run."""
         impl = adapter_factory()
-        return impl.show_details(run_id, show_logs)
+        return impl.show_details(run_id, show_logs, log_offset)
 
     def delete(self, run_id: str):
         """Delete a run."""
@@ -105,34 +94,37 @@ class GatewayProjectBackend(AbstractBackend):
         )
         mlflow_run = mlflow_run_obj.info.run_id
 
-        _logger.info("Bundling user environment")
-        file_catalog = prepare_tarball(work_dir)
-        tarball_limit = 1024 * 1024 * 1024  # 1Gigabyte
-        tarball_size = 0
-        for _, value in file_catalog.items():
-            tarball_size += value[0]
-        if tarball_size > tarball_limit:
-            raise RuntimeError(
-                f"Tarball size ({tarball_size}) exceeds limit of 1GB. Please shrink the size of your project"
-            )
-        project_tarball = None
-        try:
-            project_tarball = produce_tarball(file_catalog)
-            _logger.info(f"Tarball produced at {project_tarball}")
-            ret = impl.enqueue_run(
-                mlflow_run,
-                project_tarball,
-                entry_point,
-                params,
-                backend_config,
-                tracking_uri,
-                experiment_id,
-            )
-            _logger.info(f"Execution enqueued: {ret}")
-            print(
-                f"Find your MLFlow run at:\n\n  {tracking_uri}/#/experiments/{experiment_id}/runs/{mlflow_run}\n\n"
-            )
-            return ret
-        finally:
-            if project_tarball and os.path.exists(project_tarball):
-                os.remove(project_tarball)
+        # Root span of the submission, the gateway's spans join this trace
+        tracing.set_service_name("mltf-client")
+        with tracing.span("submit", run_id=mlflow_run):
+            _logger.info("Bundling user environment")
+            file_catalog = prepare_tarball(work_dir)
+            tarball_limit = 1024 * 1024 * 1024  # 1Gigabyte
+            tarball_size = 0
+            for _, value in file_catalog.items():
+                tarball_size += value[0]
+            if tarball_size > tarball_limit:
+                raise RuntimeError(
+                    f"Tarball size ({tarball_size}) exceeds limit of 1GB. Please shrink the size of your project"
+                )
+            project_tarball = None
+            try:
+                project_tarball = produce_tarball(file_catalog)
+                _logger.info(f"Tarball produced at {project_tarball}")
+                ret = impl.enqueue_run(
+                    mlflow_run,
+                    project_tarball,
+                    entry_point,
+                    params,
+                    backend_config,
+                    tracking_uri,
+                    experiment_id,
+                )
+                _logger.info(f"Execution enqueued: {ret}")
+                print(
+                    f"Find your MLFlow run at:\n\n  {tracking_uri}/#/experiments/{experiment_id}/runs/{mlflow_run}\n\n"
+                )
+                return ret
+            finally:
+                if project_tarball and os.path.exists(project_tarball):
+                    os.remove(project_tarball)
@@ -5,13 +5,14 @@ This module provides OAuth2 authentication capabilities for the CLI client,
 including device flow authentication and token management.
 """
 
+import atexit
+import logging
 import os
+import threading
 import time
 import webbrowser
 from typing import Optional, Dict, Any
 
-import requests
-
 # Configuration - These should be configurable via environment variables or config file
 CLIENT_ID = os.environ.get("MLTF_CLIENT_ID", "mlflow")
 AUTHORIZATION_ENDPOINT = os.environ.get(
@@ -23,6 +24,15 @@ TOKEN_ENDPOINT = os.environ.get(
     "https://keycloak.k8s.accre.vanderbilt.edu/realms/mltf-dual-login/protocol/openid-connect/token",
 )
 SCOPES = os.environ.get("MLTF_SCOPES", "read write").split()
+# Refresh the access token in the background once it has less than this many
+# seconds left, so callers never wait on a refresh. 0 disables it. Keep it well
+# under the access token lifetime (often 5 minutes), or every token counts as
+# expiring as soon as it's issued
+REFRESH_AHEAD_WINDOW = int(os.environ.get("MLTF_TOKEN_REFRESH_AHEAD", 60))
+# How long exiting waits for a background refresh's answer from the auth server
+REFRESH_EXIT_GRACE = float(os.environ.get("MLTF_TOKEN_REFRESH_EXIT_GRACE", 5))
+
+_logger = logging.getLogger(__name__)
 
 # Used to keep user from having to type a password with each CLI call
 if "MLTF_KEYRING_PASSWORD" in os.environ:
@@ -31,13 +41,52 @@ if "MLTF_KEYRING_PASSWORD" in os.environ:
 if "DBUS_SESSION_BUS_ADDRESS" in os.environ:
     del os.environ["DBUS_SESSION_BUS_ADDRESS"]
 
-import keyring
+# keyring and requests are imported where they're used. Loading the keyring
+# backends alone takes longer than most CLI commands otherwise would
 
 DID_WARN_KEYRING = False
 
 
+# Credentials decrypted from the keyring, so a process only pays for the
+# keyring's key derivation once. Kept in sync by store/clear below
+_credential_cache = None
+_credential_lock = threading.RLock()
+# An agent refreshes the credentials it hands out itself
+_credentials_from_agent = False
+
+
+def invalidate_credential_cache():
+    """Forget cached credentials, the next lookup reads the keyring again"""
+    global _credential_cache
+    with _credential_lock:
+        _credential_cache = None
+
+
 def get_stored_credentials() -> Optional[Dict[str, Any]]:
     """Retrieve stored credentials from keyring"""
+    global _credential_cache, _credentials_from_agent
+    with _credential_lock:
+        cached = _credential_cache
+        # Expired credentials may have been refreshed by another process, so
+        # go back to the keyring for those
+        if cached is not None and not token_expired(cached):
+            return dict(cached)
+        _credential_cache = None
+        # A running `mltf agent` already has them decrypted
+        from mltf_gateway.credential_agent import get_agent_credentials
+
+        creds = get_agent_credentials()
+        _credentials_from_agent = bool(creds)
+        if not creds:
+            creds = _read_stored_credentials()
+        if creds:
+            _credential_cache = dict(creds)
+        return creds
+
+
+def _read_stored_credentials() -> Optional[Dict[str, Any]]:
+    import keyring
+
     start_time = time.time()
     try:
         access_token = keyring.get_password("mltf_gateway", "access_token")
@@ -77,17 +126,64 @@ Note: This password should be kept secure since it can unlock the secure
 
 def store_credentials(access_token: str, refresh_token: str, expires_at: int):
     """Store credentials securely using keyring"""
+    try:
+        _write_credentials(access_token, refresh_token, expires_at)
+    except Exception as e:
+        print(f"Error storing credentials: {e}")
+        return
+    print("Credentials stored securely")
+
+
+def _store_credentials_quietly(access_token, refresh_token, expires_at):
+    """
+    store_credentials() for background threads, which mustn't print into
+    the output of whatever command is running
+    """
+    try:
+        _write_credentials(access_token, refresh_token, expires_at)
+    except Exception as e:
+        _logger.warning(f"Error storing refreshed credentials: {e}")
+
+
+def _write_credentials(access_token, refresh_token, expires_at):
+    """
+    Write credentials to the keyring, then to the cache. The keyring write can
+    be slow, so it happens without _credential_lock and readers keep getting
+    the previous credentials meanwhile
+    """
+    import keyring
+
+    global _credential_cache, _credentials_from_agent
     try:
         keyring.set_password("mltf_gateway", "access_token", access_token)
         keyring.set_password("mltf_gateway", "refresh_token", refresh_token)
         keyring.set_password("mltf_gateway", "expires_at", str(expires_at))
-        print("Credentials stored securely")
-    except Exception as e:
-        print(f"Error storing credentials: {e}")
+    except Exception:
+        # Whatever made it to the keyring gets read back next time
+        invalidate_credential_cache()
+        raise
+    with _credential_lock:
+        _credentials_from_agent = False
+        _credential_cache = None
+        if access_token and refresh_token:
+            _credential_cache = {
+                "access_token": access_token,
+                "refresh_token": refresh_token,
+                "expires_at": str(expires_at),
+            }
+    from mltf_gateway.credential_agent import notify_agent
+
+    notify_agent("reload")
 
 
 def clear_stored_credentials():
     """Clear stored credentials from keyring"""
+    import keyring
+
+    from mltf_gateway.credential_agent import notify_agent
+
+    invalidate_credential_cache()
+    notify_agent("clear")
     try:
         passwords = ["access_token", "refresh_token", "expires_at"]
         for p in passwords:
@@ -99,6 +195,8 @@ def clear_stored_credentials():
 
 def request_device_code():
     """Request device code from OAuth2 provider"""
+    import requests
+
     data = {"client_id": CLIENT_ID, "scope": " ".join(SCOPES)}
 
     try:
@@ -113,6 +211,7 @@ def request_device_code():
 
 def poll_token(device_code, interval=0):
     """Poll for access token using device code"""
+    import requests
 
     # Wait for 5 seconds to poll tokens
     if not interval:
@@ -157,21 +256,32 @@ def poll_token(device_code, interval=0):
 
 def refresh_access_token(refresh_token):
     """Refresh access token using refresh token"""
-    data = {
-        "client_id": CLIENT_ID,
-        "grant_type": "refresh_token",
-        "refresh_token": refresh_token,
-    }
+    import requests
 
     try:
-        response = requests.post(TOKEN_ENDPOINT, data=data)
-        response.raise_for_status()
-        return response.json()
+        return _request_token_refresh(refresh_token)
     except requests.exceptions.RequestException as e:
         print(f"Error refreshing token: {e}")
         return None
 
 
+def _request_token_refresh(refresh_token):
+    """
+    :return: The auth server's token response
+    :raises requests.exceptions.RequestException: if the refresh failed
+    """
+    import requests
+
+    data = {
+        "client_id": CLIENT_ID,
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token,
+    }
+    response = requests.post(TOKEN_ENDPOINT, data=data, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
 def authenticate_with_device_flow() -> Optional[Dict[str, Any]]:
     """Main function to perform OAuth2 device flow authentication"""
 
@@ -246,9 +356,90 @@ def get_access_token() -> Optional[Dict[str, Any]]:
         print("Access token expired, attempting to refresh...")
         return attempt_token_refresh(creds)
 
+    # If it is about to expire, refresh it while the current one is still used
+    if (
+        token_expires_within(creds, REFRESH_AHEAD_WINDOW)
+        and not _credentials_from_agent
+    ):
+        start_background_refresh(creds)
+
     return creds
 
 
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+_last_background_refresh = 0.0
+# Set at exit, after which no background refresh is started
+_exiting = False
+# Don't hammer the auth server if refreshing keeps failing
+BACKGROUND_REFRESH_MIN_INTERVAL = 30
+
+
+def start_background_refresh(creds):
+    """
+    Refresh the access token from a background thread, storing the result
+    quietly. Does nothing if a refresh is already running or the process is
+    exiting
+    :return: The refresh thread, or None if none was started
+    """
+    global _refresh_thread, _last_background_refresh
+    if not creds.get("refresh_token") or _exiting:
+        return None
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return None
+        if time.time() - _last_background_refresh < BACKGROUND_REFRESH_MIN_INTERVAL:
+            return None
+        _last_background_refresh = time.time()
+        # A daemon, so nobody waits on a refresh they didn't ask for beyond
+        # the grace period in _stop_background_refresh
+        _refresh_thread = threading.Thread(
+            target=_background_refresh,
+            args=(creds["refresh_token"],),
+            name="mltf-token-refresh",
+            daemon=True,
+        )
+        _refresh_thread.start()
+        return _refresh_thread
+
+
+def _background_refresh(refresh_token):
+    import requests
+
+    if _exiting:
+        # Nothing was sent yet, so the refresh token is still good
+        return
+    try:
+        refresh_response = _request_token_refresh(refresh_token)
+    except requests.exceptions.RequestException as e:
+        _logger.warning(f"Error refreshing token in the background: {e}")
+        return
+    if not refresh_response.get("access_token"):
+        return
+    # Stored even if exit has started: the auth server may have rotated the
+    # refresh token, and losing the new one would mean logging in again
+    _store_credentials_quietly(
+        refresh_response["access_token"],
+        refresh_response.get("refresh_token", refresh_token),
+        int(time.time()) + refresh_response.get("expires_in", 3600),
+    )
+
+
+@atexit.register
+def _stop_background_refresh():
+    """
+    Keep new background refreshes from starting, and give one in progress up
+    to REFRESH_EXIT_GRACE seconds to get its answer stored. If the auth server
+    is slower than that the answer is lost; with refresh token rotation that
+    means the next invocation has to log in again
+    """
+    global _exiting
+    _exiting = True
+    thread = _refresh_thread
+    if thread is not None and thread.is_alive():
+        thread.join(REFRESH_EXIT_GRACE)
+
+
 def attempt_token_refresh(creds):
     """Try to make a new access token from refresh token"""
     if token_expired(creds):
@@ -280,6 +471,10 @@ def add_auth_header_to_request(headers: dict) -> dict:
     return headers
 
 
+def token_expires_within(creds, seconds):
+    return int(creds.get("expires_at") or 0) - time.time() < seconds
+
+
 def token_expired(creds):
     curr_time = int(time.time())
     exp_time = int(creds.get("expires_at", 0))
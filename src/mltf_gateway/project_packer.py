@@ -6,7 +6,10 @@ import tarfile
 import tempfile
 import urllib.parse
 
+from mltf_gateway import tracing
 
+
+@tracing.traced()
 def prepare_tarball(url):
     """
     Given a URL to a workspace, generate a tarball to upload to the gateway.
@@ -42,9 +45,11 @@ def prepare_tarball(url):
             relative_path = os.path.join(relative_root, f)
             info = os.stat(absolute_path)
             file_catalog[relative_path] = (info.st_size, info.st_mtime, absolute_path)
+    tracing.current_span().set_attribute("files", len(file_catalog))
     return file_catalog
 
 
+@tracing.traced()
 def produce_tarball(file_catalog):
     """
     With given file catalog, write a tarball with the user environment.
@@ -71,6 +76,7 @@ def produce_tarball(file_catalog):
             # MLProject and env files are "earlier" in the tarfile, so the server has to do less searching
             for f in sorted(file_catalog.keys()):
                 tf.add(name=file_catalog[f][2], arcname=f, recursive=False)
+        tracing.current_span().set_attribute("bytes", nf.tell())
         return nf.name
 
 
@@ -0,0 +1,180 @@
+"""
+Byte-oriented, chunked access to a run's output, for streaming it to clients
+"""
+
+import bisect
+import threading
+import time
+
+from mlflow.entities import RunStatus
+
+# Characters of output read (and then encoded) at once
+LOG_CHUNK_SIZE = 64 * 1024
+# Seconds between checks for new output when following a run
+LOG_FOLLOW_INTERVAL = 2
+
+
+def _is_terminated_or_gone(status):
+    """
+    :param status: What the run's get_status() returned, a RunStatus or the
+                   name of one
+    """
+    if isinstance(status, str):
+        try:
+            status = RunStatus.from_string(status)
+        except Exception:
+            # e.g. "UNKNOWN"
+            return True
+    return status is None or RunStatus.is_terminated(status)
+
+
+class RunLog:
+    """
+    A run's output as bytes. Offsets are byte offsets, so they can be used
+    with HTTP Range. The submitted run has to provide read_logs(offset, size),
+    returning characters of output starting at character offset (fetching new
+    output when offset is past what it has), get_log_length() and get_status().
+    Characters are encoded as the run's LOG_ENCODING, UTF-8 by default.
+
+    Runs that rotate their output away also provide get_log_start(), the
+    offset of the oldest output they still have. Their encoding must be one
+    byte per character, so that offset is both
+
+    Character offsets are mapped to byte offsets as output is read, and the
+    mapping is kept, so a RunLog reused across requests only encodes output it
+    hasn't seen before to answer size() or start at a byte offset
+    """
+
+    def __init__(self, submitted_run, chunk_size=LOG_CHUNK_SIZE):
+        self.submitted_run = submitted_run
+        self.chunk_size = chunk_size
+        self.encoding = getattr(submitted_run, "LOG_ENCODING", "utf-8")
+        self._lock = threading.Lock()
+        # (character offset, byte offset) pairs, at least chunk_size characters
+        # apart, with their byte offsets alongside to search, and the pair for
+        # the end of the output read so far
+        self._checkpoints = [(0, 0)]
+        self._checkpoint_bytes = [0]
+        self._end = (0, 0)
+
+    def _read(self, char_pos):
+        return self.submitted_run.read_logs(char_pos, self.chunk_size) or ""
+
+    def start(self):
+        """
+        :return: Byte offset of the oldest output still available
+        """
+        get_log_start = getattr(self.submitted_run, "get_log_start", None)
+        return get_log_start() if get_log_start is not None else 0
+
+    def _check_truncated(self):
+        """
+        Forget the mapping if the output shrank (e.g. a requeued job's log was
+        truncated). Callers hold _lock
+        """
+        if self.submitted_run.get_log_length() < self._end[0]:
+            self._checkpoints = [(0, 0)]
+            self._checkpoint_bytes = [0]
+            self._end = (0, 0)
+
+    def _record(self, char_pos, byte_pos):
+        """
+        Record that character offset char_pos is byte offset byte_pos. Callers
+        hold _lock
+        """
+        if char_pos <= self._end[0]:
+            return
+        self._end = (char_pos, byte_pos)
+        if char_pos - self._checkpoints[-1][0] >= self.chunk_size:
+            self._checkpoints.append(self._end)
+            self._checkpoint_bytes.append(byte_pos)
+
+    def _seek(self, byte_pos):
+        """
+        :return: The last known (character offset, byte offset) at or before
+                 byte_pos
+        """
+        with self._lock:
+            self._check_truncated()
+            log_start = self.start()
+            if byte_pos < log_start:
+                return log_start, log_start
+            if byte_pos >= self._end[1]:
+                return self._end
+            i = bisect.bisect_right(self._checkpoint_bytes, byte_pos)
+            return self._checkpoints[i - 1]
+
+    def _advance(self, text, char_pos, byte_pos):
+        """
+        Encode text read at (char_pos, byte_pos) and record where it ends
+        :return: (the encoded text, character offset after it, byte offset after it)
+        """
+        char_pos += len(text)
+        chunk = text.encode(self.encoding)
+        byte_pos += len(chunk)
+        with self._lock:
+            self._record(char_pos, byte_pos)
+        return chunk, char_pos, byte_pos
+
+    @staticmethod
+    def _clip(chunk, chunk_start, start, end):
+        """
+        :return: The part of chunk, which starts at byte chunk_start, that lies
+                 between bytes start and end
+        """
+        lo = max(start - chunk_start, 0)
+        hi = len(chunk) if end is None else min(end - chunk_start, len(chunk))
+        return chunk[lo:hi] if hi > lo else b""
+
+    def size(self):
+        """
+        :return: Length in bytes of the output available right now
+        """
+        with self._lock:
+            self._check_truncated()
+            char_pos, size = self._end
+            log_start = self.start()
+            if char_pos < log_start:
+                char_pos = size = log_start
+            while text := self._read(char_pos):
+                char_pos += len(text)
+                size += len(text.encode(self.encoding))
+                self._record(char_pos, size)
+            return size
+
+    def iter_bytes(self, start=0, end=None, follow=False, interval=None):
+        """
+        Yield the output from byte start to byte end (exclusive)
+        :param follow: Keep waiting for new output until the run terminates
+        :param interval: Seconds between checks for new output when following,
+                         defaults to LOG_FOLLOW_INTERVAL
+        """
+        if interval is None:
+            interval = LOG_FOLLOW_INTERVAL
+        char_pos, byte_pos = self._seek(start)
+        terminated = False
+        while True:
+            log_start = self.start()
+            if char_pos < log_start:
+                # Rotated away meanwhile, carry on from what's left
+                char_pos = byte_pos = log_start
+                continue
+            text = self._read(char_pos)
+            if text:
+                chunk_start = byte_pos
+                chunk, char_pos, byte_pos = self._advance(text, char_pos, byte_pos)
+                chunk = self._clip(chunk, chunk_start, start, end)
+                if chunk:
+                    yield chunk
+                if end is not None and byte_pos >= end:
+                    return
+                continue
+            if self.start() > char_pos:
+                continue
+            if not follow or terminated:
+                return
+            if _is_terminated_or_gone(self.submitted_run.get_status()):
+                # One more read picks up the last of the output
+                terminated = True
+                continue
+            time.sleep(interval)
@@ -0,0 +1,111 @@
+"""
+In-memory registry of the runs a GatewayServer knows about
+"""
+
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from mltf_gateway.submitted_runs.server_run import ServerSideSubmittedRunDescription
+
+
+def _user_of(run):
+    return getattr(getattr(run, "run_desc", None), "user_subject", None)
+
+
+class RunRegistry:
+    """
+    Copy-on-write collection of ServerSideSubmittedRunDescription, keyed by
+    gateway_id.
+
+    Readers get an immutable snapshot (a tuple plus an index dict), so listing
+    and lookups never take a lock. Writers build a new snapshot under a single
+    write lock and swap it in. Slow operations on one run (e.g. cancelling it)
+    can be serialized with run_lock() without holding up the whole registry.
+
+    For conditional requests it also digests each user's set of runs, once
+    per snapshot. The digest depends only on the runs, so every worker
+    sharing the run database hands out the same ETags.
+    """
+
+    def __init__(self, runs=()):
+        self._write_lock = threading.RLock()
+        self._run_locks = {}
+        self._run_locks_lock = threading.Lock()
+        self._state = ((), {}, {})
+        self._publish(tuple(runs))
+
+    def _publish(self, runs):
+        index = {r.gateway_id: r for r in runs}
+        # Swap everything in with one assignment, so readers never see a
+        # snapshot, an index and user digests that disagree
+        self._state = (runs, index, {})
+
+    def snapshot(self) -> tuple:
+        return self._state[0]
+
+    def get(self, gateway_id) -> ServerSideSubmittedRunDescription:
+        """
+        :return: The run, or None if there is none with this gateway_id
+        """
+        return self._state[1].get(gateway_id)
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def __iter__(self):
+        return iter(self._state[0])
+
+    @contextmanager
+    def write_lock(self):
+        with self._write_lock:
+            yield
+
+    def update(self, update):
+        """
+        Replace the runs with update(list of current runs)
+        :return: The new snapshot
+        """
+        with self._write_lock:
+            runs = tuple(update(list(self._state[0])))
+            self._publish(runs)
+            return runs
+
+    def replace(self, runs):
+        with self._write_lock:
+            self._publish(tuple(runs))
+
+    def add(self, run):
+        return self.update(lambda runs: runs + [run])
+
+    def remove(self, gateway_id):
+        return self.update(lambda runs: [r for r in runs if r.gateway_id != gateway_id])
+
+    def user_digest(self, user_subject) -> str:
+        """
+        :return: Digest of the runs belonging to user_subject, which changes
+                 when any are added or removed
+        """
+        runs, _, digests = self._state
+        digest = digests.get(user_subject)
+        if digest is None:
+            sha = hashlib.sha256()
+            for run in runs:
+                if _user_of(run) == user_subject:
+                    sha.update(run.gateway_id.encode("utf-8") + b"\0")
+            digest = digests[user_subject] = sha.hexdigest()[:16]
+        return digest
+
+    @contextmanager
+    def run_lock(self, gateway_id):
+        """
+        Serialize operations on a single run
+        """
+        with self._run_locks_lock:
+            lock = self._run_locks.setdefault(gateway_id, threading.Lock())
+        with lock:
+            yield
+
+    def forget_run_lock(self, gateway_id):
+        with self._run_locks_lock:
+            self._run_locks.pop(gateway_id, None)
@@ -9,11 +9,9 @@ import os.path
 import sys
 from datetime import datetime, timezone
 
-import jwt
-
-from mltf_gateway.mlflow_project_backend import GatewayProjectBackend
-
-# Import OAuth2 client
+# Everything heavy (mlflow, flask, keyring, requests...) is imported by the
+# subcommands that need it, so e.g. `mltf auth-status` starts quickly.
+# tests/test_cli_imports.py keeps it that way
 from mltf_gateway.oauth_client import (
     is_authenticated,
     get_stored_credentials,
@@ -42,8 +40,9 @@ def require_auth(func):
 @require_auth
 def handle_show_subcommand(args):
     """Handle the 'show' subcommand."""
-    backend = GatewayProjectBackend()
-    details = backend.show_details(args.run_id, args.show_logs)
+    from mltf_gateway.backend_adapter import adapter_factory
+
+    details = adapter_factory().show_details(args.run_id, args.show_logs)
 
     print(f"Status: {details.get('status')}")
 
@@ -58,12 +57,27 @@ def handle_show_subcommand(args):
         print("(No logs available)")
 
 
+@require_auth
+def handle_logs_subcommand(args):
+    """Handle the 'logs' subcommand."""
+    from mltf_gateway.backend_adapter import adapter_factory
+
+    out = sys.stdout.buffer
+    try:
+        for chunk in adapter_factory().stream_logs(args.run_id, follow=args.follow):
+            out.write(chunk)
+            out.flush()
+    except KeyboardInterrupt:
+        pass
+
+
 # Subcommand function definitions (grouped together)
 @require_auth
 def handle_list_subcommand(args):
     """Handle the 'list' subcommand."""
-    backend = GatewayProjectBackend()
-    to_decode = backend.list(args.all, False)
+    from mltf_gateway.backend_adapter import adapter_factory
+
+    to_decode = adapter_factory().list(args.all)
     if to_decode:
         print("Tasks:")
         to_decode.sort(key=lambda x: x["creation_time"], reverse=True)
@@ -80,6 +94,7 @@ def handle_list_subcommand(args):
 @require_auth
 def handle_submit_subcommand(args):
     """Handle the 'submit' subcommand."""
+    from mltf_gateway.mlflow_project_backend import GatewayProjectBackend
 
     backend = GatewayProjectBackend()
     tracking_uri = get_tracking_uri()
@@ -106,8 +121,9 @@ def handle_submit_subcommand(args):
 @require_auth
 def handle_delete_subcommand(args):
     """Handle the 'delete' subcommand."""
-    backend = GatewayProjectBackend()
-    result = backend.delete(args.run_id)
+    from mltf_gateway.backend_adapter import adapter_factory
+
+    result = adapter_factory().delete(args.run_id)
     print(result)
 
 
@@ -115,11 +131,11 @@ def handle_delete_subcommand(args):
 def handle_artifacts_subcommand(args):
     """Handle the 'artifacts' subcommand."""
     from mlflow.tracking import MlflowClient
+    from mltf_gateway.backend_adapter import adapter_factory
     from mltf_gateway.oauth_client import get_access_token
 
-    backend = GatewayProjectBackend()
     # List all runs to find the mapping from gateway_id to run_id
-    runs = backend.list()
+    runs = adapter_factory().list(True)
     target_run_id = None
     for run in runs:
         if run["gateway_id"] == args.run_id:
@@ -173,6 +189,8 @@ def handle_logout_subcommand(args):
 
 def handle_auth_status_subcommand(args):
     """Handle the 'auth_status' subcommand."""
+    import jwt
+
     creds = get_stored_credentials()
     if not creds:
         print("No credentials found")
@@ -205,19 +223,79 @@ def handle_auth_status_subcommand(args):
     print(f" Remaining: {refresh_exp - curr_time}")
 
 
+def handle_agent_subcommand(args):
+    """Handle the 'agent' subcommand - run or control the credential agent"""
+    from mltf_gateway.credential_agent import (
+        get_agent_socket_path,
+        query_agent,
+        run_agent,
+    )
+
+    socket_path = args.socket or get_agent_socket_path()
+    if args.stop or args.status:
+        response = query_agent({"op": "stop" if args.stop else "ping"}, socket_path)
+        if not response:
+            print(f"No agent running on {socket_path}")
+            sys.exit(1)
+        if args.stop:
+            print("Agent stopped")
+        else:
+            print(f"Agent running on {socket_path} (pid {response.get('pid')})")
+        return
+    run_agent(socket_path, foreground=args.foreground, refresh_ahead=args.refresh_ahead)
+
+
 def handle_server_subcommand(args):
     """Handle the 'server' subcommand - start HTTP server"""
     from mltf_gateway.flaskapp.app import create_app
     import os
 
-    app = create_app()
     # Get host and port from arguments or use defaults
     host = args.host or os.environ.get("MLTF_HOST", "localhost")
     port = args.port or int(os.environ.get("MLTF_PORT", 5001))
 
+    workers = args.workers or int(os.environ.get("MLTF_WORKERS", 0))
+    threads = args.threads or int(os.environ.get("MLTF_THREADS", 0))
+
     print(f"Starting MLTF Gateway server on {host}:{port}")
     print("Press Ctrl+C to stop the server")
 
+    if args.asgi:
+        try:
+            from mltf_gateway.flaskapp.asgi import run_asgi_server
+        except ImportError as e:
+            print(f"Error: the async server needs starlette, uvicorn and httpx ({e})")
+            sys.exit(1)
+
+        try:
+            run_asgi_server(
+                host,
+                port,
+                workers=workers or 1,
+                graceful_timeout=args.graceful_timeout,
+            )
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return
+
+    if workers or threads:
+        from mltf_gateway.flaskapp.production import run_production_server
+
+        try:
+            run_production_server(
+                host,
+                port,
+                workers=workers or 1,
+                threads=threads or 1,
+                graceful_timeout=args.graceful_timeout,
+            )
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return
+
+    app = create_app()
     # Start the Flask development server
     app.run(host=host, port=port, debug=args.debug)
 
@@ -268,6 +346,39 @@ def create_parser():
         "--show-logs", action="store_true", help="Show logs of the run"
     )
 
+    # logs command
+    logs_parser = subparsers.add_parser("logs", help="Print the output of a job")
+    logs_parser.add_argument("run_id", help="The ID of the run")
+    logs_parser.add_argument(
+        "--follow",
+        "-f",
+        action="store_true",
+        help="Keep printing output as the job produces it, until it finishes",
+    )
+
+    # Agent command
+    agent_parser = subparsers.add_parser(
+        "agent", help="Run a credential agent so commands skip the keyring unlock"
+    )
+    agent_parser.add_argument(
+        "--socket", help="Socket to listen on (default: $MLTF_AGENT_SOCK)"
+    )
+    agent_parser.add_argument(
+        "--foreground", action="store_true", help="Don't detach from the terminal"
+    )
+    agent_parser.add_argument(
+        "--refresh-ahead",
+        type=int,
+        default=300,
+        help="Refresh the access token this many seconds before it expires",
+    )
+    agent_parser.add_argument(
+        "--stop", action="store_true", help="Stop a running agent"
+    )
+    agent_parser.add_argument(
+        "--status", action="store_true", help="Check if an agent is running"
+    )
+
     # Server command
     server_parser = subparsers.add_parser(
         "server", help="Start MLTF Gateway HTTP server"
@@ -275,6 +386,28 @@ def create_parser():
     server_parser.add_argument("--host", help="Host to bind the server to")
     server_parser.add_argument("--port", type=int, help="Port to bind the server to")
     server_parser.add_argument("--debug", action="store_true", help="Enable debug mode")
+    server_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Serve with gunicorn using this many worker processes (env: MLTF_WORKERS)",
+    )
+    server_parser.add_argument(
+        "--threads",
+        type=int,
+        help="Serve with gunicorn using this many threads per worker (env: MLTF_THREADS)",
+    )
+    server_parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=60,
+        help="Seconds in-flight requests get to finish when stopping the server",
+    )
+    server_parser.add_argument(
+        "--asgi",
+        action="store_true",
+        help="Serve the job status/wait endpoints asynchronously with uvicorn "
+        "(needs mltf-gateway[async])",
+    )
 
     return parser
 
@@ -288,6 +421,8 @@ def main():
         handle_list_subcommand(args)
     elif args.command == "show":
         handle_show_subcommand(args)
+    elif args.command == "logs":
+        handle_logs_subcommand(args)
     elif args.command == "submit":
         handle_submit_subcommand(args)
     elif args.command == "delete":
@@ -300,6 +435,8 @@ def main():
         handle_logout_subcommand(args)
     elif args.command == "auth-status":
         handle_auth_status_subcommand(args)
+    elif args.command == "agent":
+        handle_agent_subcommand(args)
     elif args.command == "server":
         handle_server_subcommand(args)
     else:
@@ -0,0 +1,170 @@
+"""
+Staged, non-blocking startup for the gateway server.
+
+Building the executor (which may log in to keycloak), loading the run
+database and creating the database tables can each be slow when an upstream
+is. Startup runs them concurrently from background threads, so the HTTP
+listener comes up right away and can answer /healthz and /readyz while they
+finish. Components that fail are retried with backoff until they succeed.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+class Component:
+    def __init__(self, name, init, required=True):
+        """
+        :param init: Called with no arguments to bring the component up
+        :param required: Whether the gateway is ready without it
+        """
+        self.name = name
+        self.init = init
+        self.required = required
+        self.state = PENDING
+        self.error = None
+        self.attempts = 0
+        self.duration = None
+        self.ready_event = threading.Event()
+
+    def to_json(self):
+        ret = {
+            "state": self.state,
+            "required": self.required,
+            "attempts": self.attempts,
+        }
+        if self.duration is not None:
+            ret["duration_seconds"] = round(self.duration, 4)
+        if self.error:
+            ret["error"] = self.error
+        return ret
+
+
+class Startup:
+    def __init__(self, retry_interval=1, max_retry_interval=60):
+        """
+        :param retry_interval: Seconds before retrying a failed component, doubled
+                               after each failure up to max_retry_interval
+        """
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.components = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._fired = False
+        self._stop = threading.Event()
+
+    def add(self, name, init, required=True):
+        """
+        Register a component, must be called before start()
+        """
+        self.components[name] = Component(name, init, required)
+        return self
+
+    def on_ready(self, callback):
+        """
+        Call callback (from a startup thread) once every required component is
+        up. wait() returns only after it has run
+        """
+        self._callbacks.append(callback)
+        return self
+
+    def _required(self):
+        return [c for c in self.components.values() if c.required]
+
+    def _run_component(self, component):
+        delay = self.retry_interval
+        while not self._stop.is_set():
+            component.attempts += 1
+            start = time.monotonic()
+            try:
+                component.init()
+            except Exception as e:
+                component.state = FAILED
+                component.error = f"{type(e).__name__}: {e}"
+                logger.warning(
+                    f"Starting {component.name} failed (attempt {component.attempts}),"
+                    f" retrying in {delay}s: {e}"
+                )
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_retry_interval)
+                continue
+            component.duration = time.monotonic() - start
+            component.state = READY
+            component.error = None
+            logger.info(f"Started {component.name} in {component.duration:.3f}s")
+            break
+        if component.state == READY:
+            self._maybe_fire_callbacks()
+        component.ready_event.set()
+
+    def _maybe_fire_callbacks(self):
+        with self._lock:
+            if self._fired or any(c.state != READY for c in self._required()):
+                return
+            self._fired = True
+        for callback in self._callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Startup callback {callback} failed: {e}")
+
+    def start(self):
+        """
+        Start every component from its own thread
+        """
+        if not self._required():
+            self._maybe_fire_callbacks()
+        for component in self.components.values():
+            threading.Thread(
+                target=self._run_component,
+                args=(component,),
+                name=f"startup-{component.name}",
+                daemon=True,
+            ).start()
+        return self
+
+    def stop(self):
+        """
+        Stop retrying components that haven't come up yet
+        """
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the required components
+        :return: Whether they're all up
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for component in self._required():
+            remaining = (
+                None if deadline is None else max(deadline - time.monotonic(), 0)
+            )
+            if not component.ready_event.wait(remaining):
+                return False
+        return all(c.state == READY for c in self._required())
+
+    def is_ready(self):
+        """
+        :return: (ready, reason)
+        """
+        not_ready = [c for c in self._required() if c.state != READY]
+        if not not_ready:
+            return True, "ok"
+        failed = [c.name for c in not_ready if c.state == FAILED]
+        if failed:
+            return False, f"failed to start: {', '.join(failed)}"
+        return False, f"starting: {', '.join(c.name for c in not_ready)}"
+
+    def status(self):
+        """
+        :return: Per-component startup state
+        """
+        return {name: c.to_json() for name, c in self.components.items()}
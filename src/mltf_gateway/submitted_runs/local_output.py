@@ -0,0 +1,171 @@
+"""
+Output capture for runs started by LocalExecutor.
+
+A run's output is piped into a small helper process (python -m
+mltf_gateway.submitted_runs.local_output PATH) that copies it into a log file
+as it arrives, so the pipe never fills up and blocks the run, and the output
+can be read at any time while it runs. The helper belongs to the run rather
+than to the gateway, so the output keeps being captured across gateway
+restarts. The log file is rotated once it reaches max_bytes, keeping up to
+backups older files.
+"""
+
+import contextlib
+import os
+import sys
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# Defaults for rotation
+LOCAL_LOG_MAX_BYTES = 10 * 1024**2
+LOCAL_LOG_BACKUPS = 3
+# Bytes read from the pipe at once
+READ_SIZE = 64 * 1024
+
+
+class RunOutput:
+    """
+    A run's output in path, path.1, ..., path.<backups> (oldest last).
+    Offsets are byte offsets from the start of the output, so they stay valid
+    across rotations. Output rotated out of the last backup is gone
+    """
+
+    def __init__(self, path, max_bytes=LOCAL_LOG_MAX_BYTES, backups=LOCAL_LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    @classmethod
+    def from_environ(cls, path):
+        """
+        Build a RunOutput using MLTF_LOCAL_LOG_MAX_BYTES and MLTF_LOCAL_LOG_BACKUPS
+        """
+        return cls(
+            path,
+            max_bytes=int(
+                os.environ.get("MLTF_LOCAL_LOG_MAX_BYTES", LOCAL_LOG_MAX_BYTES)
+            ),
+            backups=int(os.environ.get("MLTF_LOCAL_LOG_BACKUPS", LOCAL_LOG_BACKUPS)),
+        )
+
+    @contextlib.contextmanager
+    def _locked(self, operation):
+        """
+        Keep readers from seeing the files halfway through a rotation. The
+        writer is a different process, so this is a file lock
+        """
+        if fcntl is None:  # pragma: no cover
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @property
+    def discarded(self):
+        """
+        :return: Bytes of output that were rotated away
+        """
+        try:
+            with open(f"{self.path}.discarded") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _files(self):
+        """
+        :return: The log files, oldest first
+        """
+        names = [f"{self.path}.{i}" for i in range(self.backups, 0, -1)]
+        return [name for name in names + [self.path] if os.path.exists(name)]
+
+    def copy(self, stream):
+        """
+        Copy stream to the log file until EOF
+        """
+        fd = stream.fileno()
+        f = open(self.path, "ab")
+        try:
+            while chunk := os.read(fd, READ_SIZE):
+                with self._locked(fcntl and fcntl.LOCK_EX):
+                    f.write(chunk)
+                    f.flush()
+                    if self.max_bytes and f.tell() >= self.max_bytes:
+                        f.close()
+                        self._rotate()
+                        f = open(self.path, "ab")
+        finally:
+            f.close()
+
+    def _rotate(self):
+        """
+        Shift path.N to path.N+1 and start a new path. Callers hold the lock
+        """
+        discarded = self.discarded
+        oldest = f"{self.path}.{self.backups}" if self.backups else self.path
+        if os.path.exists(oldest):
+            discarded += os.path.getsize(oldest)
+            os.remove(oldest)
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups and os.path.exists(self.path):
+            os.replace(self.path, f"{self.path}.1")
+        with open(f"{self.path}.discarded", "w") as f:
+            f.write(str(discarded))
+
+    def read(self, offset=0):
+        """
+        :return: (output from byte offset on, offset just past the end of it).
+                 If offset was rotated away, output starts at the oldest kept
+        """
+        _, data, end = self._read(offset)
+        return data, end
+
+    def read_chunk(self, offset, size):
+        """
+        :return: (where the returned output starts, at most size bytes of output
+                 from byte offset on). It starts past offset if that was
+                 rotated away
+        """
+        start, data, _ = self._read(offset, size)
+        return start, data
+
+    def length(self):
+        """
+        :return: Bytes of output so far, including any rotated away
+        """
+        return self._read(sys.maxsize, 0)[2]
+
+    def _read(self, offset, size=None):
+        """
+        :return: (start, output, end) for the output from byte offset (or the
+                 oldest kept) on, at most size bytes of it
+        """
+        with self._locked(fcntl and fcntl.LOCK_SH):
+            pos = self.discarded
+            start = max(offset, pos)
+            chunks = []
+            remaining = size
+            for name in self._files():
+                with open(name, "rb") as f:
+                    file_size = os.fstat(f.fileno()).st_size
+                    if offset < pos + file_size and remaining != 0:
+                        f.seek(max(offset - pos, 0))
+                        want = pos + file_size - max(offset, pos)
+                        if remaining is not None:
+                            want = min(want, remaining)
+                            remaining -= want
+                        chunks.append(f.read(want))
+                pos += file_size
+            return min(start, pos), b"".join(chunks), pos
+
+
+if __name__ == "__main__":
+    RunOutput.from_environ(sys.argv[1]).copy(sys.stdin.buffer)
@@ -1,32 +1,205 @@
+import shutil
+import threading
+import time
+
+from mlflow.entities import RunStatus
 from mlflow.projects.submitted_run import LocalSubmittedRun as BaseLocalSubmittedRun
 
+from .local_output import RunOutput
+from .local_state import LocalRunState
+
 
 class LocalSubmittedRun(BaseLocalSubmittedRun):
+    """
+    A run started by LocalExecutor. Runs wait in a LocalScheduler queue (and
+    report SCHEDULED) until there's room for them, so command_proc is None
+    until the process starts. Status and output come from the run's directory
+    (see LocalRunState), so a run unpickled by a restarted gateway can follow
+    the same process without a handle to it
+    """
+
+    # How often wait() checks on a run it has no process handle for
+    POLL_INTERVAL = 5
+    # read_logs() hands out the output's raw bytes as latin-1 text, one
+    # character per byte, so its offsets are the byte offsets used everywhere
+    # else and RunLog gets the bytes back exactly
+    LOG_ENCODING = "latin-1"
+
+    def __init__(self, run_id, command_proc=None, scheduler=None, run_dir=None):
+        super().__init__(run_id, command_proc)
+        self.scheduler = scheduler
+        self.state = LocalRunState(run_dir) if run_dir else None
+        self.output = RunOutput.from_environ(self.state.log_path) if run_dir else None
+        self.cancelled = False
+        self.start_error = None
+        self._started = threading.Event()
+        if command_proc is not None:
+            self._started.set()
+
+    def _started_process(self, proc):
+        """Called by the scheduler once the run's process is started"""
+        self.command_proc = proc
+        if self.state is not None:
+            self.state.record_start(proc.pid)
+        self._started.set()
+
+    def _not_started(self, cancelled=False, error=None):
+        """Called by the scheduler when the run leaves the queue without starting"""
+        self.cancelled = cancelled
+        self.start_error = error
+        self._started.set()
+
+    def _is_alive(self):
+        if self.command_proc is not None:
+            return self.command_proc.poll() is None
+        return self.state is not None and self.state.is_alive()
+
+    def wait(self):
+        self._started.wait()
+        if self.command_proc is not None:
+            self.command_proc.wait()
+        else:
+            while self._is_alive():
+                time.sleep(self.POLL_INTERVAL)
+        return self._get_status() == RunStatus.FINISHED
+
+    def cancel(self):
+        if self.scheduler is not None and self.scheduler.cancel(self):
+            return
+        if not self._is_alive():
+            return
+        if self.state is not None:
+            self.state.mark_cancelled()
+        if self.command_proc is not None:
+            super().cancel()
+        else:
+            self.state.kill()
+
+    def cleanup(self):
+        """
+        Remove the run's directory, i.e. its state and output. For runs being
+        deleted, after cancel()
+        """
+        if self.state is not None:
+            shutil.rmtree(self.state.run_dir, ignore_errors=True)
+
+    def _get_status(self):
+        if self.cancelled:
+            return RunStatus.KILLED
+        if self.start_error:
+            return RunStatus.FAILED
+        if not self._started.is_set():
+            return RunStatus.SCHEDULED
+        if self.state is None:
+            # Not started by LocalExecutor, the process handle is all there is
+            if self.command_proc is None:
+                return None
+            return super()._get_status()
+        if self.state.load() is None:
+            # Still queued when the gateway restarted, so it never will start
+            return RunStatus.FAILED
+        exit_code = self.state.exit_code()
+        if exit_code is not None:
+            return RunStatus.FINISHED if exit_code == 0 else RunStatus.FAILED
+        if self._is_alive():
+            return RunStatus.RUNNING
+        return RunStatus.KILLED if self.state.cancelled() else RunStatus.FAILED
+
+    def get_status(self):
+        status = self._get_status()
+        return RunStatus.to_string(status) if status is not None else "UNKNOWN"
+
+    def _failure_reason(self):
+        if self.start_error:
+            return self.start_error
+        if self.state is None or self._get_status() != RunStatus.FAILED:
+            return None
+        if self.state.load() is None:
+            return "The gateway restarted before the run started"
+        exit_code = self.state.exit_code()
+        if exit_code is not None:
+            return f"Exited with code {exit_code}"
+        return "Exited without recording an exit code"
+
+    def _pid(self):
+        if self.command_proc is not None:
+            return self.command_proc.pid
+        state = self.state.load() if self.state is not None else None
+        return state["pid"] if state else getattr(self, "command_pid", None)
+
     # Popen objs cannot be pickled, add this dunder method to delete the object
-    # Maybe in the future it can be re-hydrated into a different object?
+    # Unpickled runs follow the process through the run directory instead
+    # The scheduler and its locks stay behind too
     def __getstate__(self):
         """Return state values to be pickled."""
         state = self.__dict__.copy()
-        if "command_proc" in state:
+        if state.get("command_proc") is not None:
             state["command_pid"] = state["command_proc"].pid
-            del state["command_proc"]
+        state.pop("command_proc", None)
+        state.pop("_started", None)
+        state["scheduler"] = None
         return state
 
-    def get_run_details(self, show_logs):
-        if not hasattr(self, "logs"):
-            self.logs = ""
-
-        if show_logs:
-            self.get_log()
+    def __setstate__(self, state):
+        """Restore state from the unpickled state values."""
+        self.command_proc = None
+        self.scheduler = None
+        self.state = None
+        self.output = None
+        self.cancelled = False
+        self.start_error = None
+        self.__dict__.update(state)
+        self._started = threading.Event()
+        self._started.set()
 
-        return {
+    def get_run_details(self, show_logs, log_offset=0):
+        details = {
             "status": self.get_status(),
-            "pid": self.command_proc.pid,
-            "logs": self.logs,
+            "pid": self._pid(),
         }
+        failure_reason = self._failure_reason()
+        if failure_reason:
+            details["failure_reason"] = failure_reason
+        if show_logs:
+            # Whatever has been written so far, without waiting for the run.
+            # Offsets are byte offsets into the output
+            data, end = self._read_output(log_offset)
+            details["logs"] = data.decode("utf-8", errors="replace")
+            details["log_offset"] = end
+        return details
+
+    def _read_output(self, offset=0):
+        if self.output is None:
+            return b"", 0
+        return self.output.read(offset)
+
+    def read_logs(self, offset, size):
+        """
+        :return: At most size bytes of output from byte offset on, as latin-1
+                 text. Empty if offset was rotated away, see get_log_start()
+        """
+        if self.output is None:
+            return ""
+        start, data = self.output.read_chunk(offset, size)
+        if start != offset:
+            return ""
+        return data.decode(self.LOG_ENCODING)
+
+    def get_log_length(self):
+        """
+        :return: Bytes of output so far
+        """
+        return self.output.length() if self.output is not None else 0
+
+    def get_log_start(self):
+        """
+        :return: Offset of the oldest output kept, what's before it was
+                 rotated away
+        """
+        return self.output.discarded if self.output is not None else 0
 
     def get_log(self):
-        stdout, stderr = self.command_proc.communicate()
-        assert not stderr
-        self.logs = self.logs + stdout.decode()
-        return self.logs
\ No newline at end of file
+        """
+        :return: The output kept so far
+        """
+        return self._read_output()[0].decode("utf-8", errors="replace")
@@ -0,0 +1,129 @@
+"""
+On-disk state of a run started by LocalExecutor.
+
+Each run has a directory holding everything needed to follow it without a
+process handle: state.json (pid, start time, log path), an exit_code file
+written by the wrapper the run's command is started under, a cancelled
+marker, and its output (see local_output). A gateway that restarted can pick
+its local runs back up from these files alone.
+"""
+
+import json
+import os
+import shlex
+import signal
+import sys
+import tempfile
+import time
+
+# Runs the command, records its exit code, and pipes everything it prints to
+# the output helper. $1 is the run directory, the command follows
+WRAPPER = (
+    'dir=$1; shift; ( "$@"; echo $? > "$dir/exit_code.tmp";'
+    ' mv "$dir/exit_code.tmp" "$dir/exit_code" ) 2>&1'
+    ' | {helper} -m mltf_gateway.submitted_runs.local_output "$dir/output.log"'
+)
+
+
+def process_start_token(pid):
+    """
+    :return: Something that identifies this incarnation of pid, so a reused pid
+             isn't mistaken for the run, or None where that isn't available
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Start time, in clock ticks after boot. The command name (field 2)
+            # can contain spaces, so count from the closing paren
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+class LocalRunState:
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+
+    def _path(self, name):
+        return os.path.join(self.run_dir, name)
+
+    @property
+    def log_path(self):
+        return self._path("output.log")
+
+    def wrap(self, command):
+        """
+        :return: Command line that runs command under the wrapper
+        """
+        script = WRAPPER.format(helper=shlex.quote(sys.executable))
+        return ["/bin/sh", "-c", script, "mltf-run", self.run_dir] + list(command)
+
+    def record_start(self, pid):
+        """
+        Write state.json for the run's freshly started wrapper process
+        """
+        state = {
+            "pid": pid,
+            "start_time": time.time(),
+            "process_start": process_start_token(pid),
+            "log_path": self.log_path,
+        }
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.run_dir, prefix=".state-", delete=False
+        ) as f:
+            json.dump(state, f)
+        os.replace(f.name, self._path("state.json"))
+
+    def load(self):
+        """
+        :return: What record_start() wrote, or None if the run never started
+        """
+        try:
+            with open(self._path("state.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def exit_code(self):
+        """
+        :return: The command's exit code, or None if it hasn't exited (or was
+                 killed along with the wrapper)
+        """
+        try:
+            with open(self._path("exit_code")) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def mark_cancelled(self):
+        open(self._path("cancelled"), "w").close()
+
+    def cancelled(self):
+        return os.path.exists(self._path("cancelled"))
+
+    def is_alive(self):
+        """
+        :return: Whether the run's wrapper process is still running
+        """
+        state = self.load()
+        if state is None:
+            return False
+        try:
+            os.kill(state["pid"], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # Someone else's process, so the pid was reused
+            return False
+        token = state.get("process_start")
+        return token is None or token == process_start_token(state["pid"])
+
+    def kill(self):
+        """
+        Terminate the run's process group (the wrapper leads its own session)
+        """
+        if not self.is_alive():
+            return
+        try:
+            os.killpg(self.load()["pid"], signal.SIGTERM)
+        except OSError:
+            pass
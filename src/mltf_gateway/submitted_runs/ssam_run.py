@@ -4,7 +4,7 @@ SSAMSubmittedRun class to manage a Slurm job launched through SSAM to run an MLf
 
 import logging
 import time
-from threading import RLock
+from threading import Event, Lock, RLock
 from typing import List
 
 import requests
@@ -12,10 +12,110 @@ from mlflow.entities import RunStatus
 from mlflow.tracking import MlflowClient
 from mlflow.utils.logging_utils import _configure_mlflow_loggers
 
+from ..metrics import track_ssam_call
+
 _configure_mlflow_loggers(root_module_name=__name__)
 _logger = logging.getLogger(__name__)
 
 
+class _SharedPoll:
+    """
+    A poll loop in progress for one SSAM job. Followers block on it until the
+    leader sees the job terminate
+    """
+
+    def __init__(self):
+        self._done = Event()
+        self.status = None
+        self.failure_reason = None
+
+    def finish(self, status, failure_reason):
+        self.status = status
+        self.failure_reason = failure_reason
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        return self.status, self.failure_reason
+
+
+class SSAMWaitRegistry:
+    """
+    Lets every waiter on the same SSAM job share one poll loop. The first thread to
+    wait on a job polls SSAM on behalf of everyone, backing off exponentially while
+    the job state is unchanged. Threads arriving later block until the leader sees
+    the job terminate, then all of them are released at once
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._polls = {}
+
+    def wait(self, run: "SSAMSubmittedRun") -> bool:
+        """
+        Block until the run's job is terminated or gone
+        :param run: Run to wait on
+        :return: True if this caller did the polling, False if it followed another waiter
+        """
+        key = (run._ssam_url, run.job_id)
+        with self._lock:
+            poll = self._polls.get(key)
+            is_leader = poll is None
+            if is_leader:
+                poll = _SharedPoll()
+                self._polls[key] = poll
+
+        if not is_leader:
+            status, failure_reason = poll.wait()
+            with run._status_lock:
+                run._status = status
+                run._failure_reason = failure_reason
+            return False
+
+        try:
+            self._poll_until_terminated(run)
+        finally:
+            with self._lock:
+                del self._polls[key]
+            poll.finish(run._status, run._failure_reason)
+        return True
+
+    @staticmethod
+    def _poll_until_terminated(run: "SSAMSubmittedRun"):
+        interval = run.POLL_STATUS_INTERVAL
+        last_status = run._status
+        while True:
+            try:
+                status = run._fetch_status()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # Likely transient (SSAM restarting, a network blip), so keep
+                # polling and keep backing off rather than calling the job gone
+                _logger.error(f"Error fetching status for job {run.job_id}: {e}")
+            else:
+                if not status or RunStatus.is_terminated(status):
+                    return
+                if status != last_status:
+                    # Something is happening, go back to polling quickly
+                    last_status = status
+                    interval = run.POLL_STATUS_INTERVAL
+            time.sleep(interval)
+            interval = min(
+                interval * run.POLL_BACKOFF_FACTOR, run.POLL_STATUS_MAX_INTERVAL
+            )
+
+
+_wait_registry = SSAMWaitRegistry()
+
+# Mapping SSAM job states to MLflow RunStatus
+SSAM_JOB_STATES = {
+    "PENDING": RunStatus.SCHEDULED,
+    "COMPLETED": RunStatus.FINISHED,
+    "FAILED": RunStatus.FAILED,
+    "RUNNING": RunStatus.RUNNING,
+    "CANCELLED": RunStatus.KILLED,
+}
+
+
 class SSAMSubmittedRun:
     """
     Instance of SubmittedRun
@@ -23,6 +123,8 @@ class SSAMSubmittedRun:
     project.
     :param ssam_job_id: ID of the submitted SSAM Job.
     :param mlflow_run_id: ID of the MLflow project run.
+    :param gateway_id: Gateway ID of the run, keys its entry in log_archive
+    :param log_archive: LogArchive to keep the job's final output in
     """
 
     def __init__(
@@ -32,6 +134,8 @@ class SSAMSubmittedRun:
         ssam_url: str,
         auth_token: str,
         user_subject: str,
+        gateway_id: str = None,
+        log_archive=None,
     ) -> None:
         super().__init__()
         self._mlflow_run_id = mlflow_run_id
@@ -39,12 +143,26 @@ class SSAMSubmittedRun:
         self._ssam_url = ssam_url
         self._auth_token = auth_token
         self.user_subject = user_subject
+        self.gateway_id = gateway_id
+        self.log_archive = log_archive
         self._status = RunStatus.SCHEDULED
         self._failure_reason = None
         self._status_lock = RLock()
+        # Job output already fetched from SSAM, so repeated log reads only need
+        # to ask for what was appended since the last read. Once a terminated
+        # job's output is in the log archive the cache is dropped and reads seek
+        # in the archive instead, _archived_length is its length then
+        self._log_cache = None
+        self._log_complete = False
+        self._archived_length = None
+        self._log_lock = RLock()
 
-    # How often to poll run status when waiting on a run
+    # How often to poll run status when waiting on a run. The interval grows by
+    # POLL_BACKOFF_FACTOR each time the status is unchanged, up to
+    # POLL_STATUS_MAX_INTERVAL, and resets when the status changes
     POLL_STATUS_INTERVAL = 5
+    POLL_STATUS_MAX_INTERVAL = 300
+    POLL_BACKOFF_FACTOR = 2
 
     @property
     def run_id(self) -> str:
@@ -57,6 +175,13 @@ class SSAMSubmittedRun:
         """
         return self.ssam_job_ids[-1]
 
+    @property
+    def last_known_status(self) -> RunStatus:
+        """
+        :return: The status from the last time SSAM was asked, without asking again
+        """
+        return self._status
+
     def is_terminated_or_gone(self):
         """
         :return: True if the SSAM job is terminated or gone, False otherwise.
@@ -68,34 +193,17 @@ class SSAMSubmittedRun:
         """
         Implements the wait functionality for a ssam job. When we notice that the job
         is complete, attempt to grab the job logs and attach them to the run as an
-        artifact
+        artifact. Concurrent waiters on the same job share a single poll loop, and
+        only the one that did the polling uploads the logs. The logs come from
+        the same cache and archive as every other read, so uploading them
+        doesn't fetch them from SSAM again
         :return: Boolean success
         """
-        while not self.is_terminated_or_gone():
-            time.sleep(self.POLL_STATUS_INTERVAL)
+        did_poll = _wait_registry.wait(self)
 
-        try:
-            headers = {
-                "Authorization": f"Bearer {self._auth_token}",
-            }
-            response = requests.get(
-                f"{self._ssam_url}/api/slurm/{self.job_id}/output",
-                headers=headers,
-                timeout=30,
-            )
-            response.raise_for_status()
-            response_json = response.json()
-            if response_json.get("success"):
-                log_data = response_json.get("data", {})
-                # The log is the value of the first key in the data dictionary
-                if log_data:
-                    log_lines = next(iter(log_data.values()))
-                    MlflowClient().log_text(
-                        self.run_id, log_lines, f"ssam-{self.job_id}.txt"
-                    )
-        except requests.exceptions.RequestException as e:
-            message = f"Error fetching logs for job {self.job_id}: {e}"
-            _logger.error(message)
+        log_lines = self.get_logs() if did_poll else None
+        if log_lines:
+            MlflowClient().log_text(self.run_id, log_lines, f"ssam-{self.job_id}.txt")
 
         return self._status == RunStatus.FINISHED
 
@@ -105,12 +213,13 @@ class SSAMSubmittedRun:
             headers = {
                 "Authorization": f"Bearer {self._auth_token}",
             }
-            response = requests.post(
-                f"{self._ssam_url}/api/slurm/{self.job_id}/cancel",
-                headers=headers,
-                timeout=30,
-            )
-            response.raise_for_status()
+            with track_ssam_call("cancel"):
+                response = requests.post(
+                    f"{self._ssam_url}/api/slurm/{self.job_id}/cancel",
+                    headers=headers,
+                    timeout=30,
+                )
+                response.raise_for_status()
             _logger.info(f"Successfully sent cancel request for job {self.job_id}")
         except requests.exceptions.RequestException as e:
             _logger.warning(
@@ -123,9 +232,38 @@ class SSAMSubmittedRun:
         self._update_status()
         return self._status
 
-    def get_run_details(self, show_logs=False):
+    def get_run_details(self, show_logs=False, log_offset=0):
         status = self.get_status()
+        details = self._details_for_status(status)
+        if status is not None and show_logs:
+            details["logs"] = self.get_logs(log_offset)
+            details["log_offset"] = self.get_log_length()
+
+        return details
 
+    def final_run_details(self, show_logs=False, log_offset=0):
+        """
+        get_run_details() from what is already known, for a run that finished
+        and whose output (if show_logs) has been read to the end
+        :return: The details, or None if they could still change
+        """
+        status = self._status
+        if status is None or not RunStatus.is_terminated(status):
+            return None
+        details = self._details_for_status(status)
+        if show_logs:
+            with self._log_lock:
+                self._load_archived_log()
+                if not self._log_complete:
+                    return None
+                logs = self._read_cached(log_offset)
+                if logs is None:
+                    return None
+                details["logs"] = logs
+                details["log_offset"] = self.get_log_length()
+        return details
+
+    def _details_for_status(self, status):
         if status is None:
             return {
                 "status": "UNKNOWN",
@@ -135,71 +273,176 @@ class SSAMSubmittedRun:
         details = {"status": RunStatus.to_string(status)}
         if status == RunStatus.FAILED and self._failure_reason:
             details["failure_reason"] = self._failure_reason
+        return details
 
-        if show_logs:
-            details["logs"] = self.get_logs()
+    def get_logs(self, offset=0):
+        """
+        Returns the job output starting at character offset ``offset``. Output is
+        cached per job, so only the part appended since the previous call is
+        requested from SSAM
+        :param offset: Where in the output to start returning text
+        :return: Log text, or None if no output could be retrieved
+        """
+        with self._log_lock:
+            self._load_archived_log()
+            if not self._log_complete:
+                self._fetch_new_output()
+            return self._read_cached(offset)
 
-        return details
+    def read_logs(self, offset, size):
+        """
+        Like get_logs(), but returns at most size characters, and only asks SSAM
+        for new output once offset reaches the end of what is cached
+        """
+        with self._log_lock:
+            self._load_archived_log()
+            cached = self._log_cache
+            if not self._log_complete and (cached is None or offset >= len(cached)):
+                self._fetch_new_output()
+            return self._read_cached(offset, size)
+
+    def get_log_length(self):
+        """
+        :return: Length of the cached output, i.e. the offset a tailing client should
+                 ask for next
+        """
+        with self._log_lock:
+            if self._archived_length is not None:
+                return self._archived_length
+            return len(self._log_cache) if self._log_cache is not None else 0
+
+    def _read_cached(self, offset, size=None):
+        """
+        Output already fetched, from the cache or the log archive. Callers hold
+        _log_lock
+        :return: At most size characters (all if None) from offset, or None if
+                 there is no output
+        """
+        if self._archived_length is not None:
+            text = self.log_archive.read(self.gateway_id, offset, size)
+            if text is None:
+                # Pruned from the archive, ask SSAM again next time
+                self._archived_length = None
+                self._log_complete = False
+            return text
+        if self._log_cache is None:
+            return None
+        end = None if size is None else offset + size
+        return self._log_cache[offset:end]
+
+    def _load_archived_log(self):
+        """
+        With nothing cached, e.g. after a restart, check whether the output is in
+        the log archive. Only terminated jobs are archived, so what's found there
+        is complete. Only its length is read, the text stays on disk.
+        Callers hold _log_lock
+        """
+        if (
+            self._log_complete
+            or self._log_cache is not None
+            or self.log_archive is None
+        ):
+            return
+        length = self.log_archive.length(self.gateway_id)
+        if length is not None:
+            self._archived_length = length
+            self._log_complete = True
 
-    def get_logs(self):
+    def _archive_log(self):
+        """
+        Write the complete output to the log archive and drop it from memory.
+        If it can't be archived it stays cached. Callers hold _log_lock
+        """
+        if self.log_archive is None:
+            return
+        try:
+            self.log_archive.store(self.gateway_id, self._log_cache)
+        except OSError as e:
+            _logger.warning(f"Could not archive logs for job {self.job_id}: {e}")
+            return
+        self._archived_length = len(self._log_cache)
+        self._log_cache = None
+
+    def _fetch_new_output(self):
+        """
+        Ask SSAM for output past what is already cached. If SSAM honors the offset
+        parameter it says so by echoing back an "offset" and only sends the new
+        text. Otherwise the full output comes back and we keep whatever extends
+        past the cached length
+        """
+        cached = self._log_cache or ""
+        # Once a job is terminated its output can't grow, so fetch it one last
+        # time and then serve it from the cache
+        terminated = self._status is not None and RunStatus.is_terminated(self._status)
         try:
             headers = {
                 "Authorization": f"Bearer {self._auth_token}",
             }
-            response = requests.get(
-                f"{self._ssam_url}/api/slurm/{self.job_id}/output",
-                headers=headers,
-                timeout=30,
-            )
-            response.raise_for_status()
+            with track_ssam_call("output"):
+                response = requests.get(
+                    f"{self._ssam_url}/api/slurm/{self.job_id}/output",
+                    headers=headers,
+                    params={"offset": len(cached)},
+                    timeout=30,
+                )
+                response.raise_for_status()
             response_json = response.json()
-            if response_json.get("success"):
-                log_data = response_json.get("data", {})
-                if log_data:
-                    return next(iter(log_data.values()))
         except requests.exceptions.RequestException as e:
             _logger.error(f"Error fetching logs for job {self.job_id}: {e}")
-        return None
+            return
 
-    def _update_status(self) -> RunStatus:
-        try:
-            headers = {
-                "Authorization": f"Bearer {self._auth_token}",
-            }
+        self._apply_output_response(response_json, cached, terminated)
+
+    def _apply_output_response(self, response_json, cached, terminated):
+        """
+        Merge an SSAM output response into the log cache. Callers hold _log_lock
+        :param cached: The cached output the request was made against
+        :param terminated: Whether the job was terminated before the request
+        """
+        if not response_json.get("success"):
+            return
+        log_data = response_json.get("data", {})
+        # The log is the value of the first key in the data dictionary
+        text = next(iter(log_data.values())) if log_data else ""
+        if text is None:
+            text = ""
+
+        returned_offset = response_json.get("offset")
+        if returned_offset is not None:
+            self._log_cache = cached[: int(returned_offset)] + text
+        elif len(text) >= len(cached):
+            self._log_cache = cached + text[len(cached) :]
+        else:
+            # Output shrank (e.g. the job was requeued and its log truncated)
+            self._log_cache = text
+        if terminated:
+            self._log_complete = True
+            self._archive_log()
+
+    def _fetch_status(self) -> RunStatus:
+        """
+        Ask SSAM for the job's status
+        :return: The status, or None if SSAM doesn't know the job
+        :raises requests.exceptions.RequestException, ValueError: if SSAM
+                couldn't be asked
+        """
+        headers = {
+            "Authorization": f"Bearer {self._auth_token}",
+        }
+        with track_ssam_call("status"):
             response = requests.get(
-                f"{self._ssam_url}/api/slurm/{self.job_id}", headers=headers, timeout=30
+                f"{self._ssam_url}/api/slurm/{self.job_id}",
+                headers=headers,
+                timeout=30,
             )
-            response.raise_for_status()
-            response_json = response.json()
-            if response_json.get("success"):
-                job_state = response_json.get("data", {}).get("job_state")
-
-                with self._status_lock:
-                    # Mapping SSAM status to MLflow RunStatus
-                    if job_state == "PENDING":
-                        self._status = RunStatus.SCHEDULED
-                    elif job_state == "COMPLETED":
-                        self._status = RunStatus.FINISHED
-                    elif job_state == "FAILED":
-                        self._status = RunStatus.FAILED
-                        self._failure_reason = response_json.get("data", {}).get(
-                            "failure_reason"
-                        )
-                    elif job_state == "RUNNING":
-                        self._status = RunStatus.RUNNING
-                    else:
-                        _logger.warning(
-                            "Job ID %s, has an unmapped status of: %s",
-                            self.job_id,
-                            job_state,
-                        )
-                        self._status = None  # Or some other default
-            else:
-                message = f"Failed to get status for job {self.job_id}: {response_json.get('message')}"
-                _logger.error(message)
-                with self._status_lock:
-                    self._status = None
+            # SSAM says "unknown job" with a 404, which isn't a failed request
+            if response.status_code != 404:
+                response.raise_for_status()
+        return self._apply_status_response(response.json())
 
+    def _update_status(self) -> RunStatus:
+        try:
+            self._fetch_status()
         except requests.exceptions.RequestException as e:
             message = f"Error fetching status for job {self.job_id}: {e}"
             _logger.error(message)
@@ -213,14 +456,55 @@ class SSAMSubmittedRun:
 
         return self._status
 
+    def _apply_status_response(self, response_json) -> RunStatus:
+        """
+        Update the run's status from an SSAM job status response
+        """
+        if not response_json.get("success"):
+            message = f"Failed to get status for job {self.job_id}: {response_json.get('message')}"
+            _logger.error(message)
+            with self._status_lock:
+                self._status = None
+            return None
+
+        data = response_json.get("data", {})
+        job_state = data.get("job_state")
+        with self._status_lock:
+            if job_state in SSAM_JOB_STATES:
+                self._status = SSAM_JOB_STATES[job_state]
+                if self._status == RunStatus.FAILED:
+                    self._failure_reason = data.get("failure_reason")
+            else:
+                _logger.warning(
+                    "Job ID %s, has an unmapped status of: %s",
+                    self.job_id,
+                    job_state,
+                )
+                self._status = None  # Or some other default
+        return self._status
+
     # Locks cannot be pickled, add these dunder methods to delete/restore lock
+    # The log cache is dropped too, otherwise every job's output would be
+    # rewritten each time the run database is persisted. Terminated jobs' output
+    # comes back from the log archive
     def __getstate__(self):
         """Return state values to be pickled."""
         state = self.__dict__.copy()
         del state["_status_lock"]
+        state.pop("_log_lock", None)
+        state["_log_cache"] = None
+        state["_log_complete"] = False
+        state["_archived_length"] = None
         return state
 
     def __setstate__(self, state):
         """Restore state from the unpickled state values."""
+        self._log_cache = None
+        self._log_complete = False
+        self._archived_length = None
+        # Runs pickled before the log archive existed
+        self.gateway_id = None
+        self.log_archive = None
         self.__dict__.update(state)
         self._status_lock = RLock()
+        self._log_lock = RLock()
@@ -0,0 +1,295 @@
+"""
+Lightweight span tracing for the submission path.
+
+Spans nest through a contextvar, so each thread (and each asyncio task) has
+its own current span. The client sends the current span along with its
+requests in a W3C "traceparent" header, and the gateway continues the same
+trace, so client, gateway and SSAM timings of one submission share a trace id.
+
+Finished spans are written to the file named by MLTF_TRACE_FILE, one OTLP/JSON
+ExportTraceServiceRequest per line. That's the format the OpenTelemetry
+collector's otlpjsonfile receiver reads, so traces can be loaded into Jaeger,
+Tempo, etc. Without MLTF_TRACE_FILE spans are still timed and propagated, but
+not written anywhere.
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+TRACE_FILE_ENV = "MLTF_TRACE_FILE"
+SERVICE_NAME_ENV = "OTEL_SERVICE_NAME"
+TRACEPARENT_HEADER = "traceparent"
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+log = logging.getLogger(__name__)
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span = contextvars.ContextVar("mltf_current_span", default=None)
+
+
+class SpanContext:
+    """
+    Identifies a span, possibly one in another process
+    """
+
+    def __init__(self, trace_id, span_id):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    def to_traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+def parse_traceparent(header):
+    """
+    :return: SpanContext of the remote parent, or None if the header is
+             missing or malformed
+    """
+    if not header:
+        return None
+    match = _TRACEPARENT_RE.match(header.strip().lower())
+    if not match:
+        return None
+    trace_id, span_id, _ = match.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id)
+
+
+class Span:
+    def __init__(self, name, parent=None, kind=KIND_INTERNAL, attributes=None):
+        """
+        :param parent: SpanContext of the parent span, if any
+        """
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_UNSET
+        self.status_message = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def context(self):
+        return SpanContext(self.trace_id, self.span_id)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration(self):
+        """
+        :return: Duration in seconds, or None if the span hasn't ended
+        """
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()
+            ],
+            "status": {"code": self.status},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class FileSpanExporter:
+    """
+    Appends finished spans to a file as OTLP/JSON, one span per line
+    """
+
+    def __init__(self, path, service_name="mltf"):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            },
+                            {
+                                "key": "process.pid",
+                                "value": {"intValue": str(os.getpid())},
+                            },
+                        ]
+                    },
+                    "scopeSpans": [
+                        {"scope": {"name": "mltf_gateway"}, "spans": [span.to_otlp()]}
+                    ],
+                }
+            ]
+        }
+        line = json.dumps(request, separators=(",", ":")) + "\n"
+        # Several processes (client, gateway workers) may share the file. A
+        # single O_APPEND write of one line keeps their spans from interleaving
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, line.encode("utf-8"))
+            finally:
+                os.close(fd)
+
+
+_exporter = None
+_exporter_configured = False
+_default_service_name = "mltf"
+
+
+def configure(path=None, service_name=None):
+    """
+    Set where finished spans go. With no path, MLTF_TRACE_FILE is used, and if
+    that isn't set either, spans aren't exported
+    :param service_name: Reported as service.name. OTEL_SERVICE_NAME overrides it
+    """
+    global _exporter, _exporter_configured, _default_service_name
+    if service_name:
+        _default_service_name = service_name
+    path = path or os.environ.get(TRACE_FILE_ENV)
+    name = os.environ.get(SERVICE_NAME_ENV) or _default_service_name
+    _exporter = FileSpanExporter(path, name) if path else None
+    _exporter_configured = True
+
+
+def set_service_name(service_name):
+    """
+    Name this process reports its spans under, unless OTEL_SERVICE_NAME is set
+    """
+    global _default_service_name
+    _default_service_name = service_name
+    if _exporter is not None and not os.environ.get(SERVICE_NAME_ENV):
+        _exporter.service_name = service_name
+
+
+def _export(span):
+    if not _exporter_configured:
+        configure()
+    if _exporter is None:
+        return
+    try:
+        _exporter.export(span)
+    except OSError as e:
+        log.warning(f"Couldn't write span {span.name} to {_exporter.path}: {e}")
+
+
+def current_span():
+    return _current_span.get()
+
+
+def start_span(name, parent=None, kind=KIND_INTERNAL, attributes=None):
+    """
+    Start a span and make it current. It must be finished with end_span()
+    :param parent: SpanContext to use as the parent, defaults to the current span
+    :return: (span, token to pass to end_span)
+    """
+    if parent is None:
+        current = _current_span.get()
+        parent = current.context if current else None
+    span = Span(name, parent, kind, attributes)
+    return span, _current_span.set(span)
+
+
+def end_span(span, token, error=None):
+    if error is not None:
+        span.set_error(f"{type(error).__name__}: {error}")
+    span.end()
+    _current_span.reset(token)
+    _export(span)
+
+
+@contextlib.contextmanager
+def span(name, parent=None, kind=KIND_INTERNAL, **attributes):
+    """
+    Time the enclosed block as a child of the current span
+    """
+    s, token = start_span(name, parent, kind, attributes)
+    try:
+        yield s
+    except BaseException as e:
+        end_span(s, token, e)
+        raise
+    else:
+        end_span(s, token)
+
+
+def traced(name=None, kind=KIND_INTERNAL):
+    """
+    Decorator to run a function in its own span, named after the function
+    unless name is given
+    """
+
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with span(name or f.__name__, kind=kind):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def inject(headers):
+    """
+    Add a traceparent header for the current span, if there is one
+    :return: headers, for convenience
+    """
+    current = _current_span.get()
+    if current is not None:
+        headers[TRACEPARENT_HEADER] = current.context.to_traceparent()
+    return headers
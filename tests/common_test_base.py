@@ -1,10 +1,16 @@
 import os
 import subprocess
 import tempfile
+import time
 import unittest
+from unittest import mock
+
+import jwt
 
 import mltf_gateway.backend_adapter
+import mltf_gateway.flaskapp.utils
 import mltf_gateway.gateway_server
+from mltf_gateway.fake_ssam import FakeSSAMConfig, FakeSSAMServer, make_fake_token
 
 
 class MockedGatewayTestBase(unittest.TestCase):
@@ -48,3 +54,86 @@ class MockedGatewayTestBase(unittest.TestCase):
                 pass
 
         raise RuntimeError("No containerization engine found for test")
+
+
+def make_user_token(name="USER", email="user@example.com", lifetime=3600):
+    """
+    A user's access token, signed with a made-up key. Only accepted while
+    unverified_tokens() is in effect
+    """
+    return jwt.encode(
+        {"name": name, "email": email, "exp": time.time() + lifetime},
+        "not-a-real-key",
+        algorithm="HS256",
+    )
+
+
+def unverified_tokens():
+    """
+    Patcher making the gateway skip token signature verification, as there is
+    no keycloak to verify them against in the tests
+    """
+    return mock.patch.object(
+        mltf_gateway.flaskapp.utils,
+        "decode",
+        lambda token: jwt.decode(token, options={"verify_signature": False}),
+    )
+
+
+class FakeSSAMGatewayTestBase(unittest.TestCase):
+    """
+    Environment for running the gateway in-process against a FakeSSAMServer:
+    a temporary directory for the staging area and run database, the SSAM
+    settings, a user token in self.headers, and no token verification.
+    Subclasses add their own settings with self.patch() before creating
+    the app
+    """
+
+    # MLTF_EXECUTOR, the fake SSAM is only started for "ssam"
+    EXECUTOR = "ssam"
+    # Keyword arguments for the FakeSSAMConfig
+    SSAM_CONFIG = {}
+
+    def setUp(self):
+        self.tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDirObj.cleanup)
+        self.tempDir = self.tempDirObj.name
+        self.token = make_user_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        environ = {
+            "MLTF_EXECUTOR": self.EXECUTOR,
+            "DATABASE_URL": "sqlite:///:memory:",
+            "MLTF_STAGING_DIR": f"{self.tempDir}/staging",
+            "MLTF_GATEWAY_TOKEN": self.token,
+        }
+        if self.EXECUTOR == "ssam":
+            self.ssam_config = FakeSSAMConfig(**self.SSAM_CONFIG)
+            self.ssam = FakeSSAMServer(self.ssam_config).start()
+            self.addCleanup(self.ssam.stop)
+            ssam_token = make_fake_token()
+            environ.update(
+                SSAM_URL=self.ssam.url, AUTH_TOKEN=ssam_token, SLURM_TOKEN=ssam_token
+            )
+        self.patch(mock.patch.dict(os.environ, environ))
+        self.patch(
+            mock.patch.object(
+                mltf_gateway.gateway_server,
+                "RUN_DATABASE",
+                f"{self.tempDir}/gateway_run_db.pkl",
+            )
+        )
+        self.patch(
+            mock.patch.object(
+                mltf_gateway.backend_adapter, "INPROCESS_GATEWAY_APP", None
+            )
+        )
+        self.patch(unverified_tokens())
+
+    def patch(self, patcher):
+        """
+        Start patcher, and stop it when the test is done
+        :return: What the patcher returned when started
+        """
+        started = patcher.start()
+        self.addCleanup(patcher.stop)
+        return started
@@ -0,0 +1,206 @@
+import asyncio
+import importlib.util
+import threading
+import time
+import unittest
+from unittest import mock
+
+import mltf_gateway.run_log
+from mltf_gateway.executors.base import get_script
+from mltf_gateway.run_log import RunLog
+from mltf_gateway.submitted_runs.ssam_run import SSAMSubmittedRun
+from tests.common_test_base import FakeSSAMGatewayTestBase
+
+HAVE_ASYNC_DEPS = all(
+    importlib.util.find_spec(m) for m in ("httpx", "starlette", "uvicorn")
+)
+
+
+@unittest.skipUnless(HAVE_ASYNC_DEPS, "needs mltf-gateway[async]")
+class ASGIGatewayTestCase(FakeSSAMGatewayTestBase):
+    SSAM_CONFIG = {"pending_time": 0, "job_duration": 0.5}
+
+    def setUp(self):
+        from mltf_gateway.flaskapp.app import create_app
+        from mltf_gateway.flaskapp.asgi import create_asgi_app
+
+        super().setUp()
+        self.patch(mock.patch.object(SSAMSubmittedRun, "POLL_STATUS_INTERVAL", 0.05))
+        self.patch(mock.patch.object(SSAMSubmittedRun, "POLL_STATUS_MAX_INTERVAL", 0.1))
+        self.app = create_asgi_app(create_app())
+        self.assertTrue(self.app.state.startup.wait(timeout=10))
+
+    def submit(self):
+        gateway_server = self.app.state.gateway_server
+        return gateway_server.enqueue_run(
+            "RUNID",
+            get_script("mltf-hello-world.tar.gz"),
+            "",
+            {},
+            {},
+            "https://mlflow.invalid",
+            "",
+            "USER",
+            "",
+        )
+
+    def test_job_endpoints(self):
+        from starlette.testclient import TestClient
+
+        run = self.submit()
+        with TestClient(self.app) as client:
+            self.assertEqual(client.get("/api/jobs").status_code, 401)
+            jobs = client.get("/api/jobs", headers=self.headers).json()
+            self.assertEqual([j["gateway_id"] for j in jobs], [run.gateway_id])
+
+            resp = client.get(
+                f"/api/jobs/{run.gateway_id}/wait",
+                params={"timeout": 10, "show_logs": "true"},
+                headers=self.headers,
+            )
+            self.assertEqual(resp.status_code, 200)
+            details = resp.json()
+            self.assertEqual(details["status"], "FINISHED")
+            self.assertIn("job completed", details["logs"])
+
+            resp = client.get(
+                f"/api/jobs/{run.gateway_id}",
+                params={"offset": details["log_offset"]},
+                headers=self.headers,
+            )
+            self.assertEqual(resp.json()["logs"], "")
+            resp = client.get(
+                f"/api/jobs/{run.gateway_id}",
+                params={"offset": details["log_offset"]},
+                headers=dict(self.headers, **{"If-None-Match": resp.headers["ETag"]}),
+            )
+            self.assertEqual(resp.status_code, 304)
+            resp = client.get(
+                f"/api/jobs/{run.gateway_id}",
+                params={"offset": -1},
+                headers=self.headers,
+            )
+            self.assertEqual(resp.status_code, 400)
+
+            self.assertEqual(
+                client.delete(
+                    f"/api/jobs/{run.gateway_id}", headers=self.headers
+                ).json()["run_id"],
+                run.gateway_id,
+            )
+            resp = client.get(f"/api/jobs/{run.gateway_id}", headers=self.headers)
+            self.assertEqual(resp.status_code, 404)
+
+            # Everything else is still served by Flask
+            self.assertEqual(client.get("/healthz").json()["status"], "ok")
+
+    def test_logs(self):
+        from starlette.testclient import TestClient
+
+        run = self.submit()
+        url = f"/api/jobs/{run.gateway_id}/logs"
+        with TestClient(self.app) as client, mock.patch.object(
+            mltf_gateway.run_log, "LOG_FOLLOW_INTERVAL", 0.05
+        ), mock.patch.object(RunLog, "iter_bytes", side_effect=AssertionError):
+            # Served natively, not by the Flask route reading through RunLog
+            resp = client.get(url, params={"follow": "true"}, headers=self.headers)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.headers["Content-Type"], "text/plain; charset=utf-8")
+            followed = resp.content
+            self.assertTrue(followed.endswith(b"job completed\n"), followed)
+
+            resp = client.get(
+                url,
+                params={"follow": "true"},
+                headers=dict(self.headers, **{"Accept-Encoding": "gzip"}),
+            )
+            self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+            # The test client decompresses it
+            self.assertEqual(resp.content, followed)
+
+            resp = client.get(url, headers=dict(self.headers, Range="bytes=5-9"))
+            self.assertEqual(resp.status_code, 206)
+            self.assertEqual(resp.content, followed[5:10])
+            self.assertEqual(
+                resp.headers["Content-Range"], f"bytes 5-9/{len(followed)}"
+            )
+            resp = client.get(
+                url, headers=dict(self.headers, Range=f"bytes={len(followed)}-")
+            )
+            self.assertEqual(resp.status_code, 416)
+            resp = client.get(url, params={"offset": 10}, headers=self.headers)
+            self.assertEqual(resp.content, followed[10:])
+            resp = client.get(url, params={"offset": -1}, headers=self.headers)
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(client.get(url).status_code, 401)
+            resp = client.get("/api/jobs/nope/logs", headers=self.headers)
+            self.assertEqual(resp.status_code, 404)
+
+    def test_wait_timeout(self):
+        from starlette.testclient import TestClient
+
+        self.ssam_config.pending_time = 60
+        run = self.submit()
+        with TestClient(self.app) as client:
+            resp = client.get(
+                f"/api/jobs/{run.gateway_id}/wait",
+                params={"timeout": 0.2},
+                headers=self.headers,
+            )
+        self.assertEqual(resp.json()["status"], "SCHEDULED")
+
+    def test_waiters_share_one_poll(self):
+        import httpx
+
+        run = self.submit()
+        waiters = 50
+
+        async def wait_all():
+            transport = httpx.ASGITransport(app=self.app)
+            async with self.app.router.lifespan_context(self.app), httpx.AsyncClient(
+                transport=transport, base_url="http://gateway"
+            ) as client:
+                return await asyncio.gather(
+                    *(
+                        client.get(
+                            f"/api/jobs/{run.gateway_id}/wait",
+                            params={"timeout": 10},
+                            headers=self.headers,
+                        )
+                        for _ in range(waiters)
+                    )
+                )
+
+        before = self.ssam.state.request_count
+        responses = asyncio.run(wait_all())
+        self.assertEqual(
+            {r.json()["status"] for r in responses}, {"FINISHED"}, responses[0].text
+        )
+        # One shared poll loop, rather than a poll loop per waiter
+        self.assertLess(self.ssam.state.request_count - before, waiters)
+
+    def test_wait_through_ssam_errors(self):
+        from starlette.testclient import TestClient
+
+        run = self.submit()
+        self.ssam_config.error_rate = 1.0
+
+        def recover():
+            time.sleep(0.3)
+            self.ssam_config.error_rate = 0.0
+
+        recovery = threading.Thread(target=recover)
+        recovery.start()
+        self.addCleanup(recovery.join)
+        with TestClient(self.app) as client:
+            resp = client.get(
+                f"/api/jobs/{run.gateway_id}/wait",
+                params={"timeout": 10},
+                headers=self.headers,
+            )
+        # SSAM failing for a while doesn't end the wait as if the job were gone
+        self.assertEqual(resp.json()["status"], "FINISHED")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+import unittest
+
+import mltf_gateway.gateway_server
+from mltf_gateway.benchmark import main, percentile
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_local_benchmark(self):
+        run_database = mltf_gateway.gateway_server.RUN_DATABASE
+        environ = dict(os.environ)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "bench.json")
+            main(
+                [
+                    "--stored-runs",
+                    "20",
+                    "--concurrency",
+                    "1",
+                    "2",
+                    "--requests",
+                    "4",
+                    "--users",
+                    "2",
+                    "--output",
+                    output,
+                ]
+            )
+            with open(output) as f:
+                report = json.load(f)
+        ops = {(r["op"], r["concurrency"]) for r in report["results"]}
+        for op in ("submit", "list", "show", "show_logs", "delete"):
+            self.assertIn((op, 1), ops)
+            self.assertIn((op, 2), ops)
+        for result in report["results"]:
+            self.assertEqual(result["errors"], 0, result)
+            self.assertEqual(result["stored_runs"], 20)
+            self.assertIsNotNone(result["latency_ms"]["p95"])
+        # The harness must not leak its configuration into the rest of the process
+        self.assertEqual(mltf_gateway.gateway_server.RUN_DATABASE, run_database)
+        self.assertEqual(dict(os.environ), environ)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import subprocess
+import sys
+import unittest
+
+# Cumulative import time allowed for the CLI module. It's ~25ms when only the
+# stdlib and mltf_gateway are imported, and well over a second once mlflow or
+# flask sneak back in, so this leaves room for slow CI machines
+CLI_IMPORT_BUDGET_US = 300_000
+
+HEAVY_PACKAGES = ("mlflow", "flask", "sqlalchemy", "keyring", "requests", "jwt")
+
+
+def import_times(module):
+    """
+    :return: {module name: cumulative import time in us} for a fresh interpreter
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class CLIImportTestCase(unittest.TestCase):
+    def assertNotImported(self, times, packages):
+        imported = [p for p in packages if p in times]
+        self.assertEqual(imported, [], "heavy packages imported at startup")
+
+    def test_cli_import_budget(self):
+        times = import_times("mltf_gateway.scripts.cli")
+        self.assertNotImported(times, HEAVY_PACKAGES)
+        self.assertLess(times["mltf_gateway.scripts.cli"], CLI_IMPORT_BUDGET_US)
+
+    def test_client_doesnt_import_server(self):
+        # What `mltf list/show/delete` import. They need requests, but not
+        # the gateway's own dependencies or mlflow
+        times = import_times("mltf_gateway.backend_adapter")
+        self.assertNotImported(times, ("mlflow", "flask", "sqlalchemy", "keyring"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,9 @@
+import contextlib
+import io
 import os
 import tempfile
+import threading
+import time
 import unittest
 import copy
 
@@ -21,14 +25,16 @@ class TestingKeyring(keyring.backend.KeyringBackend):
     def __init__(self):
         super().__init__()
         self.vals = {}
+        self.reads = 0
 
     @properties.classproperty
     def priority(cls) -> float:
         return -1
 
     def get_password(self, service, username):
+        self.reads += 1
         if service in self.vals:
-            return self.vals.get(username, None)
+            return self.vals[service].get(username, None)
         else:
             return None
 
@@ -37,7 +43,7 @@ class TestingKeyring(keyring.backend.KeyringBackend):
             self.vals[service] = {}
         self.vals[service][username] = password
 
-    def del_password(self, service, username):
+    def delete_password(self, service, username):
         if service in self.vals:
             if username in self.vals[service]:
                 del self.vals[service][username]
@@ -61,6 +67,7 @@ class ClientAuthTestCase(unittest.TestCase):
         reload_config()
         self.old_keyring = keyring.get_keyring()
         keyring.set_keyring(TestingKeyring())
+        oauth_client.invalidate_credential_cache()
         mltf_gateway.backend_adapter.INPROCESS_GATEWAY_APP = None
         mltf_gateway.gateway_server.RUN_DATABASE = f"{self.tempDir}/gateway_run_db.pkl"
         os.environ["DATABASE_URL"] = f"sqlite:///:memory:"
@@ -82,6 +89,122 @@ class ClientAuthTestCase(unittest.TestCase):
         res = oauth_client.get_access_token()
         print(res)
 
+    def testCredentialsCached(self, m):
+        expires_at = int(time.time()) + 3600
+        keyring.set_password("mltf_gateway", "access_token", "ACCESS1")
+        keyring.set_password("mltf_gateway", "refresh_token", "REFRESH1")
+        keyring.set_password("mltf_gateway", "expires_at", str(expires_at))
+        backend = keyring.get_keyring()
+        for _ in range(5):
+            headers = oauth_client.add_auth_header_to_request({})
+            self.assertEqual(headers["Authorization"], "Bearer ACCESS1")
+        # One decrypt of each of the three entries, no matter how many calls
+        self.assertEqual(backend.reads, 3)
+
+        oauth_client.store_credentials("ACCESS2", "REFRESH2", expires_at)
+        self.assertEqual(oauth_client.get_access_token()["access_token"], "ACCESS2")
+        self.assertEqual(backend.reads, 3)
+
+        oauth_client.clear_stored_credentials()
+        self.assertIsNone(oauth_client.get_stored_credentials())
+
+    def testExpiredCachedCredentialsReread(self, m):
+        oauth_client.store_credentials("OLD", "REFRESH", int(time.time()) - 10)
+        # e.g. another process refreshed the token in the meantime
+        keyring.set_password("mltf_gateway", "access_token", "NEW")
+        keyring.set_password("mltf_gateway", "expires_at", str(int(time.time()) + 3600))
+        self.assertEqual(oauth_client.get_stored_credentials()["access_token"], "NEW")
+
+    def testRefreshAhead(self, m):
+        expires_at = int(time.time()) + 30
+        oauth_client.store_credentials("OLD", "REFRESH", expires_at)
+        oauth_client._last_background_refresh = 0.0
+        m.register_uri(
+            "POST",
+            oauth_client.TOKEN_ENDPOINT,
+            json={"access_token": "NEW", "expires_in": 3600},
+        )
+        # The still-valid token is returned right away...
+        self.assertEqual(oauth_client.get_access_token()["access_token"], "OLD")
+        oauth_client._refresh_thread.join(10)
+        # ...and the refreshed one is used from then on
+        creds = oauth_client.get_access_token()
+        self.assertEqual(creds["access_token"], "NEW")
+        self.assertEqual(creds["refresh_token"], "REFRESH")
+        self.assertEqual(keyring.get_password("mltf_gateway", "access_token"), "NEW")
+        self.assertEqual(m.call_count, 1)
+        self.assertTrue(oauth_client._refresh_thread.daemon)
+
+    def testFreshTokenNotRefreshed(self, m):
+        # A 5 minute token is outside the refresh-ahead window when issued
+        oauth_client.store_credentials("FRESH", "REFRESH", int(time.time()) + 300)
+        oauth_client._last_background_refresh = 0.0
+        oauth_client._refresh_thread = None
+        self.assertEqual(oauth_client.get_access_token()["access_token"], "FRESH")
+        self.assertIsNone(oauth_client._refresh_thread)
+        self.assertEqual(m.call_count, 0)
+
+    def testBackgroundRefreshDoesntBlockOrPrint(self, m):
+        oauth_client.store_credentials("OLD", "REFRESH", int(time.time()) + 30)
+        oauth_client._last_background_refresh = 0.0
+        m.register_uri(
+            "POST",
+            oauth_client.TOKEN_ENDPOINT,
+            json={"access_token": "NEW", "expires_in": 3600},
+        )
+        backend = keyring.get_keyring()
+        set_password = backend.set_password
+        seen = []
+
+        def slow_set_password(service, username, password):
+            # Foreground callers still get the old token during the write
+            reader = threading.Thread(
+                target=lambda: seen.append(oauth_client.get_stored_credentials())
+            )
+            reader.start()
+            reader.join(5)
+            set_password(service, username, password)
+
+        backend.set_password = slow_set_password
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            oauth_client.get_access_token()
+            oauth_client._refresh_thread.join(10)
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(seen[0]["access_token"], "OLD")
+        self.assertEqual(output.getvalue(), "")
+        self.assertEqual(oauth_client.get_access_token()["access_token"], "NEW")
+
+    def testRefreshAtExit(self, m):
+        oauth_client.store_credentials("OLD", "REFRESH", int(time.time()) + 30)
+        oauth_client._last_background_refresh = 0.0
+        sent = threading.Event()
+        release = threading.Event()
+
+        def respond(request, context):
+            sent.set()
+            release.wait(5)
+            return {"access_token": "NEW", "refresh_token": "ROTATED"}
+
+        m.register_uri("POST", oauth_client.TOKEN_ENDPOINT, json=respond)
+        self.addCleanup(setattr, oauth_client, "_exiting", False)
+        thread = oauth_client.start_background_refresh(
+            oauth_client.get_stored_credentials()
+        )
+        self.assertTrue(sent.wait(5))
+        # A refresh already sent has its answer stored on the way out...
+        threading.Timer(0.2, release.set).start()
+        oauth_client._stop_background_refresh()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(
+            keyring.get_password("mltf_gateway", "refresh_token"), "ROTATED"
+        )
+        # ...and none are started once exiting
+        oauth_client._last_background_refresh = 0.0
+        self.assertIsNone(
+            oauth_client.start_background_refresh({"refresh_token": "ROTATED"})
+        )
+
     def tearDown(self):
         os.environ = self.old_env
         reload_config()
@@ -89,6 +212,7 @@ class ClientAuthTestCase(unittest.TestCase):
         oauth_client.AUTHORIZATION_ENDPOINT = self.old_oauth_authorization
         self.tempDirObj.cleanup()
         keyring.set_keyring(self.old_keyring)
+        oauth_client.invalidate_credential_cache()
 
 
 if __name__ == '__main__':
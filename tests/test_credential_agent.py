@@ -0,0 +1,83 @@
+import os
+import stat
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import mltf_gateway.oauth_client as oauth_client
+from mltf_gateway.credential_agent import (
+    CredentialAgent,
+    get_agent_credentials,
+    query_agent,
+)
+
+
+class CredentialAgentTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDirObj = tempfile.TemporaryDirectory(dir="/tmp")
+        self.addCleanup(self.tempDirObj.cleanup)
+        self.socket_path = os.path.join(self.tempDirObj.name, "agent", "agent.sock")
+        env_patch = mock.patch.dict(os.environ, {"MLTF_AGENT_SOCK": self.socket_path})
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+        oauth_client.invalidate_credential_cache()
+        self.addCleanup(oauth_client.invalidate_credential_cache)
+        self.creds = {
+            "access_token": "ACCESS",
+            "refresh_token": "REFRESH",
+            "expires_at": int(time.time()) + 3600,
+        }
+        self.stored = []
+        store_patch = mock.patch.object(
+            oauth_client, "store_credentials", lambda *a: self.stored.append(a)
+        )
+        store_patch.start()
+        self.addCleanup(store_patch.stop)
+
+    def start_agent(self, **kwargs):
+        agent = CredentialAgent(self.socket_path, **kwargs)
+        agent.credentials = dict(self.creds)
+        agent.bind()
+        thread = threading.Thread(target=agent.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(agent.stop)
+        return agent
+
+    def test_socket_is_private(self):
+        self.start_agent()
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket_path).st_mode), 0o600)
+        socket_dir = os.path.dirname(self.socket_path)
+        self.assertEqual(stat.S_IMODE(os.stat(socket_dir).st_mode), 0o700)
+
+    def test_client_uses_agent(self):
+        self.start_agent()
+        with mock.patch.object(
+            oauth_client, "_read_stored_credentials", side_effect=AssertionError
+        ):
+            self.assertEqual(oauth_client.get_access_token()["access_token"], "ACCESS")
+
+    def test_refresh_ahead(self):
+        self.creds["expires_at"] = int(time.time()) + 60
+        agent = self.start_agent(refresh_ahead=300)
+        refreshed = {"access_token": "NEW", "expires_in": 3600}
+        with mock.patch.object(
+            oauth_client, "refresh_access_token", return_value=refreshed
+        ):
+            self.assertTrue(agent.refresh_if_needed())
+        self.assertEqual(get_agent_credentials()["access_token"], "NEW")
+        self.assertEqual(self.stored[0][:2], ("NEW", "REFRESH"))
+
+    def test_clear_and_no_agent(self):
+        self.start_agent()
+        self.assertTrue(query_agent({"op": "clear"})["ok"])
+        self.assertIsNone(get_agent_credentials())
+        self.assertIsNone(
+            get_agent_credentials(os.path.join(self.tempDirObj.name, "missing.sock"))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import argon2.low_level
+
+from mltf_gateway.vendor.keyrings.cryptfile.cryptfile import CryptFileKeyring
+from mltf_gateway.vendor.keyrings.cryptfile.file import EncryptedKeyring
+
+PASSWORD = "keyring-password"
+ENTRIES = {
+    "access_token": "ACCESS",
+    "refresh_token": "REFRESH",
+    "expires_at": "12345",
+}
+
+
+class FastCryptFileKeyring(CryptFileKeyring):
+    # Keep the real KDF, just cheaper
+    time_cost = 1
+    memory_cost = 1024
+
+
+class LegacyCryptFileKeyring(FastCryptFileKeyring):
+    """Writes files in the per-entry KDF format, like older versions did"""
+
+    def _init_file(self):
+        EncryptedKeyring._init_file(self)
+
+    def _unlock(self):
+        EncryptedKeyring._unlock(self)
+
+
+class CryptFileKDFTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDirObj.cleanup)
+        self.path = os.path.join(self.tempDirObj.name, "cryptfile_pass.cfg")
+        self.kdf_calls = 0
+        original = argon2.low_level.hash_secret_raw
+
+        def counting_hash(*args, **kwargs):
+            self.kdf_calls += 1
+            return original(*args, **kwargs)
+
+        patcher = mock.patch.object(argon2.low_level, "hash_secret_raw", counting_hash)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def new_keyring(self, cls=FastCryptFileKeyring):
+        kr = cls()
+        kr.file_path = self.path
+        kr.keyring_key = PASSWORD
+        return kr
+
+    def write_entries(self, kr):
+        for username, password in ENTRIES.items():
+            kr.set_password("mltf_gateway", username, password)
+
+    def read_entries(self, kr):
+        return {u: kr.get_password("mltf_gateway", u) for u in ENTRIES}
+
+    def test_one_kdf_per_unlock(self):
+        self.write_entries(self.new_keyring())
+        self.kdf_calls = 0
+        kr = self.new_keyring()
+        self.assertEqual(self.read_entries(kr), ENTRIES)
+        self.assertEqual(self.kdf_calls, 1)
+
+    def test_wrong_password(self):
+        self.write_entries(self.new_keyring())
+        kr = FastCryptFileKeyring()
+        kr.file_path = self.path
+        with self.assertRaises(ValueError):
+            kr.keyring_key = "not-the-password"
+
+    def test_legacy_file_migrated(self):
+        legacy = self.new_keyring(LegacyCryptFileKeyring)
+        self.write_entries(legacy)
+        self.assertIsNone(legacy._get_kdf_salt())
+
+        self.assertEqual(self.read_entries(self.new_keyring()), ENTRIES)
+        self.kdf_calls = 0
+        kr = self.new_keyring()
+        self.assertIsNotNone(kr._get_kdf_salt())
+        self.assertEqual(self.read_entries(kr), ENTRIES)
+        self.assertEqual(self.kdf_calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
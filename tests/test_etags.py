@@ -0,0 +1,121 @@
+import time
+import unittest
+from unittest import mock
+
+import mltf_gateway.backend_adapter
+from mltf_gateway.backend_adapter import CachedResponse, RESTAdapter
+from mltf_gateway.executors.base import get_script
+from tests.common_test_base import FakeSSAMGatewayTestBase
+
+
+class ETagTestCase(FakeSSAMGatewayTestBase):
+    SSAM_CONFIG = {"pending_time": 0.1, "job_duration": 0.3, "output_interval": 0.1}
+
+    def setUp(self):
+        super().setUp()
+        self.adapter = RESTAdapter(gateway_uri="LOCAL")
+        app = self.adapter.client.app
+        self.assertTrue(app.extensions["mltf_startup"].wait(timeout=10))
+        self.gateway = app.extensions["mltf_gateway"]
+        self.client = app.test_client()
+
+    def submit(self, user="USER"):
+        return self.gateway.enqueue_run(
+            "RUNID",
+            get_script("mltf-hello-world.tar.gz"),
+            "",
+            {},
+            {},
+            "https://mlflow.invalid",
+            "",
+            user,
+            "",
+        )
+
+    def get(self, url, etag=None, **params):
+        headers = dict(self.headers)
+        if etag:
+            headers["If-None-Match"] = etag
+        return self.client.get(url, headers=headers, query_string=params)
+
+    def test_job_list(self):
+        self.submit()
+        resp = self.get("/api/jobs")
+        self.assertEqual(resp.status_code, 200)
+        etag = resp.headers["ETag"]
+
+        resp = self.get("/api/jobs", etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.get_data(), b"")
+        self.assertEqual(resp.headers["ETag"], etag)
+
+        # Other users' runs don't matter
+        self.submit(user="OTHER")
+        self.assertEqual(self.get("/api/jobs", etag).status_code, 304)
+        self.assertNotEqual(
+            self.gateway.list_etag("USER"), self.gateway.list_etag("OTHER")
+        )
+
+        run = self.submit()
+        resp = self.get("/api/jobs", etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        self.assertEqual(len(resp.json), 2)
+
+        self.gateway.delete(run.gateway_id)
+        etag = resp.headers["ETag"]
+        self.assertEqual(len(self.get("/api/jobs", etag).json), 1)
+
+    def test_job_details(self):
+        gateway_id = self.submit().gateway_id
+        url = f"/api/jobs/{gateway_id}"
+        resp = self.get(url, show_logs="true")
+        self.assertEqual(resp.status_code, 200)
+        running_etag = resp.headers["ETag"]
+        while resp.json["status"] != "FINISHED":
+            time.sleep(0.1)
+            resp = self.get(url, show_logs="true")
+        etag = resp.headers["ETag"]
+        self.assertNotEqual(etag, running_etag)
+        logs = resp.json["logs"]
+
+        # Finished, so neither a 304 nor a full response needs SSAM
+        requests_before = self.ssam.state.request_count
+        resp = self.get(url, etag, show_logs="true")
+        self.assertEqual(resp.status_code, 304)
+        resp = self.get(url, show_logs="true")
+        self.assertEqual(resp.json["logs"], logs)
+        self.assertEqual(resp.headers["ETag"], etag)
+        resp = self.get(url, etag, show_logs="true", offset=len(logs))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json["logs"], "")
+        self.assertEqual(self.ssam.state.request_count, requests_before)
+
+    def test_client_revalidates(self):
+        self.patch(
+            mock.patch.object(
+                mltf_gateway.backend_adapter,
+                "add_auth_header_to_request",
+                lambda headers: dict(headers, **self.headers),
+            )
+        )
+
+        gateway_id = self.submit().gateway_id
+        self.assertEqual(len(self.adapter.list()), 1)
+        response = self.adapter.conditional_get("api/jobs", self.headers)
+        self.assertIsInstance(response, CachedResponse)
+        self.assertEqual(len(response.json()), 1)
+
+        details = self.adapter.show_details(gateway_id, False)
+        self.assertIn("status", details)
+
+        # adapter_factory() makes a new adapter each time, the cache carries over
+        other = RESTAdapter(gateway_uri="LOCAL")
+        response = other.conditional_get("api/jobs", self.headers)
+        self.assertIsInstance(response, CachedResponse)
+        self.submit()
+        self.assertEqual(len(self.adapter.list()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+from mlflow.entities import RunStatus
+
+import mltf_gateway.gateway_server
+from mltf_gateway.executors.base import get_script
+from mltf_gateway.executors.ssam_executor import SSAMExecutor
+from mltf_gateway.fake_ssam import FakeSSAMConfig, FakeSSAMServer, make_fake_token
+from mltf_gateway.gateway_server import GatewayServer
+
+
+class FakeSSAMTestCase(unittest.TestCase):
+    def setUp(self):
+        self.config = FakeSSAMConfig(pending_time=0, job_duration=0, seed=1)
+        self.tempDirObj = tempfile.TemporaryDirectory()
+        self.tempDir = self.tempDirObj.name
+        mltf_gateway.gateway_server.RUN_DATABASE = f"{self.tempDir}/gateway_run_db.pkl"
+        self.tracking_uri = f"file://{self.tempDir}/mlflow"
+        self.ssam = FakeSSAMServer(self.config).start()
+        executor = SSAMExecutor(
+            ssam_url=self.ssam.url,
+            auth_token=make_fake_token(),
+            slurm_token=make_fake_token(),
+        )
+        self.srv = GatewayServer(executor=executor, tracking_server=self.tracking_uri)
+        mlflow_patch = mock.patch("mltf_gateway.submitted_runs.ssam_run.MlflowClient")
+        self.mlflow_client = mlflow_patch.start()
+        self.addCleanup(mlflow_patch.stop)
+
+    def tearDown(self):
+        self.ssam.stop()
+        self.tempDirObj.cleanup()
+
+    def submit(self):
+        tarball = get_script("mltf-hello-world.tar.gz")
+        return self.srv.enqueue_run(
+            "RUNID", tarball, "", {}, {}, self.tracking_uri, "", "FAKE-USER", "TOKEN"
+        )
+
+    def test_submit_wait_and_logs(self):
+        run = self.submit()
+        job = self.ssam.state.get_job(run.submitted_run.job_id)
+        self.assertIn("inside.sh", job.files)
+        self.assertEqual(job.slurm_request["job_name"], "mltf-train")
+        self.assertTrue(run.wait())
+        details = self.srv.show_details(run.gateway_id, show_logs=True)
+        self.assertEqual(details["status"], "FINISHED")
+        self.assertIn("job completed", details["logs"])
+        self.mlflow_client.return_value.log_text.assert_called_once()
+
+    def test_cancel(self):
+        self.config.pending_time = 60
+        run = self.submit()
+        self.assertEqual(run.submitted_run.get_status(), RunStatus.SCHEDULED)
+        self.srv.delete(run.gateway_id)
+        self.assertEqual(run.submitted_run.get_status(), RunStatus.KILLED)
+        self.assertEqual(self.srv.list(True, "FAKE-USER"), [])
+
+    def test_bad_output_requests(self):
+        job_uuid = self.ssam.state.add_job()
+        url = f"{self.ssam.url}/api/slurm/{job_uuid}/output"
+        for offset in ("abc", "-1"):
+            resp = requests.get(
+                url,
+                params={"offset": offset},
+                headers={"Authorization": f"Bearer {make_fake_token()}"},
+                timeout=10,
+            )
+            self.assertEqual(resp.status_code, 400)
+            self.assertFalse(resp.json()["success"])
+        self.assertRaises(ValueError, FakeSSAMConfig, output_interval=0)
+
+    def test_simulated_errors(self):
+        self.config.error_rate = 1.0
+        self.assertRaises(requests.HTTPError, self.submit)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import time
+import unittest
+from unittest import mock
+
+from mltf_gateway.executors.ssam_executor import SSAMExecutor
+from mltf_gateway.fake_ssam import make_fake_token
+from mltf_gateway.gateway_server import GatewayServer
+from mltf_gateway.health import HealthProber
+from tests.common_test_base import FakeSSAMGatewayTestBase
+
+
+class HealthProberTestCase(FakeSSAMGatewayTestBase):
+    def setUp(self):
+        super().setUp()
+        executor = SSAMExecutor(
+            ssam_url=self.ssam.url,
+            auth_token=make_fake_token(lifetime=3600),
+            slurm_token=make_fake_token(lifetime=3600),
+        )
+        self.srv = GatewayServer(
+            executor=executor, tracking_server="https://mlflow.invalid"
+        )
+        self.prober = HealthProber(self.srv, interval=60, min_free_bytes=0)
+
+    def test_probe(self):
+        self.assertEqual(self.prober.is_ready(), (False, "starting"))
+        snapshot = self.prober.probe()
+        self.assertTrue(snapshot["ok"], snapshot)
+        executor = snapshot["checks"]["executor"]
+        self.assertTrue(executor["ssam"]["reachable"])
+        self.assertGreater(executor["tokens"]["auth"]["expires_in"], 3000)
+        self.assertEqual(snapshot["checks"]["queue"]["submissions_in_progress"], 0)
+        self.assertEqual(self.prober.is_ready(), (True, "ok"))
+
+        # Stale snapshots stop counting
+        snapshot["checked_at"] -= 3 * self.prober.interval + 1
+        self.assertFalse(self.prober.is_ready()[0])
+
+    def test_failing_checks(self):
+        self.ssam.stop()
+        self.prober.min_free_bytes = 2**62
+        snapshot = self.prober.probe()
+        self.assertFalse(snapshot["checks"]["executor"]["ok"])
+        self.assertFalse(snapshot["checks"]["staging"]["ok"])
+        ready, reason = self.prober.is_ready()
+        self.assertFalse(ready)
+        self.assertIn("executor", reason)
+        self.assertIn("staging", reason)
+
+    def test_expiring_token_is_unhealthy(self):
+        self.srv.executor._auth_token.token = make_fake_token(lifetime=120)
+        snapshot = self.prober.probe()
+        self.assertFalse(snapshot["checks"]["executor"]["ok"])
+
+    def test_background_probe(self):
+        self.prober.start()
+        self.addCleanup(self.prober.stop)
+        deadline = time.time() + 10
+        while self.prober.snapshot() is None and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(self.prober.is_ready()[0])
+
+
+class HealthRoutesTestCase(FakeSSAMGatewayTestBase):
+    def setUp(self):
+        from mltf_gateway.flaskapp.app import create_app
+
+        super().setUp()
+        # Only the test probes
+        self.patch(
+            mock.patch.dict(
+                os.environ,
+                {"MLTF_HEALTH_INTERVAL": "3600", "MLTF_HEALTH_MIN_FREE_BYTES": "0"},
+            )
+        )
+        self.app = create_app()
+        self.assertTrue(self.app.extensions["mltf_startup"].wait(timeout=10))
+        self.prober = self.app.extensions["mltf_health"]
+        self.addCleanup(self.prober.stop)
+        self.client = self.app.test_client()
+
+    def test_routes_serve_the_snapshot(self):
+        self.prober.stop()
+        self.prober._snapshot = None
+        self.assertEqual(self.client.get("/readyz").status_code, 503)
+        self.assertEqual(self.client.get("/healthz").status_code, 200)
+
+        self.prober.probe()
+        gateway = self.app.extensions["mltf_gateway"]
+        with mock.patch.object(gateway, "get_health") as get_health:
+            resp = self.client.get("/readyz")
+            self.assertEqual(resp.status_code, 200, resp.json)
+            resp = self.client.get("/healthz")
+            self.assertEqual(resp.json["status"], "ok")
+            self.assertTrue(resp.json["executor_status"]["ssam"]["reachable"])
+            get_health.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
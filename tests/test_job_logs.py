@@ -0,0 +1,191 @@
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import mltf_gateway.backend_adapter
+import mltf_gateway.run_log
+from mltf_gateway.backend_adapter import RESTAdapter
+from mltf_gateway.executors.base import get_script
+from mltf_gateway.executors.local_executor import LocalExecutor
+from mltf_gateway.executors.local_scheduler import LocalScheduler
+from mltf_gateway.run_log import RunLog
+from tests.common_test_base import FakeSSAMGatewayTestBase
+
+
+class StubRun:
+    def __init__(self, text):
+        self.text = text
+        self.chars_read = 0
+
+    def read_logs(self, offset, size):
+        text = self.text[offset : offset + size]
+        self.chars_read += len(text)
+        return text
+
+    def get_log_length(self):
+        return len(self.text)
+
+
+class RunLogTestCase(unittest.TestCase):
+    def test_byte_offsets(self):
+        text = "héllo wörld\n" * 50
+        encoded = text.encode("utf-8")
+        run_log = RunLog(StubRun(text), chunk_size=7)
+        self.assertEqual(run_log.size(), len(encoded))
+        self.assertEqual(b"".join(run_log.iter_bytes()), encoded)
+        for start, end in ((0, 1), (1, 2), (5, 300), (13, None), (len(encoded), None)):
+            self.assertEqual(
+                b"".join(run_log.iter_bytes(start, end)), encoded[start:end]
+            )
+
+    def test_reads_only_new_output(self):
+        run = StubRun("héllo wörld\n" * 50)
+        run_log = RunLog(run, chunk_size=7)
+        run_log.size()
+        run.chars_read = 0
+        run.text += "ünd more\n"
+        encoded = run.text.encode("utf-8")
+        self.assertEqual(run_log.size(), len(encoded))
+        self.assertEqual(run.chars_read, 9)
+
+        # Starting near the end only reads from the checkpoint before it
+        run.chars_read = 0
+        self.assertEqual(b"".join(run_log.iter_bytes(len(encoded) - 3)), b"re\n")
+        self.assertLessEqual(run.chars_read, 7 * 2)
+
+        # Output that shrank is mapped again from the start
+        run.text = "truncated\n"
+        self.assertEqual(run_log.size(), 10)
+        self.assertEqual(b"".join(run_log.iter_bytes(5)), b"ated\n")
+
+
+# Writes its output in several pieces, including bytes that aren't UTF-8
+LOCAL_OUTPUT = (
+    "import sys, time\n"
+    "for i in range(40):\n"
+    "    sys.stdout.buffer.write(b'line %02d \\xc3\\xa9\\xff\\n' % i)\n"
+    "    sys.stdout.flush()\n"
+    "    time.sleep(0.01)\n"
+)
+LOCAL_FULL = b"".join(b"line %02d \xc3\xa9\xff\n" % i for i in range(40))
+
+
+class LocalRunLogTestCase(unittest.TestCase):
+    def run_local(self, **environ):
+        tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(tempDirObj.cleanup)
+        with mock.patch.dict(os.environ, environ):
+            executor = LocalExecutor(
+                LocalScheduler(cpus=1, memory=1024), tempDirObj.name
+            )
+            run_desc = mock.Mock(run_id="RUNID", backend_config={})
+            run = executor.run_context_async(
+                {"commands": [sys.executable, "-c", LOCAL_OUTPUT]}, run_desc, "run"
+            )
+        self.addCleanup(run.cancel)
+        return run
+
+    def test_follow(self):
+        run_log = RunLog(self.run_local(), chunk_size=50)
+        followed = b"".join(run_log.iter_bytes(follow=True, interval=0.05))
+        self.assertEqual(followed, LOCAL_FULL)
+        self.assertEqual(run_log.size(), len(LOCAL_FULL))
+        self.assertEqual(b"".join(run_log.iter_bytes(20, 30)), LOCAL_FULL[20:30])
+
+    def test_rotated(self):
+        run = self.run_local(MLTF_LOCAL_LOG_MAX_BYTES="100", MLTF_LOCAL_LOG_BACKUPS="1")
+        self.assertTrue(run.wait())
+        run_log = RunLog(run, chunk_size=50)
+        start = run_log.start()
+        self.assertGreater(start, 0)
+        self.assertEqual(run_log.size(), len(LOCAL_FULL))
+        self.assertEqual(b"".join(run_log.iter_bytes()), LOCAL_FULL[start:])
+        self.assertEqual(
+            b"".join(run_log.iter_bytes(start + 5, start + 20)),
+            LOCAL_FULL[start + 5 : start + 20],
+        )
+
+
+class JobLogsTestCase(FakeSSAMGatewayTestBase):
+    SSAM_CONFIG = {"pending_time": 0.1, "job_duration": 0.5, "output_interval": 0.05}
+
+    def setUp(self):
+        super().setUp()
+        self.patch(
+            mock.patch.object(
+                mltf_gateway.backend_adapter,
+                "add_auth_header_to_request",
+                lambda headers: dict(headers, **self.headers),
+            )
+        )
+        self.patch(mock.patch.object(mltf_gateway.run_log, "LOG_FOLLOW_INTERVAL", 0.05))
+
+        self.adapter = RESTAdapter(gateway_uri="LOCAL")
+        app = self.adapter.client.app
+        self.assertTrue(app.extensions["mltf_startup"].wait(timeout=10))
+        self.gateway = app.extensions["mltf_gateway"]
+        self.client = app.test_client()
+        self.gateway_id = self.gateway.enqueue_run(
+            "RUNID",
+            get_script("mltf-hello-world.tar.gz"),
+            "",
+            {},
+            {},
+            "https://mlflow.invalid",
+            "",
+            "USER",
+            "",
+        ).gateway_id
+        self.url = f"/api/jobs/{self.gateway_id}/logs"
+
+    def get(self, **kwargs):
+        headers = dict(self.headers, **kwargs.pop("headers", {}))
+        return self.client.get(self.url, headers=headers, **kwargs)
+
+    def test_follow(self):
+        resp = self.get(query_string={"follow": "true"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, "text/plain")
+        followed = resp.get_data(as_text=True)
+        self.assertTrue(followed.endswith("job completed\n"), followed)
+        details = self.gateway.show_details(self.gateway_id, True)
+        self.assertEqual(followed, details["logs"])
+
+        # And again through the client, gzipped this time
+        resp = self.get(
+            query_string={"follow": "true"}, headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(resp.get_data()).decode(), followed)
+        streamed = b"".join(self.adapter.stream_logs(self.gateway_id, follow=True))
+        self.assertEqual(streamed.decode(), followed)
+
+    def test_ranges(self):
+        full = self.get(query_string={"follow": "true"}).get_data()
+
+        resp = self.get(headers={"Range": "bytes=5-9"})
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.get_data(), full[5:10])
+        self.assertEqual(resp.headers["Content-Range"], f"bytes 5-9/{len(full)}")
+        self.assertNotIn("Content-Encoding", resp.headers)
+
+        resp = self.get(headers={"Range": "bytes=-6"})
+        self.assertEqual(resp.get_data(), full[-6:])
+
+        resp = self.get(headers={"Range": f"bytes={len(full)}-"})
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp.headers["Content-Range"], f"bytes */{len(full)}")
+
+        resp = self.get(query_string={"offset": 10})
+        self.assertEqual(resp.get_data(), full[10:])
+        self.assertEqual(self.get(query_string={"offset": -1}).status_code, 400)
+
+        resp = self.client.get("/api/jobs/nope/logs", headers=self.headers)
+        self.assertEqual(resp.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
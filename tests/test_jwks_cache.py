@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from mltf_gateway.flaskapp.jwt_decoder import JWKSKeyCache
+
+JWKS_URL = "https://keycloak.invalid/certs"
+
+
+def make_jwk(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": kid, "alg": "RS256", "use": "sig"})
+    return private_key, jwk
+
+
+class JWKSKeyCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.private_key, jwk = make_jwk("key-1")
+        self.jwks = {"keys": [jwk]}
+        self.fetches = []
+        patcher = mock.patch(
+            "mltf_gateway.flaskapp.jwt_decoder.requests.get", self.fake_get
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_get(self, url, timeout=None):
+        self.fetches.append(url)
+        response = mock.Mock()
+        response.json.return_value = self.jwks
+        return response
+
+    def test_warmed_in_background(self):
+        cache = JWKSKeyCache(JWKS_URL, refresh_interval=3600).start()
+        self.addCleanup(cache.stop)
+        for _ in range(50):
+            if cache._keys:
+                break
+            time.sleep(0.01)
+        token = jwt.encode(
+            {"sub": "x"}, self.private_key, algorithm="RS256", headers={"kid": "key-1"}
+        )
+        key = cache.get_signing_key_from_jwt(token)
+        self.assertEqual(jwt.decode(token, key.key, algorithms=["RS256"])["sub"], "x")
+        self.assertEqual(len(self.fetches), 1)
+
+    def test_unknown_kid_refetches_once(self):
+        cache = JWKSKeyCache(JWKS_URL, min_refetch_interval=0)
+        cache.refresh()
+        _, jwk = make_jwk("key-2")
+        self.jwks = {"keys": self.jwks["keys"] + [jwk]}
+        barrier = threading.Barrier(10)
+        results = []
+
+        def lookup():
+            barrier.wait()
+            results.append(cache.get_signing_key("key-2").key_id)
+
+        # Slow the fetch down so every thread misses while it is in flight
+        original_refresh = cache.refresh
+
+        def slow_refresh():
+            time.sleep(0.2)
+            original_refresh()
+
+        cache.refresh = slow_refresh
+        threads = [threading.Thread(target=lookup) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(results, ["key-2"] * 10)
+        self.assertEqual(len(self.fetches), 2)
+
+    def test_refetch_rate_limited(self):
+        cache = JWKSKeyCache(JWKS_URL, min_refetch_interval=60)
+        cache.refresh()
+        for _ in range(3):
+            self.assertRaises(jwt.InvalidTokenError, cache.get_signing_key, "nope")
+        self.assertEqual(len(self.fetches), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import pickle
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import mltf_gateway.submitted_runs.local_output
+from mltf_gateway.executors.local_executor import LocalExecutor
+from mltf_gateway.executors.local_scheduler import LocalScheduler
+from mltf_gateway.submitted_runs.local_output import RunOutput
+
+# Writes more than a pipe buffer holds, then waits to be killed
+CHATTY = "import sys, time; sys.stdout.write('x' * 1000000); sys.stdout.flush(); time.sleep(30)"
+
+
+class RunOutputTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDirObj.cleanup)
+        self.path = os.path.join(self.tempDirObj.name, "output.log")
+
+    def test_rotation(self):
+        output = RunOutput(self.path, max_bytes=1000, backups=2)
+        full = b"".join(b"line %04d\n" % i for i in range(500))
+        read_fd, write_fd = os.pipe()
+        with mock.patch.object(
+            mltf_gateway.submitted_runs.local_output, "READ_SIZE", 100
+        ):
+            os.write(write_fd, full)
+            os.close(write_fd)
+            with os.fdopen(read_fd, "rb") as stream:
+                output.copy(stream)
+
+        data, end = output.read()
+        self.assertEqual(end, len(full))
+        self.assertGreater(output.discarded, 0)
+        self.assertLessEqual(len(data), 3000)
+        self.assertEqual(data, full[output.discarded :])
+        offset = len(full) - 1500
+        self.assertEqual(output.read(offset), (full[offset:], len(full)))
+        self.assertEqual(output.read(len(full)), (b"", len(full)))
+
+        restored = pickle.loads(pickle.dumps(output))
+        self.assertEqual(restored.read(offset), (full[offset:], len(full)))
+
+
+class LocalRunOutputTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDirObj.cleanup)
+        self.executor = LocalExecutor(
+            LocalScheduler(cpus=1, memory=1024), self.tempDirObj.name
+        )
+
+    def submit(self, *commands, gateway_id="run"):
+        run_desc = mock.Mock(run_id="RUNID", backend_config={})
+        run = self.executor.run_context_async(
+            {"commands": commands}, run_desc, gateway_id
+        )
+        self.addCleanup(run.cancel)
+        return run
+
+    def test_chatty_run_is_drained(self):
+        run = self.submit(sys.executable, "-c", CHATTY)
+        deadline = time.monotonic() + 30
+        while True:
+            start = time.monotonic()
+            details = run.get_run_details(show_logs=True)
+            # Never blocks on the process
+            self.assertLess(time.monotonic() - start, 1)
+            if details["log_offset"] == 1000000 or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+        self.assertEqual(details["status"], "RUNNING")
+        self.assertEqual(details["log_offset"], 1000000)
+
+        details = run.get_run_details(show_logs=True, log_offset=999990)
+        self.assertEqual(details["logs"], "x" * 10)
+        log_path = os.path.join(self.tempDirObj.name, "run", "output.log")
+        self.assertEqual(os.path.getsize(log_path), 1000000)
+
+    def test_finished_run(self):
+        run = self.submit("echo", "hello")
+        self.assertTrue(run.wait())
+        details = run.get_run_details(show_logs=True)
+        self.assertEqual(details["status"], "FINISHED")
+        self.assertEqual(details["logs"], "hello\n")
+        self.assertNotIn("logs", run.get_run_details(show_logs=False))
+
+
+if __name__ == "__main__":
+    unittest.main()
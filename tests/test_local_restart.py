@@ -0,0 +1,113 @@
+import os
+import pickle
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from mltf_gateway.executors.local_executor import LocalExecutor
+from mltf_gateway.executors.local_scheduler import LocalScheduler
+from mltf_gateway.submitted_runs.local_run import LocalSubmittedRun
+
+
+def restart(run):
+    """What a restarted gateway gets back from the run database"""
+    return pickle.loads(pickle.dumps(run))
+
+
+class LocalRestartTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDirObj.cleanup)
+        self.executor = LocalExecutor(
+            LocalScheduler(cpus=1, memory=1024), self.tempDirObj.name
+        )
+        patch = mock.patch.object(LocalSubmittedRun, "POLL_INTERVAL", 0.05)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def submit(self, script, gateway_id):
+        run_desc = mock.Mock(run_id="RUNID", backend_config={})
+        run = self.executor.run_context_async(
+            {"commands": ["/bin/sh", "-c", script]}, run_desc, gateway_id
+        )
+        self.addCleanup(run.cancel)
+        return run
+
+    def wait_for_output(self, run, text):
+        deadline = time.monotonic() + 10
+        while run.get_log() != text and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(run.get_log(), text)
+
+    def test_state_directory(self):
+        run = self.submit("echo hi", "done")
+        self.assertTrue(run.wait())
+        run_dir = os.path.join(self.tempDirObj.name, "done")
+        state = run.state.load()
+        self.assertEqual(state["pid"], run.command_proc.pid)
+        self.assertEqual(state["log_path"], os.path.join(run_dir, "output.log"))
+        self.assertLess(abs(state["start_time"] - time.time()), 60)
+        with open(os.path.join(run_dir, "exit_code")) as f:
+            self.assertEqual(f.read().strip(), "0")
+
+        restored = restart(run)
+        self.assertIsNone(restored.command_proc)
+        self.assertTrue(restored.wait())
+        details = restored.get_run_details(show_logs=True)
+        self.assertEqual(details["status"], "FINISHED")
+        self.assertEqual(details["pid"], state["pid"])
+        self.assertEqual(details["logs"], "hi\n")
+
+    def test_reattach_to_running(self):
+        gate = os.path.join(self.tempDirObj.name, "gate")
+        run = self.submit(
+            f"echo started; while [ ! -e {gate} ]; do sleep 0.05; done;"
+            " echo done; exit 3",
+            "running",
+        )
+        self.wait_for_output(run, "started\n")
+        restored = restart(run)
+        self.assertEqual(restored.get_status(), "RUNNING")
+        self.assertEqual(
+            restored.get_run_details(show_logs=True, log_offset=2)["logs"],
+            "arted\n",
+        )
+
+        # Output written after the restart is still captured
+        open(gate, "w").close()
+        self.assertFalse(restored.wait())
+        details = restored.get_run_details(show_logs=True)
+        self.assertEqual(details["status"], "FAILED")
+        self.assertEqual(details["failure_reason"], "Exited with code 3")
+        self.wait_for_output(restored, "started\ndone\n")
+
+    def test_cancel_after_restart(self):
+        run = self.submit("echo started; sleep 30", "cancelled")
+        self.wait_for_output(run, "started\n")
+        restored = restart(run)
+        restored.cancel()
+        self.assertFalse(restored.wait())
+        self.assertEqual(restored.get_status(), "KILLED")
+
+    def test_cleanup(self):
+        run = self.submit("echo started; sleep 30", "deleted")
+        self.wait_for_output(run, "started\n")
+        run.cancel()
+        run.cleanup()
+        self.assertFalse(os.path.exists(os.path.join(self.tempDirObj.name, "deleted")))
+        self.assertFalse(run.wait())
+
+    def test_queued_at_restart(self):
+        self.submit("sleep 30", "blocker")
+        queued = self.submit("echo never", "queued")
+        self.assertEqual(queued.get_status(), "SCHEDULED")
+        restored = restart(queued)
+        details = restored.get_run_details(show_logs=True)
+        self.assertEqual(details["status"], "FAILED")
+        self.assertIn("restarted", details["failure_reason"])
+        self.assertEqual(details["logs"], "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+import io
+import json
+import os
+import pickle
+import subprocess
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from mltf_gateway.executors.base import InvalidBackendConfig, get_script
+from mltf_gateway.executors.local_executor import LocalExecutor
+from mltf_gateway.executors.local_scheduler import (
+    FIFO,
+    LocalScheduler,
+    parse_memory,
+)
+from mltf_gateway.submitted_runs.local_run import LocalSubmittedRun
+from tests.common_test_base import FakeSSAMGatewayTestBase
+
+
+class LocalSchedulerTestCase(unittest.TestCase):
+    def submit(self, scheduler, name, *args, started=None, **backend_config):
+        run = LocalSubmittedRun(name, scheduler=scheduler)
+
+        def launch():
+            if started is not None:
+                started.append(name)
+            return subprocess.Popen(list(args or ("sleep", "30")))
+
+        scheduler.submit(run, launch, backend_config)
+        self.addCleanup(run.cancel)
+        return run
+
+    def test_cpu_slots(self):
+        scheduler = LocalScheduler(cpus=2, memory=1024)
+        quick = self.submit(scheduler, "quick", "true")
+        slow = self.submit(scheduler, "slow", **{"cpus-per-task": 1})
+        self.assertTrue(quick.wait())
+        queued = self.submit(scheduler, "queued", "true", **{"cpus-per-task": 2})
+        self.assertEqual(slow.get_status(), "RUNNING")
+        self.assertEqual(queued.get_status(), "SCHEDULED")
+        self.assertIsNone(queued.get_run_details(False)["pid"])
+        self.assertEqual(scheduler.queued(), [queued])
+        self.assertEqual(scheduler.queue_depth(), 1)
+
+        slow.cancel()
+        self.assertTrue(queued.wait())
+        self.assertEqual(queued.get_status(), "FINISHED")
+
+    def test_memory_slots(self):
+        scheduler = LocalScheduler(cpus=8, memory=parse_memory("1G"))
+        big = self.submit(scheduler, "big", mem="800")
+        small = self.submit(scheduler, "small", "true", mem="512M")
+        self.assertEqual(big.get_status(), "RUNNING")
+        self.assertEqual(small.get_status(), "SCHEDULED")
+        big.cancel()
+        self.assertTrue(small.wait())
+
+    def test_priority_then_fifo(self):
+        for policy, expected in ((None, ["high", "low"]), (FIFO, ["low", "high"])):
+            scheduler = LocalScheduler(cpus=1, memory=1024, policy=policy or "priority")
+            started = []
+            blocker = self.submit(scheduler, "blocker")
+            low = self.submit(scheduler, "low", "true", started=started)
+            high = self.submit(scheduler, "high", "true", started=started, priority=5)
+            self.assertEqual([r.run_id for r in scheduler.queued()], expected)
+            blocker.cancel()
+            self.assertTrue(low.wait())
+            self.assertTrue(high.wait())
+            self.assertEqual(started, expected)
+
+    def test_cancel_queued(self):
+        scheduler = LocalScheduler(cpus=1, memory=1024)
+        self.submit(scheduler, "blocker")
+        launch = mock.Mock()
+        queued = LocalSubmittedRun("queued", scheduler=scheduler)
+        scheduler.submit(queued, launch, {})
+        queued.cancel()
+        self.assertEqual(queued.get_status(), "KILLED")
+        self.assertFalse(queued.wait())
+        self.assertEqual(scheduler.queued(), [])
+        launch.assert_not_called()
+
+        # Queued runs can be persisted like any other
+        restored = pickle.loads(pickle.dumps(queued))
+        self.assertIsNone(restored.scheduler)
+        self.assertEqual(restored.get_status(), "KILLED")
+
+    def test_launch_failure(self):
+        scheduler = LocalScheduler(cpus=1, memory=1024)
+        run = self.submit(scheduler, "broken", "/nonexistent/command")
+        self.assertEqual(run.get_status(), "FAILED")
+        self.assertIn("FileNotFoundError", run.get_run_details(False)["failure_reason"])
+        self.assertEqual(scheduler.free_cpus, 1)
+
+    def test_launch_outside_lock(self):
+        scheduler = LocalScheduler(cpus=1, memory=1024)
+        answered = []
+
+        def launch():
+            # Other callers aren't held up while a process is being spawned
+            thread = threading.Thread(
+                target=lambda: answered.append(scheduler.queued())
+            )
+            thread.start()
+            thread.join(5)
+            return subprocess.Popen(["true"])
+
+        run = LocalSubmittedRun("run", scheduler=scheduler)
+        scheduler.submit(run, launch, {})
+        self.assertEqual(answered, [[]])
+        self.assertTrue(run.wait())
+
+    def test_cancel_while_launching(self):
+        scheduler = LocalScheduler(cpus=1, memory=1024)
+        run = LocalSubmittedRun("run", scheduler=scheduler)
+
+        def launch():
+            thread = threading.Thread(target=run.cancel)
+            thread.start()
+            thread.join(5)
+            return subprocess.Popen(["sleep", "30"])
+
+        scheduler.submit(run, launch, {})
+        self.assertFalse(run.wait())
+        self.assertNotEqual(run.command_proc.returncode, 0)
+
+    def test_invalid_backend_config(self):
+        scheduler = LocalScheduler(cpus=1, memory=1024)
+        for backend_config in (
+            {"cpus-per-task": "lots"},
+            {"cpus-per-task": 0},
+            {"mem": "8X"},
+            {"mem": -1},
+            {"priority": "high"},
+        ):
+            with self.assertRaises(InvalidBackendConfig):
+                scheduler.submit(LocalSubmittedRun("bad"), mock.Mock(), backend_config)
+        self.assertEqual(scheduler.queued(), [])
+        self.assertEqual(scheduler.free_cpus, 1)
+
+        tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(tempDirObj.cleanup)
+        executor = LocalExecutor(scheduler, tempDirObj.name)
+        run_desc = mock.Mock(run_id="RUNID", backend_config={"mem": "lots"})
+        with self.assertRaises(InvalidBackendConfig):
+            executor.run_context_async({"commands": ["true"]}, run_desc, "bad")
+        self.assertEqual(os.listdir(tempDirObj.name), [])
+
+    def test_parse_memory(self):
+        self.assertEqual(parse_memory(8192), 8192)
+        self.assertEqual(parse_memory("8192"), 8192)
+        self.assertEqual(parse_memory("8G"), 8192)
+        self.assertEqual(parse_memory("1t"), 1024 * 1024)
+        self.assertEqual(parse_memory("2048K"), 2)
+
+    def test_executor_queues_runs(self):
+        tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(tempDirObj.cleanup)
+        executor = LocalExecutor(LocalScheduler(cpus=1, memory=1024), tempDirObj.name)
+        run_desc = mock.Mock(run_id="RUNID", backend_config={"cpus-per-task": 1})
+        blocker = executor.run_context_async(
+            {"commands": ["sleep", 30]}, run_desc, "blocker"
+        )
+        runs = [
+            executor.run_context_async({"commands": ["echo", i]}, run_desc, str(i))
+            for i in range(2)
+        ]
+        self.assertEqual([r.get_status() for r in runs], ["SCHEDULED", "SCHEDULED"])
+        blocker.cancel()
+        self.assertEqual(blocker.get_status(), "KILLED")
+        for i, run in enumerate(runs):
+            self.assertTrue(run.wait())
+            self.assertEqual(run.get_log(), f"{i}\n")
+
+
+class LocalSubmitTestCase(FakeSSAMGatewayTestBase):
+    EXECUTOR = "local"
+
+    def setUp(self):
+        from mltf_gateway.flaskapp.app import create_app
+
+        super().setUp()
+        self.app = create_app()
+        self.assertTrue(self.app.extensions["mltf_startup"].wait(timeout=10))
+
+    def test_invalid_backend_config_is_rejected(self):
+        with open(get_script("mltf-hello-world.tar.gz"), "rb") as f:
+            tarball = f.read()
+        resp = self.app.test_client().post(
+            "/api/job",
+            headers=self.headers,
+            data={
+                "run_id": "RUNID",
+                "tarball": (io.BytesIO(tarball), "project.tar.gz"),
+                "entry_point": "main",
+                "params": json.dumps({}),
+                "backend_config": json.dumps({"cpus-per-task": "lots"}),
+                "tracking_uri": "https://mlflow.invalid",
+                "experiment_id": "",
+            },
+        )
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("cpus-per-task", resp.get_json()["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
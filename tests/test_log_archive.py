@@ -0,0 +1,168 @@
+import gzip
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from mltf_gateway.log_archive import LogArchive
+from mltf_gateway.submitted_runs.ssam_run import SSAMSubmittedRun
+
+SSAM_URL = "https://ssam.invalid"
+JOB_ID = "job-1234"
+
+
+class LogArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDirObj.cleanup)
+        self.directory = os.path.join(self.tempDirObj.name, "archive")
+
+    def test_round_trip(self):
+        archive = LogArchive(self.directory)
+        self.assertIsNone(archive.load("missing"))
+        text = "héllo\n" * 1000
+        archive.store("run-1", text)
+        self.assertEqual(archive.load("run-1"), text)
+        self.assertLess(os.path.getsize(archive._path("run-1")), len(text))
+        archive.remove("run-1")
+        archive.remove("run-1")
+        self.assertIsNone(archive.load("run-1"))
+
+    def test_seek(self):
+        archive = LogArchive(self.directory, block_size=7)
+        text = "".join(f"lïne {i}\n" for i in range(100))
+        archive.store("run-1", text)
+        self.assertEqual(archive.length("run-1"), len(text))
+        for offset in (0, 5, 7, 300, len(text) - 1, len(text), len(text) + 10):
+            for size in (None, 0, 1, 13):
+                end = None if size is None else offset + size
+                self.assertEqual(archive.read("run-1", offset, size), text[offset:end])
+        # Reaching an offset only decompresses from the block it's in
+        starts = []
+        decode = LogArchive._decode
+
+        def spy(f):
+            starts.append(f.tell())
+            return decode(f)
+
+        with mock.patch.object(LogArchive, "_decode", side_effect=spy):
+            self.assertEqual(archive.read("run-1", 702, 3), text[702:705])
+        with open(archive._index_path(archive._path("run-1"))) as f:
+            self.assertEqual(starts, [json.load(f)["offsets"][702 // 7]])
+
+        # Archives written before there were indexes are still readable
+        with gzip.open(archive._path("run-2"), "wb") as f:
+            f.write(text.encode("utf-8"))
+        self.assertEqual(archive.length("run-2"), len(text))
+        self.assertEqual(archive.read("run-2", 300, 13), text[300:313])
+        archive.remove("run-1")
+        self.assertEqual(
+            os.listdir(self.directory), [os.path.basename(archive._path("run-2"))]
+        )
+
+    def test_retention(self):
+        archive = LogArchive(self.directory, max_age=0, max_bytes=0)
+        for i, age in enumerate((500, 50, 10)):
+            archive.store(f"run-{i}", "output")
+            mtime = 1000 - age
+            os.utime(archive._path(f"run-{i}"), (mtime, mtime))
+        archive.max_age = 100
+        self.assertEqual(archive.prune(now=1000), 1)
+        self.assertIsNone(archive.load("run-0"))
+
+        # Keep only about one entry's worth of bytes, newest wins
+        archive.max_bytes = os.path.getsize(archive._path("run-2"))
+        archive.max_age = 0
+        self.assertEqual(archive.prune(now=1000), 1)
+        self.assertIsNone(archive.load("run-1"))
+        self.assertEqual(archive.load("run-2"), "output")
+
+
+class SSAMRunArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDirObj.cleanup)
+        self.archive = LogArchive(self.tempDirObj.name)
+        self.status_url = f"{SSAM_URL}/api/slurm/{JOB_ID}"
+        self.output_url = f"{SSAM_URL}/api/slurm/{JOB_ID}/output"
+
+    def new_run(self):
+        return SSAMSubmittedRun(
+            "mlflow-run",
+            [JOB_ID],
+            SSAM_URL,
+            "TOKEN",
+            "user",
+            gateway_id="gateway-1",
+            log_archive=self.archive,
+        )
+
+    def test_terminated_output_served_from_archive(self):
+        run = self.new_run()
+        with requests_mock.Mocker() as m:
+            m.get(
+                self.status_url,
+                json={"success": True, "data": {"job_state": "RUNNING"}},
+            )
+            m.get(self.output_url, json={"success": True, "data": {"out": "partial\n"}})
+            run.get_run_details(show_logs=True)
+            # Still running, nothing archived yet
+            self.assertIsNone(self.archive.load("gateway-1"))
+
+            m.get(
+                self.status_url,
+                json={"success": True, "data": {"job_state": "COMPLETED"}},
+            )
+            m.get(
+                self.output_url,
+                json={"success": True, "data": {"out": "partial\ndone\n"}},
+            )
+            run.get_status()
+            self.assertEqual(run.get_logs(), "partial\ndone\n")
+        self.assertEqual(self.archive.load("gateway-1"), "partial\ndone\n")
+        # Once archived the output isn't kept in memory, reads seek in the archive
+        self.assertIsNone(run._log_cache)
+        self.assertEqual(run.read_logs(8, 4), "done")
+        self.assertEqual(run.get_log_length(), 13)
+
+        # A restarted gateway has no log cache, but doesn't need SSAM either
+        restored = pickle.loads(pickle.dumps(run))
+        with requests_mock.Mocker() as m:
+            m.get(
+                self.status_url,
+                json={"success": True, "data": {"job_state": "COMPLETED"}},
+            )
+            details = restored.final_run_details(show_logs=True, log_offset=8)
+            self.assertEqual(
+                details, {"status": "FINISHED", "logs": "done\n", "log_offset": 13}
+            )
+            self.assertEqual(restored.read_logs(0, 7), "partial")
+            with mock.patch(
+                "mltf_gateway.submitted_runs.ssam_run.MlflowClient"
+            ) as client:
+                self.assertTrue(restored.wait())
+            self.assertEqual(
+                [r.path for r in m.request_history], [f"/api/slurm/{JOB_ID}"]
+            )
+        client.return_value.log_text.assert_called_once_with(
+            "mlflow-run", "partial\ndone\n", f"ssam-{JOB_ID}.txt"
+        )
+
+    def test_old_pickles_have_no_archive(self):
+        run = self.new_run()
+        state = run.__getstate__()
+        del state["gateway_id"], state["log_archive"]
+        restored = SSAMSubmittedRun.__new__(SSAMSubmittedRun)
+        restored.__setstate__(state)
+        self.assertIsNone(restored.log_archive)
+        with requests_mock.Mocker() as m:
+            m.get(self.output_url, json={"success": True, "data": {"out": "x"}})
+            self.assertEqual(restored.get_logs(), "x")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import mltf_gateway.flaskapp.utils as flask_utils
+from mltf_gateway import metrics
+from mltf_gateway.executors.base import get_script
+from tests.common_test_base import FakeSSAMGatewayTestBase
+
+
+def parse_samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+class MetricsRegistryTestCase(unittest.TestCase):
+    def test_render(self):
+        registry = metrics.Registry()
+        counter = registry.counter("requests_total", "Requests", ["route"])
+        histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+        counter.inc(route='/a"b')
+        counter.inc(2, route='/a"b')
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+
+        text = registry.render()
+        self.assertIn("# TYPE requests_total counter", text)
+        samples = parse_samples(text)
+        self.assertEqual(samples['requests_total{route="/a\\"b"}'], 3)
+        self.assertEqual(samples['latency_seconds_bucket{le="0.1"}'], 1)
+        self.assertEqual(samples['latency_seconds_bucket{le="1"}'], 2)
+        self.assertEqual(samples['latency_seconds_bucket{le="+Inf"}'], 3)
+        self.assertEqual(samples["latency_seconds_count"], 3)
+        self.assertAlmostEqual(samples["latency_seconds_sum"], 5.55)
+
+        samples = parse_samples(registry.render([("pid", 42)]))
+        self.assertEqual(samples['requests_total{route="/a\\"b",pid="42"}'], 3)
+        self.assertEqual(samples['latency_seconds_bucket{pid="42",le="1"}'], 2)
+        self.assertEqual(samples['latency_seconds_count{pid="42"}'], 3)
+
+        with self.assertRaises(ValueError):
+            counter.inc(path="/a")
+        with self.assertRaises(ValueError):
+            registry.counter("requests_total", "Again")
+
+    def test_ssam_call_errors(self):
+        before = metrics.ssam_request_errors.get(endpoint="test")
+        with self.assertRaises(RuntimeError):
+            with metrics.track_ssam_call("test"):
+                raise RuntimeError("SSAM is down")
+        with metrics.track_ssam_call("test"):
+            pass
+        self.assertEqual(metrics.ssam_request_errors.get(endpoint="test"), before + 1)
+        self.assertEqual(metrics.ssam_request_duration.get_count(endpoint="test"), 2)
+
+    def test_collect_server_metrics(self):
+        with tempfile.TemporaryDirectory() as staging_dir:
+            gateway_server = mock.Mock(staging_dir=staging_dir)
+            gateway_server.count_runs_by_state.return_value = {"RUNNING": 2}
+            gateway_server.get_staging_usage.return_value = (0, 0)
+            gateway_server.executor.scheduler.queue_depth.return_value = 3
+            stats = {"hits": 5, "misses": 1, "hit_rate": 0.8333, "size": 1}
+            metrics.collect_server_metrics(gateway_server, {"test": stats})
+        samples = parse_samples(metrics.REGISTRY.render())
+        self.assertEqual(samples["mltf_local_queue_depth"], 3)
+        self.assertEqual(samples['mltf_runs{state="RUNNING"}'], 2)
+        self.assertEqual(samples['mltf_cache_hits_total{cache="test"}'], 5)
+        self.assertEqual(samples['mltf_cache_misses_total{cache="test"}'], 1)
+        self.assertIn("# TYPE mltf_cache_hits_total counter", metrics.REGISTRY.render())
+
+
+class MetricsEndpointTestCase(FakeSSAMGatewayTestBase):
+    SSAM_CONFIG = {"pending_time": 60}
+
+    def setUp(self):
+        from mltf_gateway.flaskapp.app import create_app
+
+        super().setUp()
+        self.client = create_app().test_client()
+
+    def scrape(self):
+        """
+        :return: Samples from /metrics, minus the pid label every sample has
+        """
+        resp = self.client.get("/metrics")
+        self.assertTrue(resp.content_type.startswith("text/plain; version=0.0.4"))
+        pid = f'pid="{os.getpid()}"'
+        samples = {}
+        for name, value in parse_samples(resp.get_data(as_text=True)).items():
+            self.assertIn(pid, name)
+            name = name.replace(f"{{{pid}}}", "").replace(f"{{{pid},", "{")
+            samples[name.replace(f",{pid}", "")] = value
+        return samples
+
+    def test_submit_shows_up_in_metrics(self):
+        route = 'route="/api/job"'
+        before = self.scrape()
+        with open(get_script("mltf-hello-world.tar.gz"), "rb") as f:
+            tarball = f.read()
+        resp = self.client.post(
+            "/api/job",
+            headers=self.headers,
+            data={
+                "run_id": "RUNID",
+                "tarball": (io.BytesIO(tarball), "project.tar.gz"),
+                "entry_point": "main",
+                "params": json.dumps({}),
+                "backend_config": json.dumps({}),
+                "tracking_uri": "https://mlflow.invalid",
+                "experiment_id": "",
+            },
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        samples = self.scrape()
+
+        def delta(name):
+            return samples.get(name, 0) - before.get(name, 0)
+
+        self.assertEqual(
+            delta(f'mltf_http_requests_total{{{route},method="POST",status="200"}}'), 1
+        )
+        self.assertEqual(samples[f"mltf_http_requests_in_flight{{{route}}}"], 0)
+        self.assertEqual(delta("mltf_upload_bytes_total"), len(tarball))
+        self.assertEqual(
+            delta('mltf_ssam_request_duration_seconds_count{endpoint="submit"}'), 1
+        )
+        self.assertEqual(
+            delta('mltf_submit_stage_duration_seconds_count{stage="executor"}'), 1
+        )
+        self.assertEqual(samples['mltf_runs{state="SCHEDULED"}'], 1)
+        self.assertGreaterEqual(samples["mltf_staging_bytes"], len(tarball))
+        self.assertIn('mltf_cache_hit_ratio{cache="verified_tokens"}', samples)
+        hits = 'mltf_cache_hits_total{cache="verified_tokens"}'
+        self.assertGreaterEqual(delta(hits), 0)
+        # Counters, so clearing the cache doesn't make them go down
+        flask_utils._verified_token_cache.clear()
+        self.assertGreaterEqual(self.scrape()[hits], samples[hits])
+        self.assertEqual(samples["mltf_submissions_in_progress"], 0)
+        self.assertEqual(samples["mltf_process_info"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
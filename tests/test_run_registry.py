@@ -0,0 +1,134 @@
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import mltf_gateway.gateway_server
+from mltf_gateway.executors.base import ExecutorBase, get_script
+from mltf_gateway.gateway_server import GatewayServer, unpersist_runs
+from mltf_gateway.run_registry import RunRegistry
+
+
+class StubSubmittedRun:
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.cancelled = 0
+        self.cleaned_up = 0
+
+    def cancel(self):
+        self.cancelled += 1
+
+    def cleanup(self):
+        self.cleaned_up += 1
+
+    def get_status(self):
+        return "RUNNING"
+
+
+class StubExecutor(ExecutorBase):
+    def run_context_async(self, ctx, run_desc, gateway_id):
+        return StubSubmittedRun(run_desc.run_id)
+
+
+class FakeRun:
+    def __init__(self, gateway_id):
+        self.gateway_id = gateway_id
+
+
+class RunRegistryTestCase(unittest.TestCase):
+    def test_snapshots_are_immutable(self):
+        registry = RunRegistry([FakeRun("a")])
+        before = registry.snapshot()
+        registry.add(FakeRun("b"))
+        self.assertEqual([r.gateway_id for r in before], ["a"])
+        self.assertEqual([r.gateway_id for r in registry], ["a", "b"])
+        self.assertEqual(registry.get("b").gateway_id, "b")
+        registry.remove("a")
+        self.assertIsNone(registry.get("a"))
+        self.assertEqual(len(registry), 1)
+
+
+class GatewayServerConcurrencyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDirObj.cleanup)
+        db_patch = mock.patch.object(
+            mltf_gateway.gateway_server,
+            "RUN_DATABASE",
+            f"{self.tempDirObj.name}/gateway_run_db.pkl",
+        )
+        db_patch.start()
+        self.addCleanup(db_patch.stop)
+        self.srv = GatewayServer(
+            executor=StubExecutor(), tracking_server="https://mlflow.invalid"
+        )
+        self.tarball = get_script("mltf-hello-world.tar.gz")
+
+    def submit(self, user):
+        return self.srv.enqueue_run(
+            "RUNID", self.tarball, "", {}, {}, "https://mlflow.invalid", "", user, ""
+        )
+
+    def test_concurrent_submit_and_delete(self):
+        threads = 8
+        per_thread = 25
+        kept = [[] for _ in range(threads)]
+        errors = []
+        start = threading.Barrier(threads)
+
+        def hammer(idx):
+            try:
+                start.wait()
+                for i in range(per_thread):
+                    run = self.submit(f"user-{idx}")
+                    if i % 2:
+                        self.assertEqual(
+                            self.srv.delete(run.gateway_id)["run_id"], run.gateway_id
+                        )
+                    else:
+                        kept[idx].append(run.gateway_id)
+                    # Readers run alongside the writers
+                    self.srv.list(True, f"user-{idx}")
+            except Exception as e:
+                errors.append(e)
+
+        workers = [threading.Thread(target=hammer, args=(i,)) for i in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(60)
+        self.assertEqual(errors, [])
+
+        expected = {gid for ids in kept for gid in ids}
+        self.assertEqual({r.gateway_id for r in self.srv.runs}, expected)
+        self.assertEqual({r.gateway_id for r in unpersist_runs()}, expected)
+        for idx in range(threads):
+            listed = {r["gateway_id"] for r in self.srv.list(True, f"user-{idx}")}
+            self.assertEqual(listed, set(kept[idx]))
+
+    def test_concurrent_deletes_cancel_once(self):
+        run = self.submit("user")
+        results = []
+        workers = [
+            threading.Thread(
+                target=lambda: results.append(self.srv.delete(run.gateway_id))
+            )
+            for _ in range(8)
+        ]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(10)
+        self.assertEqual(run.submitted_run.cancelled, 1)
+        self.assertEqual(run.submitted_run.cleaned_up, 1)
+        self.assertEqual(sum(1 for r in results if isinstance(r, dict)), 1)
+        self.assertEqual(self.srv.registry._run_locks, {})
+
+    def test_deleting_unknown_runs_keeps_no_locks(self):
+        for i in range(10):
+            self.assertEqual(self.srv.delete(f"missing-{i}")[1], 404)
+        self.assertEqual(self.srv.registry._run_locks, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import mltf_gateway.gateway_server
+from mltf_gateway.executors.base import get_script
+from mltf_gateway.executors.ssam_executor import SSAMExecutor
+from mltf_gateway.fake_ssam import FakeSSAMConfig, FakeSSAMServer, make_fake_token
+from mltf_gateway.flaskapp.production import GatewayApplication
+from mltf_gateway.gateway_server import GatewayServer, unpersist_runs
+
+
+def submit_from_worker(run_database, ssam_url, staging_dir, count):
+    # Stands in for a separate gunicorn worker
+    mltf_gateway.gateway_server.RUN_DATABASE = run_database
+    os.environ["MLTF_STAGING_DIR"] = staging_dir
+    srv = make_server(ssam_url)
+    for _ in range(count):
+        submit(srv)
+
+
+def make_server(ssam_url):
+    executor = SSAMExecutor(
+        ssam_url=ssam_url, auth_token=make_fake_token(), slurm_token=make_fake_token()
+    )
+    return GatewayServer(executor=executor, tracking_server="https://mlflow.invalid")
+
+
+def submit(srv):
+    tarball = get_script("mltf-hello-world.tar.gz")
+    return srv.enqueue_run(
+        "RUNID", tarball, "", {}, {}, "https://mlflow.invalid", "", "USER", "TOKEN"
+    )
+
+
+class SharedRunStateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDirObj.cleanup)
+        self.tempDir = self.tempDirObj.name
+        self.run_database = f"{self.tempDir}/gateway_run_db.pkl"
+        self.staging_dir = f"{self.tempDir}/staging"
+        db_patch = mock.patch.object(
+            mltf_gateway.gateway_server, "RUN_DATABASE", self.run_database
+        )
+        db_patch.start()
+        self.addCleanup(db_patch.stop)
+        env_patch = mock.patch.dict(os.environ, {"MLTF_STAGING_DIR": self.staging_dir})
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+        self.ssam = FakeSSAMServer(FakeSSAMConfig(pending_time=60)).start()
+        self.addCleanup(self.ssam.stop)
+
+    def test_servers_see_each_others_runs(self):
+        first = make_server(self.ssam.url)
+        second = make_server(self.ssam.url)
+        run = submit(first)
+        listed = [r["gateway_id"] for r in second.list(True, "USER")]
+        self.assertEqual(listed, [run.gateway_id])
+        # The submitting server keeps its own (live) object for the run
+        submit(second)
+        self.assertIs(first.runid_to_reference(run.gateway_id), run)
+        self.assertEqual(len(first.list(True, "USER")), 2)
+
+        # Conditional requests can be answered by either worker
+        self.assertEqual(first.list_etag("USER"), second.list_etag("USER"))
+        details = {"status": "SCHEDULED"}
+        self.assertEqual(
+            first.details_etag(run.gateway_id, details, False),
+            second.details_etag(run.gateway_id, details, False),
+        )
+
+        # Log requests can land on a worker that didn't submit the run
+        run_log = second.get_run_log(run.gateway_id)
+        self.assertIsNotNone(run_log)
+        self.assertIs(second.get_run_log(run.gateway_id), run_log)
+
+        second.delete(run.gateway_id)
+        self.assertEqual(len(first.list(True, "USER")), 1)
+        self.assertIsNone(first.get_run_log(run.gateway_id))
+        self.assertTrue(os.listdir(self.staging_dir))
+
+    def test_concurrent_workers_lose_no_runs(self):
+        ctx = multiprocessing.get_context("fork")
+        workers = [
+            ctx.Process(
+                target=submit_from_worker,
+                args=(self.run_database, self.ssam.url, self.staging_dir, 5),
+            )
+            for _ in range(4)
+        ]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(60)
+            self.assertEqual(w.exitcode, 0)
+        self.assertEqual(len(unpersist_runs()), 20)
+
+    def test_production_options(self):
+        app = GatewayApplication({"workers": 3, "threads": 4, "graceful_timeout": 7})
+        self.assertEqual(app.cfg.workers, 3)
+        self.assertEqual(app.cfg.threads, 4)
+        self.assertEqual(app.cfg.graceful_timeout, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import pickle
+import threading
+import unittest
+from unittest import mock
+
+import requests
+import requests_mock
+from mlflow.entities import RunStatus
+
+from mltf_gateway.submitted_runs.ssam_run import SSAMSubmittedRun
+
+SSAM_URL = "https://ssam.invalid"
+JOB_ID = "job-1234"
+
+
+def status_payload(state):
+    return {"success": True, "data": {"job_state": state}}
+
+
+def output_payload(text, offset=None):
+    ret = {"success": True, "data": {f"slurm-{JOB_ID}.out": text}}
+    if offset is not None:
+        ret["offset"] = offset
+    return ret
+
+
+class SSAMRunLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.run = SSAMSubmittedRun("mlflow-run", [JOB_ID], SSAM_URL, "TOKEN", "user")
+        self.output_url = f"{SSAM_URL}/api/slurm/{JOB_ID}/output"
+        self.status_url = f"{SSAM_URL}/api/slurm/{JOB_ID}"
+
+    def test_full_output_is_diffed_against_cache(self):
+        with requests_mock.Mocker() as m:
+            m.get(self.status_url, json=status_payload("RUNNING"))
+            m.get(self.output_url, json=output_payload("line1\n"))
+            details = self.run.get_run_details(show_logs=True)
+            self.assertEqual(details["logs"], "line1\n")
+            self.assertEqual(details["log_offset"], 6)
+
+            # SSAM ignores the offset and returns everything again
+            m.get(self.output_url, json=output_payload("line1\nline2\n"))
+            details = self.run.get_run_details(show_logs=True, log_offset=6)
+            self.assertEqual(details["logs"], "line2\n")
+            self.assertEqual(details["log_offset"], 12)
+            self.assertEqual(m.last_request.qs["offset"], ["6"])
+            self.assertEqual(self.run.get_logs(), "line1\nline2\n")
+
+    def test_offset_honored_by_ssam(self):
+        with requests_mock.Mocker() as m:
+            m.get(self.output_url, json=output_payload("abc"))
+            self.assertEqual(self.run.get_logs(), "abc")
+            m.get(self.output_url, json=output_payload("def", offset=3))
+            self.assertEqual(self.run.get_logs(), "abcdef")
+            self.assertEqual(self.run.get_logs(4), "ef")
+
+    def test_terminated_output_is_fetched_once(self):
+        with requests_mock.Mocker() as m:
+            m.get(self.status_url, json=status_payload("COMPLETED"))
+            m.get(self.output_url, json=output_payload("done\n"))
+            self.run.get_run_details(show_logs=True)
+            self.run.get_run_details(show_logs=True)
+            output_calls = [r for r in m.request_history if r.path.endswith("/output")]
+            self.assertEqual(len(output_calls), 1)
+            self.assertEqual(self.run.get_status(), RunStatus.FINISHED)
+
+    def test_log_cache_not_pickled(self):
+        with requests_mock.Mocker() as m:
+            m.get(self.output_url, json=output_payload("x" * 100))
+            self.run.get_logs()
+        restored = pickle.loads(pickle.dumps(self.run))
+        self.assertIsNone(restored._log_cache)
+        self.assertEqual(restored.get_log_length(), 0)
+
+
+class SSAMRunWaitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.status_url = f"{SSAM_URL}/api/slurm/{JOB_ID}"
+        self.output_url = f"{SSAM_URL}/api/slurm/{JOB_ID}/output"
+        self.sleeps = []
+        sleep_patch = mock.patch(
+            "mltf_gateway.submitted_runs.ssam_run.time.sleep", self.sleeps.append
+        )
+        mlflow_patch = mock.patch("mltf_gateway.submitted_runs.ssam_run.MlflowClient")
+        sleep_patch.start()
+        self.mlflow_client = mlflow_patch.start()
+        self.addCleanup(sleep_patch.stop)
+        self.addCleanup(mlflow_patch.stop)
+
+    def new_run(self):
+        return SSAMSubmittedRun("mlflow-run", [JOB_ID], SSAM_URL, "TOKEN", "user")
+
+    def test_backoff_resets_on_transition(self):
+        states = ["PENDING"] * 4 + ["RUNNING"] * 3 + ["COMPLETED"]
+        responses = [{"json": status_payload(x)} for x in states]
+        with requests_mock.Mocker() as m:
+            m.get(self.status_url, responses)
+            m.get(self.output_url, json=output_payload("done"))
+            self.assertTrue(self.new_run().wait())
+        base = SSAMSubmittedRun.POLL_STATUS_INTERVAL
+        self.assertEqual(
+            self.sleeps, [base, base * 2, base * 4, base * 8, base, 10, 20]
+        )
+        self.mlflow_client.return_value.log_text.assert_called_once()
+
+    def test_wait_through_ssam_errors(self):
+        responses = [
+            {"json": status_payload("RUNNING")},
+            {"exc": requests.exceptions.ConnectionError},
+            {"status_code": 503, "text": "Service Unavailable"},
+            {"json": status_payload("COMPLETED")},
+        ]
+        with requests_mock.Mocker() as m:
+            m.get(self.status_url, responses)
+            m.get(self.output_url, json=output_payload("done"))
+            # SSAM failing for a while doesn't end the wait as if the job were gone
+            self.assertTrue(self.new_run().wait())
+        base = SSAMSubmittedRun.POLL_STATUS_INTERVAL
+        self.assertEqual(self.sleeps, [base, base * 2, base * 4])
+
+    def test_wait_for_unknown_job(self):
+        with requests_mock.Mocker() as m:
+            m.get(
+                self.status_url,
+                status_code=404,
+                json={"success": False, "message": "Unknown job"},
+            )
+            m.get(self.output_url, status_code=404)
+            run = self.new_run()
+            self.assertFalse(run.wait())
+        self.assertIsNone(run.last_known_status)
+        self.assertEqual(self.sleeps, [])
+
+    def test_waiters_share_one_poll_loop(self):
+        followers_waiting = threading.Event()
+        polls = []
+
+        def status_callback(request, context):
+            polls.append(request)
+            if followers_waiting.is_set():
+                return status_payload("COMPLETED")
+            return status_payload("RUNNING")
+
+        def fake_sleep(_):
+            # Hold the leader until every other waiter has queued up behind it
+            followers_waiting.wait(10)
+
+        waiters = [self.new_run() for _ in range(10)]
+        results = []
+        with requests_mock.Mocker() as m, mock.patch(
+            "mltf_gateway.submitted_runs.ssam_run.time.sleep", fake_sleep
+        ):
+            m.get(self.status_url, json=status_callback)
+            m.get(self.output_url, json=output_payload("done"))
+            threads = [
+                threading.Thread(target=lambda r=r: results.append(r.wait()))
+                for r in waiters
+            ]
+            for t in threads:
+                t.start()
+            # Event.wait rather than time.sleep, which is patched
+            threading.Event().wait(0.5)
+            followers_waiting.set()
+            for t in threads:
+                t.join(10)
+
+        self.assertEqual(results, [True] * 10)
+        self.assertEqual(len(polls), 2)
+        self.mlflow_client.return_value.log_text.assert_called_once()
+        for r in waiters:
+            self.assertEqual(r._status, RunStatus.FINISHED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from mltf_gateway.gateway_server import GatewayServer
+from mltf_gateway.startup import Startup
+from tests.common_test_base import FakeSSAMGatewayTestBase
+
+
+class StartupTestCase(unittest.TestCase):
+    def test_components_start_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+        fired = []
+        startup = Startup()
+        startup.add("a", barrier.wait)
+        startup.add("b", barrier.wait)
+        startup.on_ready(lambda: fired.append(startup.is_ready()))
+        self.assertEqual(startup.is_ready(), (False, "starting: a, b"))
+
+        # Neither can finish unless both run at once
+        self.assertTrue(startup.start().wait(timeout=10))
+        self.assertEqual(fired, [(True, "ok")])
+        self.assertEqual(startup.status()["a"]["state"], "ready")
+
+    def test_failing_component_is_retried(self):
+        attempts = []
+
+        def flaky():
+            attempts.append(time.monotonic())
+            if len(attempts) < 3:
+                raise ConnectionError("keycloak is down")
+
+        startup = Startup(retry_interval=0.01)
+        startup.add("flaky", flaky)
+        startup.add("optional", mock.Mock(side_effect=RuntimeError), required=False)
+        self.addCleanup(startup.stop)
+        self.assertTrue(startup.start().wait(timeout=10))
+        status = startup.status()
+        self.assertEqual(status["flaky"]["attempts"], 3)
+        self.assertNotIn("error", status["flaky"])
+        self.assertEqual(status["optional"]["state"], "failed")
+        self.assertIn("RuntimeError", status["optional"]["error"])
+        self.assertEqual(startup.is_ready(), (True, "ok"))
+
+    def test_wait_times_out(self):
+        release = threading.Event()
+        startup = Startup().add("slow", release.wait).start()
+        self.assertFalse(startup.wait(timeout=0.05))
+        release.set()
+        self.assertTrue(startup.wait(timeout=10))
+
+
+class AppStartupTestCase(FakeSSAMGatewayTestBase):
+    def setUp(self):
+        from mltf_gateway.flaskapp.app import create_app
+
+        super().setUp()
+        self.patch(mock.patch.dict(os.environ, {"MLTF_STARTUP_TIMEOUT": "0"}))
+        # Executor startup blocks until the test lets it go, like a slow
+        # keycloak login would
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        init_executor = GatewayServer.init_executor
+
+        def slow_init_executor(gateway):
+            self.release.wait()
+            init_executor(gateway)
+
+        self.patch(
+            mock.patch.object(GatewayServer, "init_executor", slow_init_executor)
+        )
+
+        start = time.monotonic()
+        self.app = create_app()
+        self.create_seconds = time.monotonic() - start
+        self.startup = self.app.extensions["mltf_startup"]
+        self.addCleanup(self.app.extensions["mltf_health"].stop)
+        self.client = self.app.test_client()
+
+    def test_serves_while_starting(self):
+        self.assertLess(self.create_seconds, 5)
+        self.assertEqual(self.client.get("/healthz").status_code, 200)
+        resp = self.client.get("/readyz")
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.json["components"]["executor"]["state"], "pending")
+        self.assertIn("executor", resp.json["reason"])
+
+        resp = self.client.get("/api/jobs", headers=self.headers)
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.headers["Retry-After"], "5")
+
+        self.release.set()
+        self.assertTrue(self.startup.wait(timeout=10))
+        resp = self.client.get("/api/jobs", headers=self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json, [])
+        self.assertEqual(self.startup.status()["run_store"]["state"], "ready")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import time
+import unittest
+from unittest import mock
+
+from werkzeug.exceptions import Unauthorized
+
+import mltf_gateway.flaskapp.utils as flask_utils
+from mltf_gateway.flaskapp.cache import TTLLRUCache
+
+
+class TTLLRUCacheTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TTLLRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expiry(self):
+        cache = TTLLRUCache()
+        cache.set("a", 1, expires_at=time.time() - 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_periodic_sweep(self):
+        cache = TTLLRUCache(sweep_interval=0)
+        for i in range(10):
+            cache.set(i, i, expires_at=time.time() - 1)
+        # Every write past the sweep interval drops what has expired
+        cache.set("live", 1)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats()["expirations"], 10)
+        cache.set("stale", 1, expires_at=time.time() - 1)
+        self.assertEqual(cache.sweep(), 1)
+
+    def test_clear_keeps_counts(self):
+        cache = TTLLRUCache()
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"]), (0, 1, 2))
+
+    def test_hit_rate(self):
+        cache = TTLLRUCache()
+        self.assertIsNone(cache.stats()["hit_rate"])
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        self.assertEqual(cache.stats()["hit_rate"], 0.5)
+
+
+class UserinfoCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        flask_utils._userinfo_cache.clear()
+        self.addCleanup(flask_utils._userinfo_cache.clear)
+
+    def test_userinfo_cached_by_digest(self):
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {"email": "user@example.com"}
+        with mock.patch.object(
+            flask_utils.requests, "get", return_value=response
+        ) as get:
+            for _ in range(3):
+                self.assertEqual(
+                    flask_utils.get_userinfo("TOKEN"), {"email": "user@example.com"}
+                )
+        get.assert_called_once()
+        self.assertNotIn("TOKEN", flask_utils._userinfo_cache._data)
+
+    def test_userinfo_cache_is_bounded(self):
+        cache = flask_utils._userinfo_cache
+        for i in range(cache.maxsize + 10):
+            cache.set(f"token-{i}", {})
+        self.assertEqual(len(cache), cache.maxsize)
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        flask_utils._verified_token_cache.clear()
+        self.addCleanup(flask_utils._verified_token_cache.clear)
+        self.claims = {"email": "user@example.com", "exp": int(time.time()) + 3600}
+        patcher = mock.patch.object(flask_utils, "decode", return_value=self.claims)
+        self.decode = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_verified_claims_are_cached(self):
+        before = flask_utils.get_cache_stats()["verified_tokens"]
+        for _ in range(5):
+            self.assertEqual(flask_utils.decode_cached("TOKEN"), self.claims)
+        self.decode.assert_called_once_with("TOKEN")
+        stats = flask_utils.get_cache_stats()["verified_tokens"]
+        self.assertEqual(
+            (stats["hits"] - before["hits"], stats["misses"] - before["misses"]),
+            (4, 1),
+        )
+        # The raw token is never used as a key
+        self.assertNotIn("TOKEN", flask_utils._verified_token_cache._data)
+
+    def test_nearly_expired_token_not_cached(self):
+        self.claims["exp"] = int(time.time()) + 5
+        flask_utils.decode_cached("TOKEN")
+        flask_utils.decode_cached("TOKEN")
+        self.assertEqual(self.decode.call_count, 2)
+
+    def test_failures_not_cached(self):
+        self.decode.side_effect = Unauthorized()
+        for _ in range(2):
+            self.assertRaises(Unauthorized, flask_utils.decode_cached, "BAD")
+        self.assertEqual(self.decode.call_count, 2)
+        self.assertEqual(len(flask_utils._verified_token_cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import mltf_gateway.backend_adapter
+from mltf_gateway import tracing
+from mltf_gateway.project_packer import package_project
+from tests.common_test_base import FakeSSAMGatewayTestBase
+
+
+def read_spans(path):
+    spans = []
+    with open(path) as f:
+        for line in f:
+            for resource_spans in json.loads(line)["resourceSpans"]:
+                for scope_spans in resource_spans["scopeSpans"]:
+                    spans.extend(scope_spans["spans"])
+    return spans
+
+
+class TracingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDirObj = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDirObj.cleanup)
+        self.trace_file = f"{self.tempDirObj.name}/spans.jsonl"
+        tracing.configure(self.trace_file)
+        # Back to reading MLTF_TRACE_FILE afterwards
+        self.addCleanup(setattr, tracing, "_exporter_configured", False)
+
+    def test_traceparent(self):
+        with tracing.span("outer") as outer:
+            headers = tracing.inject({})
+        parent = tracing.parse_traceparent(headers["traceparent"])
+        self.assertEqual(parent.trace_id, outer.trace_id)
+        self.assertEqual(parent.span_id, outer.span_id)
+        self.assertEqual(tracing.inject({}), {})
+        for bad in (None, "", "garbage", "00-" + "0" * 32 + "-" + "1" * 16 + "-01"):
+            self.assertIsNone(tracing.parse_traceparent(bad))
+
+    def test_nesting_and_export(self):
+        with self.assertRaises(ValueError):
+            with tracing.span("outer", user="someone") as outer:
+                with tracing.span("inner") as inner:
+                    pass
+                raise ValueError("boom")
+        self.assertIsNone(tracing.current_span())
+        self.assertEqual(inner.trace_id, outer.trace_id)
+        self.assertEqual(inner.parent_span_id, outer.span_id)
+
+        spans = {s["name"]: s for s in read_spans(self.trace_file)}
+        self.assertEqual(spans["inner"]["parentSpanId"], outer.span_id)
+        self.assertNotIn("parentSpanId", spans["outer"])
+        self.assertEqual(spans["outer"]["status"]["code"], tracing.STATUS_ERROR)
+        self.assertEqual(
+            spans["outer"]["attributes"],
+            [{"key": "user", "value": {"stringValue": "someone"}}],
+        )
+        self.assertLessEqual(
+            int(spans["outer"]["startTimeUnixNano"]),
+            int(spans["inner"]["startTimeUnixNano"]),
+        )
+
+
+class SubmitTracingTestCase(FakeSSAMGatewayTestBase):
+    SSAM_CONFIG = {"pending_time": 60}
+
+    def setUp(self):
+        super().setUp()
+        self.trace_file = f"{self.tempDir}/spans.jsonl"
+        self.patch(mock.patch.dict(os.environ, {"MLTF_TRACE_FILE": self.trace_file}))
+        tracing.configure()
+        self.addCleanup(setattr, tracing, "_exporter_configured", False)
+
+        self.project = f"{self.tempDir}/project"
+        os.makedirs(self.project)
+        with open(f"{self.project}/MLproject", "w") as f:
+            f.write("name: traced\n")
+
+    def test_one_trace_across_client_and_gateway(self):
+        adapter = mltf_gateway.backend_adapter.RESTAdapter(gateway_uri="LOCAL")
+        with tracing.span("submit") as root:
+            tarball = package_project(self.project)
+            try:
+                adapter.enqueue_run(
+                    "RUNID", tarball, "main", {}, {}, "https://mlflow.invalid", ""
+                )
+            finally:
+                os.remove(tarball)
+
+        spans = {s["name"]: s for s in read_spans(self.trace_file)}
+        for name in (
+            "prepare_tarball",
+            "produce_tarball",
+            "upload",
+            "POST /api/job",
+            "receive_upload",
+            "save_upload",
+            "get_execution_snippet",
+            "run_context_async",
+            "_setup_slurm_token",
+            "generate_ssam_template",
+            "ssam_submit",
+        ):
+            self.assertIn(name, spans)
+            self.assertEqual(spans[name]["traceId"], root.trace_id, name)
+
+        # The gateway's span is a child of the client's upload span
+        self.assertEqual(
+            spans["POST /api/job"]["parentSpanId"], spans["upload"]["spanId"]
+        )
+        self.assertEqual(
+            spans["ssam_submit"]["parentSpanId"], spans["run_context_async"]["spanId"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()